@@ -1,9 +1,56 @@
-from datetime import datetime
+from datetime import date
+from operator import itemgetter
+
+from rollups import week_of
+from streaks import StreakState, period_of, scan_all_streak_states, scan_streak_state
+
+
+def _fetch_streak_states(db, habit_name=None):
+    """
+    Reads the materialized streak summaries, rescanning habits that have none stored yet.
+
+    Args:
+        db: The database connection.
+        habit_name: (Optional) Restricts the result to the habit with this name.
+
+    Returns:
+        dict: The periodicity and StreakState per habit name.
+    """
+    cursor = db.cursor()
+    query = '''
+        SELECT habits.id, habits.name, habits.periodicity, habit_streaks.current_streak, habit_streaks.longest_streak,
+               habit_streaks.last_period
+        FROM habits
+        LEFT JOIN habit_streaks ON habit_streaks.habit_id = habits.id
+    '''
+    if habit_name is None:
+        rows = cursor.execute(query).fetchall()
+    else:
+        rows = cursor.execute(query + ' WHERE habits.name = ?', (habit_name,)).fetchall()
+
+    states = {}
+    missing = {}
+    for habit_id, name, periodicity, *state in rows:
+        if state[1] is None:  # Logged outside of HabitTracker, e.g. by an import
+            missing[habit_id] = name, periodicity
+        else:
+            states[name] = periodicity, StreakState(*state)
+    if len(missing) == 1:
+        habit_id, (name, periodicity) = missing.popitem()
+        states[name] = periodicity, scan_streak_state(cursor, habit_id)
+    elif missing:
+        scanned = scan_all_streak_states(cursor)
+        states.update((name, (periodicity, scanned[habit_id])) for habit_id, (name, periodicity) in missing.items())
+    return states
+
 
 def compute_longest_streak(db, habit_name):
     """
     Calculates the longest consecutive streak of completions for a specific habit.
 
+    Streaks are counted in the habit's own periods: consecutive days for daily habits and
+    consecutive ISO weeks for weekly habits.
+
     Args:
         db: The database connection.
         habit_name: The name of the habit.
@@ -11,39 +58,57 @@ def compute_longest_streak(db, habit_name):
     Returns:
         int: The length of the longest streak.
     """
+    _, state = _fetch_streak_states(db, habit_name).get(habit_name, (None, None))
+    return state.longest_streak if state else 0
 
-    cursor = db.cursor()
-    cursor.execute('''
-        SELECT tracked_at 
-        FROM progress_log
-        INNER JOIN habits ON progress_log.habit_id = habits.id
-        WHERE habits.name = ?
-        ORDER BY tracked_at ASC
-    ''', (habit_name,))
-    completion_dates = cursor.fetchall()
-
-    if not completion_dates:
+
+def compute_current_streak(db, habit_name, today=None):
+    """
+    Calculates the length of the streak a habit is currently on.
+
+    A streak is still running if the habit was completed in the current or the previous period
+    (today or yesterday for daily habits, this or last ISO week for weekly habits).
+
+    Args:
+        db: The database connection.
+        habit_name: The name of the habit.
+        today: (Optional) The date to evaluate the streak at. Defaults to the current date.
+
+    Returns:
+        int: The length of the running streak, or 0 if it has been broken.
+    """
+    periodicity, state = _fetch_streak_states(db, habit_name).get(habit_name, (None, None))
+    return running_streak(state, periodicity, today) if state else 0
+
+
+def running_streak(state, periodicity, today=None):
+    """
+    Determines how much of a streak summary is still running at a given date.
+
+    Args:
+        state: The habit's StreakState.
+        periodicity: The periodicity of the habit (e.g., 'Daily', 'Weekly').
+        today: (Optional) The date to evaluate the streak at. Defaults to the current date.
+
+    Returns:
+        int: state.current_streak if the habit was completed in the current or previous period, otherwise 0.
+    """
+    if state.last_period is None or state.last_period < period_of(today or date.today(), periodicity) - 1:
         return 0
+    return state.current_streak
 
-    # Ensure the dates are sorted chronologically
-    dates = sorted([datetime.strptime(date[0], "%Y-%m-%d %H:%M:%S") for date in completion_dates])
 
-    max_streak = 1
-    current_streak = 1
-    prev_date = dates[0]  # Initialize prev_date
+def compute_longest_streaks(db):
+    """
+    Calculates the longest streak of every habit.
 
-    for date in dates[1:]:  # Iterate from the second date
-        # Calculate the difference in days, considering potential time differences
-        diff = (date - prev_date).days
-        if diff == 1:
-            current_streak += 1
-        elif diff > 1:  # Reset streak if the gap is more than one day
-            max_streak = max(max_streak, current_streak)
-            current_streak = 1
-        # For gaps of 0 days (multiple entries on the same day), continue the streak
-        prev_date = date  # Update prev_date for the next iteration
+    Args:
+        db: The database connection.
 
-    return max(max_streak, current_streak)
+    Returns:
+        dict: The longest streak per habit name. Habits without any completions map to 0.
+    """
+    return {name: state.longest_streak for name, (_, state) in _fetch_streak_states(db).items()}
 
 
 def compute_longest_streak_overall(db):
@@ -56,4 +121,136 @@ def compute_longest_streak_overall(db):
     Returns:
         int: The length of the longest streak among all habits.
     """
-    # ... (Your existing code for compute_longest_streak_overall) ...
+    return compute_longest_streak_leader(db)[1]
+
+
+def longest_streak_leader(streaks):
+    """
+    Picks the habit with the longest streak.
+
+    Args:
+        streaks: The longest streak per habit name, e.g. from compute_longest_streaks.
+
+    Returns:
+        tuple: The habit name and its longest streak. Ties go to the habit listed first; (None, 0) if no
+        habit has any streak.
+    """
+    name, streak = max(streaks.items(), key=itemgetter(1), default=(None, 0))
+    return (name, streak) if streak else (None, 0)
+
+
+def compute_longest_streak_leader(db):
+    """
+    Determines which habit has the longest streak in the database.
+
+    Args:
+        db: The database connection.
+
+    Returns:
+        tuple: The habit name and its longest streak, or (None, 0) if no habit has any streak.
+    """
+    return longest_streak_leader(compute_longest_streaks(db))
+
+
+def _rollup_filter(column, habit_name, first, last):
+    """Builds the WHERE clause and parameters shared by the rollup aggregates."""
+    conditions, parameters = [], []
+    if habit_name is not None:
+        conditions.append('habit_id = (SELECT id FROM habits WHERE name = ?)')
+        parameters.append(habit_name)
+    if first is not None:
+        conditions.append(f'{column} >= ?')
+        parameters.append(first)
+    if last is not None:
+        conditions.append(f'{column} <= ?')
+        parameters.append(last)
+    return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+
+def completion_counts(db, unit='month', habit_name=None, since=None, until=None):
+    """
+    Counts completions per day, ISO week or calendar month, read from the rollup tables (the daily
+    totals over all habits unless habit_name is given).
+
+    Args:
+        db: The database connection.
+        unit: (Optional) 'day', 'week' or 'month'.
+        habit_name: (Optional) Restricts the counts to this habit. Defaults to all habits.
+        since: (Optional) The first date to count.
+        until: (Optional) The date to stop counting at (exclusive). Weeks that contain since or
+               the day before until are counted in full.
+
+    Returns:
+        dict: The number of completions per period with any, keyed by the date the period starts on
+        (the day itself, the Monday of the week or the first of the month), in ascending order.
+    """
+    first = since.toordinal() if since is not None else None
+    last = until.toordinal() - 1 if until is not None else None
+    cursor = db.cursor()
+    daily = 'daily_totals' if habit_name is None else 'daily_rollups'
+    # The totals are kept per day only; there are few enough days to sum into weeks when asked
+    weekly = '(SELECT (day_ordinal - 1) / 7 AS week, completions FROM daily_totals)' if habit_name is None \
+        else 'weekly_rollups'
+    if unit == 'week':
+        condition, parameters = _rollup_filter(
+            'week', habit_name, week_of(first) if first is not None else None, week_of(last) if last is not None else None
+        )
+        cursor.execute(
+            f'SELECT week, SUM(completions) FROM {weekly} {condition} GROUP BY week ORDER BY week', parameters
+        )
+        return {date.fromordinal(week * 7 + 1): count for week, count in cursor.fetchall()}
+
+    condition, parameters = _rollup_filter('day_ordinal', habit_name, first, last)
+    if unit == 'day':
+        cursor.execute(
+            f'SELECT day_ordinal, SUM(completions) FROM {daily} {condition} '
+            f'GROUP BY day_ordinal ORDER BY day_ordinal',
+            parameters,
+        )
+        return {date.fromordinal(day): count for day, count in cursor.fetchall()}
+    if unit == 'month':
+        # Julian day numbers are offset from date ordinals by a constant, so SQLite can name the month
+        cursor.execute(
+            f'SELECT substr(date(day_ordinal + 1721424.5), 1, 7) AS month, SUM(completions) '
+            f'FROM {daily} {condition} GROUP BY month ORDER BY month',
+            parameters,
+        )
+        return {date(int(month[:4]), int(month[5:]), 1): count for month, count in cursor.fetchall()}
+    raise ValueError("unit must be 'day', 'week' or 'month'.")
+
+
+def weekday_completion_rates(db, habit_name, since=None, until=None):
+    """
+    Calculates on which share of each weekday a habit was completed, read from the daily rollups.
+
+    Args:
+        db: The database connection.
+        habit_name: The name of the habit.
+        since: (Optional) The first date to consider. Defaults to the habit's first completion.
+        until: (Optional) The date to stop at (exclusive). Defaults to the day after its last completion.
+
+    Returns:
+        list: Seven rates (0.0 to 1.0), from Monday to Sunday. All zero if the range is empty.
+    """
+    cursor = db.cursor()
+    cursor.execute(
+        'SELECT MIN(day_ordinal), MAX(day_ordinal) FROM daily_rollups '
+        'WHERE habit_id = (SELECT id FROM habits WHERE name = ?)',
+        (habit_name,),
+    )
+    history_first, history_last = cursor.fetchone()
+    first = since.toordinal() if since is not None else history_first
+    last = until.toordinal() - 1 if until is not None else history_last
+    if first is None or last is None or last < first:
+        return [0.0] * 7
+
+    condition, parameters = _rollup_filter('day_ordinal', habit_name, first, last)
+    cursor.execute(f'SELECT (day_ordinal - 1) % 7, COUNT(*) FROM daily_rollups {condition} GROUP BY 1', parameters)
+    completed = dict(cursor.fetchall())
+    rates = []
+    for weekday in range(7):
+        # The number of days in [first, last] that fall on this weekday (ordinal 1 is a Monday)
+        offset = (weekday - (first - 1)) % 7
+        days = (last - first - offset) // 7 + 1 if first + offset <= last else 0
+        rates.append(completed.get(weekday, 0) / days if days else 0.0)
+    return rates
@@ -0,0 +1,183 @@
+"""
+Vectorized analytics over complete habit histories.
+
+NumPy is optional: when it is installed, histories are loaded into datetime64[D] arrays and
+streaks, completion rates and weekday histograms are computed with array operations. Without
+it, the same functions fall back to pure Python and return identical results.
+"""
+from array import array
+from datetime import date
+from itertools import chain, groupby
+from operator import itemgetter
+
+from storage import progress_columns
+from streaks import EMPTY_STREAK, PERIOD_DAYS, StreakState, summarize_periods
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to pure Python
+    np = None
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # datetime64[D] counts days from 1970-01-01
+
+
+def load_history(db, habit_name=None):
+    """
+    Loads the distinct completion days of one or all habits in a single query.
+
+    Args:
+        db: The database connection.
+        habit_name: (Optional) Restricts the result to the habit with this name.
+
+    Returns:
+        dict: A (periodicity, days) pair per habit name, where days is an ascending
+        datetime64[D] array, or an array('I') of date ordinals when NumPy is unavailable.
+    """
+    cursor = db.cursor()
+    if habit_name is None:
+        cursor.execute('SELECT id, name, periodicity FROM habits')
+        condition, parameters = '', ()
+    else:
+        cursor.execute('SELECT id, name, periodicity FROM habits WHERE name = ?', (habit_name,))
+        condition, parameters = 'WHERE progress_log.habit_id = (SELECT id FROM habits WHERE name = ?)', (habit_name,)
+    habits = {habit_id: (name, periodicity) for habit_id, name, periodicity in cursor.fetchall()}
+
+    columns = progress_columns(cursor)
+    cursor.execute(f'''
+        SELECT progress_log.habit_id, {columns.day_ordinal}
+        FROM progress_log
+        {condition}
+        ORDER BY progress_log.habit_id, {columns.order}
+    ''', parameters)
+    if np is None:
+        days = {habit_id: array('I', dict.fromkeys(map(itemgetter(1), rows)))
+                for habit_id, rows in groupby(cursor, key=itemgetter(0))}
+        empty = array('I')
+    else:
+        days = _split_days(np.fromiter(chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2))
+        empty = np.array([], dtype='datetime64[D]')
+
+    return {name: (periodicity, days.get(habit_id, empty)) for habit_id, (name, periodicity) in habits.items()}
+
+
+def _split_days(rows):
+    """Splits (habit_id, day ordinal) rows sorted by habit into distinct datetime64[D] arrays per habit."""
+    habit_ids, ordinals = rows[:, 0], rows[:, 1]
+    starts = np.flatnonzero(np.diff(habit_ids)) + 1
+    days = {}
+    for habit_id, chunk in zip(habit_ids[np.r_[0, starts]] if rows.size else (), np.split(ordinals, starts)):
+        distinct = chunk[np.r_[True, np.diff(chunk) != 0]]  # Already sorted, so repeats are adjacent
+        days[int(habit_id)] = (distinct - EPOCH_ORDINAL).astype('datetime64[D]')
+    return days
+
+
+def _ordinals(days):
+    """Returns the date ordinals of a days array as int64 (NumPy) or the array itself (fallback)."""
+    return days.astype(np.int64) + EPOCH_ORDINAL if np is not None else days
+
+
+def streak_summary(days, periodicity):
+    """
+    Computes the current run, the longest run and the last period of a habit's completions.
+
+    Args:
+        days: The habit's completion days, as returned by load_history.
+        periodicity: The periodicity of the habit (e.g., 'Daily', 'Weekly').
+
+    Returns:
+        StreakState: The same summary that streaks.summarize_periods produces.
+    """
+    length = PERIOD_DAYS.get(periodicity, 1)
+    if np is None:
+        return summarize_periods(dict.fromkeys((ordinal - 1) // length for ordinal in days))
+    if not days.size:
+        return EMPTY_STREAK
+
+    periods = (_ordinals(days) - 1) // length
+    periods = periods[np.r_[True, np.diff(periods) != 0]]
+    breaks = np.flatnonzero(np.diff(periods) != 1) + 1
+    runs = np.diff(np.r_[0, breaks, periods.size])
+    return StreakState(int(runs[-1]), int(runs.max()), int(periods[-1]))
+
+
+def streak_summaries(history):
+    """
+    Computes the streak summary of every habit in a loaded history.
+
+    Args:
+        history: The result of load_history.
+
+    Returns:
+        dict: The StreakState per habit name.
+    """
+    return {name: streak_summary(days, periodicity) for name, (periodicity, days) in history.items()}
+
+
+def completion_rates(days, unit='week'):
+    """
+    Computes the share of days with a completion in every week or month of a habit's history.
+
+    Periods between the first and the last completion without any completion are included with a rate of 0.
+
+    Args:
+        days: The habit's completion days, as returned by load_history.
+        unit: 'week' (ISO weeks, starting on Monday) or 'month'.
+
+    Returns:
+        dict: The completion rate (0.0 to 1.0) per period, keyed by the date the period starts on.
+    """
+    if unit not in ('week', 'month'):
+        raise ValueError("unit must be 'week' or 'month'.")
+    if len(days) == 0:
+        return {}
+
+    if np is not None:
+        if unit == 'week':
+            weeks = (_ordinals(days) - 1) // 7
+            counts = np.bincount(weeks - weeks[0])
+            starts = (np.arange(weeks[0], weeks[-1] + 1) * 7 + 1 - EPOCH_ORDINAL).astype('datetime64[D]')
+            lengths = np.full(counts.size, 7)
+        else:
+            months = days.astype('datetime64[M]')
+            counts = np.bincount((months - months[0]).astype(np.int64))
+            month_range = np.arange(months[0], months[-1] + 1)
+            starts = month_range.astype('datetime64[D]')
+            lengths = ((month_range + 1).astype('datetime64[D]') - starts).astype(np.int64)
+        return dict(zip(starts.tolist(), (counts / lengths).tolist()))
+
+    counts = {}
+    for ordinal in days:
+        day = date.fromordinal(ordinal)
+        start = ordinal - day.weekday() if unit == 'week' else day.replace(day=1).toordinal()
+        counts[start] = counts.get(start, 0) + 1
+    rates = {}
+    start, last = min(counts), max(counts)
+    while start <= last:
+        if unit == 'week':
+            following = start + 7
+        else:
+            first = date.fromordinal(start)
+            following = (first.replace(year=first.year + 1, month=1) if first.month == 12
+                         else first.replace(month=first.month + 1)).toordinal()
+        rates[date.fromordinal(start)] = counts.get(start, 0) / (following - start)
+        start = following
+    return rates
+
+
+def weekday_histogram(days):
+    """
+    Counts on how many days a habit was completed per day of the week.
+
+    Args:
+        days: The habit's completion days, as returned by load_history.
+
+    Returns:
+        list: Seven counts, from Monday to Sunday.
+    """
+    if np is not None:
+        return np.bincount((_ordinals(days) - 1) % 7, minlength=7).tolist()
+
+    histogram = [0] * 7
+    for ordinal in days:
+        histogram[(ordinal - 1) % 7] += 1
+    return histogram
@@ -0,0 +1,120 @@
+"""
+Streak statistics for large databases, computed by a pool of worker processes.
+
+The habits are split into contiguous id ranges. Each worker opens its own read-only connection
+(a file:...?mode=ro URI), folds the completions of its ranges into streak summaries and sends
+them back, so the CPU-bound part of the scan runs in parallel outside the parent's GIL.
+"""
+import os
+import sqlite3
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from analyse import running_streak
+from db import DATABASE_PATH
+from streaks import scan_all_streak_states
+
+StreakStatistics = namedtuple('StreakStatistics', ['periodicity', 'current_streak', 'longest_streak', 'last_period'])
+StreakStatistics.__doc__ = """The streak figures of one habit, as returned by compute_streak_statistics.
+
+Attributes:
+    periodicity (str): The periodicity of the habit.
+    current_streak (int): The streak still running at the reporting date, or 0 if it was broken.
+    longest_streak (int): The length of the longest streak ever completed.
+    last_period (int): The most recent period with a completion (see streaks.period_of), or None.
+"""
+
+
+def read_only_uri(path):
+    """Returns the URI that opens a database file read-only."""
+    return f"{Path(path).resolve().as_uri()}?mode=ro"
+
+
+_worker_connection = None  # The read-only connection of a worker process, opened by _open_worker
+
+
+def _open_worker(path):
+    """Worker initializer: opens the process's read-only connection, reused for all of its ranges."""
+    global _worker_connection
+    _worker_connection = sqlite3.connect(read_only_uri(path), uri=True)
+
+
+def _scan_range(id_range):
+    """Worker: computes the StreakState of every habit with an id in the (first, last) range."""
+    return scan_all_streak_states(_worker_connection.cursor(), id_range=id_range)
+
+
+def partition(habit_ids, parts):
+    """
+    Splits ascending habit ids into at most parts contiguous (first, last) ranges of similar size.
+
+    Args:
+        habit_ids: The habit ids, in ascending order.
+        parts: The number of ranges to aim for.
+
+    Returns:
+        list: The (first, last) id pairs.
+    """
+    parts = max(1, min(parts, len(habit_ids)))
+    bounds = [len(habit_ids) * i // parts for i in range(parts + 1)]
+    return [(habit_ids[start], habit_ids[end - 1]) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def compute_streak_statistics(path=DATABASE_PATH, workers=None, chunks_per_worker=4, today=None):
+    """
+    Computes the streak statistics of every habit in a database file using several processes.
+
+    Args:
+        path: (Optional) The location of the SQLite database file. Must be a file, not ':memory:'.
+        workers: (Optional) The number of worker processes. Defaults to the number of CPUs. With 1,
+                 the scan runs in the calling process.
+        chunks_per_worker: (Optional) How many id ranges to create per worker, so that a worker
+                 that finishes early can pick up more work.
+        today: (Optional) The date current streaks are evaluated at. Defaults to the current date.
+
+    Returns:
+        dict: The StreakStatistics per habit name.
+    """
+    if path == ':memory:':
+        raise ValueError("compute_streak_statistics needs a database file the workers can open.")
+    workers = workers or os.cpu_count() or 1
+    states = {}
+    connection = sqlite3.connect(read_only_uri(path), uri=True)
+    try:
+        habits = connection.execute('SELECT id, name, periodicity FROM habits ORDER BY id').fetchall()
+        ranges = partition([habit_id for habit_id, _, _ in habits], workers * chunks_per_worker)
+        if workers == 1:
+            for id_range in ranges:
+                states.update(scan_all_streak_states(connection.cursor(), id_range=id_range))
+    finally:
+        connection.close()
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker, initargs=(path,)) as executor:
+            for partial in executor.map(_scan_range, ranges):
+                states.update(partial)
+
+    today = today or date.today()
+    return {
+        name: StreakStatistics(periodicity, running_streak(states[habit_id], periodicity, today),
+                               states[habit_id].longest_streak, states[habit_id].last_period)
+        for habit_id, name, periodicity in habits
+        if habit_id in states  # Habits deleted while the workers were scanning are left out
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prints the habits with the longest streaks, computed in parallel.")
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    statistics = compute_streak_statistics(args.database, args.workers)
+    ranked = sorted(statistics.items(), key=lambda item: item[1].longest_streak, reverse=True)
+    for name, stats in ranked[:args.top]:
+        print(f"{name:<30} {stats.periodicity:<7} longest {stats.longest_streak:>6}   current {stats.current_streak:>6}")
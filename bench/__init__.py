@@ -0,0 +1,7 @@
+"""Standalone performance benchmarks. Run them from the project root, e.g. ``python -m bench.ingest``."""
+import os
+import tempfile
+
+# Anything falling back to the default database writes to a throwaway file, never to the project's habits.db
+_DEFAULT_DIRECTORY = tempfile.TemporaryDirectory(prefix='habits-bench-')
+os.environ.setdefault('HABITS_DB', os.path.join(_DEFAULT_DIRECTORY.name, 'habits.db'))
@@ -0,0 +1,89 @@
+"""Compares repeated-analysis workloads with and without the QueryCache, at several write rates."""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from analyse import compute_current_streak, compute_longest_streak, compute_longest_streaks
+from bench.common import measure, seed_history, temporary_database
+from cache import QueryCache
+from db import fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker
+
+
+class Uncached:
+    """The same interface as QueryCache, computing every answer afresh."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def longest_streak(self, habit_name):
+        return compute_longest_streak(self.db, habit_name)
+
+    def current_streak(self, habit_name, today=None):
+        return compute_current_streak(self.db, habit_name, today)
+
+    def longest_streaks(self):
+        return compute_longest_streaks(self.db)
+
+    def habits_by_periodicity(self, periodicity):
+        return fetch_habits_by_periodicity(self.db, periodicity)
+
+
+def workload(db, queries, names, operations, write_every, hot, seed):
+    """
+    Runs a mix of analysis queries, logging a completion every write_every operations.
+
+    Queries go to a hot set of habits most of the time, like a user returning to the same few
+    habits in the menu. Returns the answers, so cached and uncached runs can be compared.
+    """
+    rng = random.Random(seed)
+    hot_names = names[:hot]
+    trackers = {}
+    moment = datetime(2030, 1, 1)
+    answers = []
+    for operation in range(operations):
+        name = rng.choice(hot_names) if rng.random() < 0.9 else rng.choice(names)
+        if write_every and operation % write_every == write_every - 1:
+            tracker = trackers.get(name) or trackers.setdefault(name, get_habit_tracker(db, name))
+            moment += timedelta(hours=1)
+            tracker.log_progress(db, moment)
+            continue
+        kind = rng.random()
+        if kind < 0.5:
+            answers.append(queries.longest_streak(name))
+        elif kind < 0.8:
+            answers.append(queries.current_streak(name))
+        elif kind < 0.95:
+            answers.append(queries.habits_by_periodicity(rng.choice(("Daily", "Weekly"))))
+        else:
+            answers.append(queries.longest_streaks())
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--operations', type=int, default=20_000)
+    parser.add_argument('--hot', type=int, default=20, help='habits receiving 90%% of the queries')
+    parser.add_argument('--max-entries', type=int, default=1024)
+    args = parser.parse_args()
+
+    for write_every in (0, 100, 10):
+        runs = []
+        for make_queries in (Uncached, lambda db: QueryCache(db, args.max_entries)):
+            with temporary_database() as db:  # Identically seeded, so both runs see the same data
+                seed_history(db, args.habits, args.days, periodicities=("Daily", "Weekly"))
+                queries = make_queries(db)
+                runs.append(measure(workload, db, queries, fetch_all_habit_names(db), args.operations, write_every,
+                                    args.hot, 1))
+        (expected, uncached), (answers, cached) = runs
+        assert answers == expected
+        stats = queries.stats()
+        queries.close()
+        writes = f"1 write per {write_every} operations" if write_every else "read only"
+        print(f"{writes:<30} uncached {uncached:>7.3f} s   cached {cached:>7.3f} s   {uncached / cached:>6.1f}x   "
+              f"hit rate {stats['hit_rate']:.1%}   evictions {stats['evictions']}")
+
+
+if __name__ == "__main__":
+    main()
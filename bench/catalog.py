@@ -0,0 +1,45 @@
+"""Compares per-action SQL lookups in the menu against the in-memory HabitCatalog."""
+import argparse
+import random
+
+from bench.common import measure, seed_history, temporary_database
+from catalog import HabitCatalog
+from db import fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker
+
+
+def sql_actions(db, names, periodicity):
+    """What one menu action used to cost: list all habits, then fetch the chosen one."""
+    for name in names:
+        fetch_all_habit_names(db)
+        get_habit_tracker(db, name)
+        fetch_habits_by_periodicity(db, periodicity)
+
+
+def catalog_actions(catalog, names, periodicity):
+    for name in names:
+        catalog.names()
+        catalog.get(name)
+        catalog.names_by_periodicity(periodicity)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--actions', type=int, default=500)
+    args = parser.parse_args()
+
+    for habits in (100, 1_000, 10_000):
+        with temporary_database() as db:
+            seed_history(db, habits, 1, periodicities=("Daily", "Weekly"))
+            names = random.Random(0).choices(fetch_all_habit_names(db), k=args.actions)
+
+            _, sql_seconds = measure(sql_actions, db, names, "Weekly")
+            catalog, load_seconds = measure(HabitCatalog, db)
+            _, catalog_seconds = measure(catalog_actions, catalog, names, "Weekly")
+            print(f"{habits:>6} habits: SQL {sql_seconds / args.actions * 1e3:8.3f} ms/action, "
+                  f"catalog {catalog_seconds / args.actions * 1e3:8.3f} ms/action "
+                  f"(loaded in {load_seconds * 1e3:.1f} ms, {catalog.hits} hits / {catalog.misses} misses)")
+            catalog.close()
+
+
+if __name__ == "__main__":
+    main()
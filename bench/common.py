@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from db import initialize_database
+from preload_db import generate_dataset
+
+
+@contextmanager
+def temporary_database():
+    """
+    Yields a freshly initialized database stored in a temporary file.
+
+    A real file (rather than ':memory:') is used so that commits pay the same fsync cost as in production.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db = initialize_database(os.path.join(directory, 'bench.db'))
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+def seed_history(db, habits, days, probability=0.9, seed=0, start=datetime(2021, 1, 1, 8), periodicities=("Daily",)):
+    """
+    Fills the database with habits named "Habit 1", "Habit 2", ... and a randomized completion history.
+
+    All completions happen at the start time of their day, because the legacy implementations
+    these benchmarks compare against count whole days between timestamps.
+
+    Args:
+        db: The database connection object.
+        habits: The number of habits to create.
+        days: The length of each habit's history in days.
+        probability: The chance that a habit is completed on any given day.
+        seed: The random seed, so that runs are reproducible.
+        start: The datetime of the first possible completion.
+        periodicities: The periodicities assigned to the habits in turn.
+
+    Returns:
+        int: The number of completions logged.
+    """
+    return generate_dataset(db, habits, days, probability, seed, start, periodicities, spread=0)
+
+
+def measure(func, *args, **kwargs):
+    """
+    Runs a function once and reports how long it took.
+
+    Returns:
+        tuple: The function's return value and the elapsed wall-clock time in seconds.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(label, rows, seconds):
+    """Prints a single benchmark line in rows per second."""
+    rate = rows / seconds if seconds else float('inf')
+    print(f"{label:<40} {rows:>10} rows {seconds:>9.3f} s {rate:>14,.0f} rows/s")
@@ -0,0 +1,102 @@
+"""Measures progress logging and analytics throughput with mixed reader and writer threads."""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from analyse import compute_longest_streaks
+from analyse_numpy import load_history
+from bench.common import seed_history
+from counter import HabitTracker
+from db import ConnectionManager, initialize_database
+
+
+class SharedConnection:
+    """The previous setup: one connection in the default rollback journal mode, shared by every thread."""
+
+    def __init__(self, path):
+        self.connection = initialize_database(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = DELETE')
+        self.connection.execute('PRAGMA synchronous = FULL')
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def writer(self):
+        with self.lock:
+            yield self.connection
+
+    reader = writer
+
+    def close(self):
+        self.connection.close()
+
+
+def run(manager, writers, readers, seconds):
+    """Runs writer and reader threads against a manager for a fixed time and counts their operations."""
+    with manager.writer() as db:
+        tracker_ids = [row[0] for row in db.execute('SELECT id FROM habits ORDER BY id LIMIT ?', (writers,))]
+    counts = {'writes': 0, 'reads': 0}
+    counts_lock = threading.Lock()
+    stop = threading.Event()
+
+    def write(habit_id):
+        tracker = HabitTracker("Bench", "", "Daily", habit_id)
+        tracked_at = datetime(2030, 1, 1)
+        done = 0
+        while not stop.is_set():
+            with manager.writer() as db:
+                tracker.log_progress(db, tracked_at)
+            tracked_at += timedelta(days=1)
+            done += 1
+        with counts_lock:
+            counts['writes'] += done
+
+    def read():
+        done = 0
+        while not stop.is_set():
+            with manager.reader() as db:
+                compute_longest_streaks(db)
+                load_history(db, "Habit 1")
+            done += 1
+        with counts_lock:
+            counts['reads'] += done
+
+    threads = [threading.Thread(target=write, args=(habit_id,)) for habit_id in tracker_ids]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    for label, factory in (("shared connection", SharedConnection), ("ConnectionManager (WAL)", ConnectionManager)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.db')
+            seeding = initialize_database(path)
+            seed_history(seeding, args.habits, args.days)
+            seeding.close()
+
+            manager = factory(path)
+            counts = run(manager, args.writers, args.readers, args.seconds)
+            manager.close()
+        print(f"{label:<28} {counts['writes'] / args.seconds:>10,.0f} writes/s {counts['reads'] / args.seconds:>10,.1f} reads/s"
+              f"  ({args.writers} writers, {args.readers} readers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures what keeping one completion per habit and period saves: database size and streak scan latency.
+
+A seeded history gets repeated completions added, like a sync client retrying requests that had
+in fact succeeded. The same measurements are taken before and after dedup.enable_unique_periods:
+the size after VACUUM, rebuilding every streak summary from the raw log, loading the completed
+periods of every habit, and the rescan a back-dated completion triggers. Retries are timed in
+both modes; with one completion per period they are all skipped.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from bench.common import measure, temporary_database
+from counter import log_progress_bulk
+from dedup import enable_unique_periods
+from preload_db import generate_dataset
+from streaks import load_completion_periods, rebuild_habit_streaks, scan_streak_state
+
+
+def make_retries(db, share, seed):
+    """Picks completions to be logged again an hour later, each with the given probability and up to twice."""
+    rng = random.Random(seed)
+    completions = db.execute('SELECT habit_id, tracked_epoch FROM progress_log').fetchall()
+    epoch = datetime(1970, 1, 1)
+    return [(habit_id, epoch + timedelta(seconds=seconds, hours=1))
+            for habit_id, seconds in completions
+            for _ in range(rng.choice((1, 2))) if rng.random() < share]
+
+
+def database_size(db):
+    """Returns the database size in MB after VACUUM."""
+    db.commit()
+    db.execute('VACUUM')
+    page_count = db.execute('PRAGMA page_count').fetchone()[0]
+    return page_count * db.execute('PRAGMA page_size').fetchone()[0] / 1e6
+
+
+def rescan_all(db, habit_ids):
+    """Rescans the streak of every habit one by one, as a back-dated completion does for its habit."""
+    cursor = db.cursor()
+    for habit_id in habit_ids:
+        scan_streak_state(cursor, habit_id)
+
+
+def measurements(db, habit_ids):
+    rows = db.execute('SELECT COUNT(*) FROM progress_log').fetchone()[0]
+    return [
+        ("completions", f"{rows:>12,}"),
+        ("size after VACUUM", f"{database_size(db):>9.1f} MB"),
+        ("rebuild_habit_streaks", f"{measure(rebuild_habit_streaks, db)[1]:>10.3f} s"),
+        ("load_completion_periods", f"{measure(load_completion_periods, db.cursor())[1]:>10.3f} s"),
+        ("scan_streak_state per habit", f"{measure(rescan_all, db, habit_ids)[1] / len(habit_ids) * 1000:>9.2f} ms"),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--retried', type=float, default=0.3, help='share of completions logged again')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        generate_dataset(db, args.habits, args.days, seed=args.seed, periodicities=("Daily",), fast=True)
+        retries = make_retries(db, args.retried, args.seed)
+        logged, seconds = measure(log_progress_bulk, db, retries)
+        habit_ids = [row[0] for row in db.execute('SELECT id FROM habits')]
+        print(f"{args.habits} daily habits; retries of {args.retried:.0%} of their completions "
+              f"logged {logged:,} repeats in {seconds:.3f} s")
+
+        before = measurements(db, habit_ids)
+        removed, seconds = measure(enable_unique_periods, db)
+        print(f"enable_unique_periods removed {removed:,} completions in {seconds:.3f} s\n")
+        after = measurements(db, habit_ids)
+        print(f"{'':<30} {'repeats allowed':>16} {'one per period':>16}")
+        for (label, allowed), (_, unique) in zip(before, after):
+            print(f"{label:<30} {allowed:>16} {unique:>16}")
+
+        retries = make_retries(db, args.retried, args.seed + 1)
+        logged, seconds = measure(log_progress_bulk, db, retries)
+        print(f"\nThe same kind of retries in unique mode: {len(retries):,} sent, {logged} logged, {seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
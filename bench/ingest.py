@@ -0,0 +1,51 @@
+"""Compares per-row HabitTracker.log_progress against the batched ingestion path."""
+import argparse
+from datetime import datetime, timedelta
+
+from bench.common import measure, report, temporary_database
+from counter import HabitTracker, log_progress_bulk
+
+
+def history(count, start=datetime(2020, 1, 1)):
+    """Generates one completion per hour, starting at the given datetime."""
+    return (start + timedelta(hours=i) for i in range(count))
+
+
+def log_one_by_one(db, tracker, count):
+    for tracked_at in history(count):
+        tracker.log_progress(db, tracked_at)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000, help='completions to ingest with the batched paths')
+    parser.add_argument('--per-row', type=int, default=2_000, help='completions to ingest with log_progress')
+    parser.add_argument('--chunk-size', type=int, default=5_000)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        tracker = HabitTracker("Bench", "Per-row ingestion", "Daily")
+        tracker.save_to_database(db)
+        rows, seconds = measure(log_one_by_one, db, tracker, args.per_row)
+        report("log_progress (one commit per row)", rows, seconds)
+
+    with temporary_database() as db:
+        tracker = HabitTracker("Bench", "Batched ingestion", "Daily")
+        tracker.save_to_database(db)
+        rows, seconds = measure(tracker.log_progress_many, db, history(args.rows), args.chunk_size)
+        report("log_progress_many", rows, seconds)
+
+    with temporary_database() as db:
+        habit_ids = []
+        for i in range(10):
+            tracker = HabitTracker(f"Bench {i}", "Multi-habit ingestion", "Daily")
+            tracker.save_to_database(db)
+            habit_ids.append(tracker.habit_id)
+        entries = ((habit_ids[i % len(habit_ids)], tracked_at) for i, tracked_at in enumerate(history(args.rows)))
+        rows, seconds = measure(log_progress_bulk, db, entries, args.chunk_size)
+        report("log_progress_bulk (10 habits)", rows, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measures the memory held by habit objects and completion histories before and after the compact representations."""
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+from counter import TIMESTAMP_FORMAT, CompletionLog, HabitTracker
+
+
+class DictHabitTracker:
+    """The previous HabitTracker layout: a regular instance __dict__ and a fresh timestamp per instance."""
+
+    def __init__(self, name, description, periodicity, habit_id=None):
+        self.habit_id = habit_id
+        self.name = name
+        self.description = description
+        self.periodicity = periodicity
+        self.creation_date = datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def allocated(build):
+    """Returns what build() returned and the number of bytes it left allocated."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=50_000)
+    parser.add_argument('--completions', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rows = [(i, f"Habit {i}", "Benchmark habit", "Daily", "2024-01-01 08:00:00") for i in range(args.habits)]
+    _, dict_bytes = allocated(lambda: [DictHabitTracker(*row[1:4], habit_id=row[0]) for row in rows])
+    _, slot_bytes = allocated(lambda: [HabitTracker.from_row(row) for row in rows])
+    print(f"habit objects:   dict-based {dict_bytes / args.habits:6.1f} B/habit, "
+          f"__slots__ + from_row {slot_bytes / args.habits:6.1f} B/habit")
+
+    start = datetime(2020, 1, 1)
+    moments = [start + timedelta(minutes=17 * i) for i in range(args.completions)]
+    _, list_bytes = allocated(lambda: [moment.replace() for moment in moments])
+
+    def build_log():
+        log = CompletionLog(1)
+        for moment in moments:
+            log.append(moment)
+        return log
+
+    _, log_bytes = allocated(build_log)
+    print(f"completions:     datetime list {list_bytes / args.completions:6.1f} B/completion, "
+          f"CompletionLog {log_bytes / args.completions:6.1f} B/completion")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Measures how the process pool streak runner scales with 1, 2, 4 and 8 workers."""
+import argparse
+import os
+import tempfile
+
+from analyse_parallel import compute_streak_statistics
+from bench.common import measure, report
+from db import initialize_database
+from preload_db import generate_dataset
+from streaks import scan_all_streak_states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=2_000)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        db = initialize_database(path)
+        rows = generate_dataset(db, args.habits, args.days, fast=True)
+        db.close()
+        print(f"{os.cpu_count()} CPUs available")
+
+        db = initialize_database(path)
+        _, serial = measure(scan_all_streak_states, db.cursor())
+        db.close()
+        report("scan_all_streak_states (serial)", rows, serial)
+        for workers in args.workers:
+            _, seconds = measure(compute_streak_statistics, path, workers)
+            report(f"compute_streak_statistics, {workers} workers", rows, seconds)
+            print(f"{'':<40} speedup {serial / seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compares the original datetime-based streak loop against the period engine in streaks.py on multi-year histories."""
+import argparse
+import sys
+from datetime import datetime
+
+from bench.common import measure, report, seed_history, temporary_database
+from streaks import load_completion_periods, summarize_periods
+
+
+def load_datetimes(db):
+    """The original representation: one parsed datetime per completion, per habit."""
+    cursor = db.cursor()
+    cursor.execute('SELECT habit_id, tracked_at FROM progress_log ORDER BY habit_id, tracked_at')
+    history = {}
+    for habit_id, tracked_at in cursor:
+        history.setdefault(habit_id, []).append(datetime.strptime(tracked_at, "%Y-%m-%d %H:%M:%S"))
+    return history
+
+
+def legacy_streaks(history):
+    streaks = {}
+    for habit_id, dates in history.items():
+        max_streak = current_streak = 1
+        for prev_date, date in zip(dates, dates[1:]):
+            diff = (date - prev_date).days
+            if diff == 1:
+                current_streak += 1
+            elif diff > 1:
+                max_streak = max(max_streak, current_streak)
+                current_streak = 1
+        streaks[habit_id] = max(max_streak, current_streak)
+    return streaks
+
+
+def period_streaks(periods):
+    return {habit_id: summarize_periods(habit_periods).longest_streak for habit_id, habit_periods in periods.items()}
+
+
+def footprint(history):
+    """The approximate memory held by a {habit_id: container} mapping, including its elements."""
+    total = 0
+    for container in history.values():
+        total += sys.getsizeof(container)
+        if isinstance(container, list):
+            total += sum(sys.getsizeof(item) for item in container)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=200)
+    parser.add_argument('--years', type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        rows = seed_history(db, args.habits, args.years * 365)
+
+        history, seconds = measure(load_datetimes, db)
+        report("load datetimes (strptime per row)", rows, seconds)
+        legacy, seconds = measure(legacy_streaks, history)
+        report("datetime loop", rows, seconds)
+
+        periods, seconds = measure(load_completion_periods, db.cursor())
+        report("load_completion_periods", rows, seconds)
+        engine, seconds = measure(period_streaks, periods)
+        report("summarize_periods", rows, seconds)
+
+        assert legacy == engine
+        print(f"datetime lists: {footprint(history) / 1e6:.1f} MB, period arrays: {footprint(periods) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Measures deleting and resetting many habits and pruning old history on a million-row database.
+
+Every scenario starts from a copy of the same seeded database file. Deleting and resetting
+compare the old per-habit statements, the per-habit methods (which now cascade) and the bulk
+functions. Pruning compares one big DELETE followed by rebuilding the streaks and rollups with
+prune_progress; the longest transaction is how long other writers may have to wait. Finally
+the freed space is returned with incremental vacuum steps, next to a full VACUUM of the same file.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.common import measure
+from counter import add_write_listener, clear_progress_bulk, delete_habits_bulk, remove_write_listener
+from db import get_habit_tracker, initialize_database
+from preload_db import generate_dataset
+from retention import compact_database, prune_progress
+from rollups import clear_rollups, refresh_all_rollups
+from storage import epoch_seconds
+from streaks import forget_streak, refresh_all_streaks
+
+START = datetime(2020, 1, 1, 6)
+
+
+def legacy_delete(db, habit_id):
+    """Deletes a habit the way HabitTracker.delete_from_database did before the cascades."""
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+    cursor.execute("DELETE FROM progress_log WHERE habit_id = ?", (habit_id,))
+    forget_streak(cursor, habit_id)
+    clear_rollups(cursor, [habit_id])
+    db.commit()
+
+
+def delete_one_by_one(db, habit_ids, delete):
+    for habit_id in habit_ids:
+        delete(db, habit_id)
+
+
+def tracker_method(method):
+    """Calls a HabitTracker method on the habit with the given id."""
+    return lambda db, habit_id: getattr(get_habit_tracker(db, f"Habit {habit_id}"), method)(db)
+
+
+def prune_at_once(db, before):
+    """Deletes the old history in a single transaction, then recomputes streaks and rollups."""
+    cursor = db.cursor()
+    cursor.execute('DELETE FROM progress_log WHERE tracked_epoch < ?', (epoch_seconds(before),))
+    pruned = cursor.rowcount
+    refresh_all_streaks(cursor)
+    refresh_all_rollups(cursor)
+    db.commit()
+    return pruned
+
+
+def longest_transaction(func, db, *args):
+    """Runs func and returns its result, its duration and the longest time between two of its commits."""
+    commits = [time.perf_counter()]
+
+    def on_write(written_db, event, habit_ids, tracker):
+        if written_db is db:
+            commits.append(time.perf_counter())
+
+    add_write_listener(on_write)
+    try:
+        result, seconds = measure(func, db, *args)
+    finally:
+        remove_write_listener(on_write)
+    commits.append(commits[0] + seconds)
+    return result, seconds, max(later - earlier for earlier, later in zip(commits, commits[1:]))
+
+
+def file_size(path):
+    """Returns the size of a database file after checkpointing its WAL, in MB."""
+    db = initialize_database(path)
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+    return os.path.getsize(path) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=1_250)
+    parser.add_argument('--delete', type=int, default=100, help='habits deleted or reset per scenario')
+    parser.add_argument('--prune-days', type=int, default=625, help='days of history pruned')
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        template = os.path.join(directory, 'template.db')
+        db = initialize_database(template)
+        rows = generate_dataset(db, args.habits, args.days, start=START, fast=True)
+        db.close()
+        print(f"{args.habits} habits, {rows} completions, {file_size(template):.1f} MB")
+
+        def fresh_copy():
+            path = os.path.join(directory, 'bench.db')
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            shutil.copyfile(template, path)
+            return path, initialize_database(path)
+
+        # Spread over the id range, so the deleted rows are spread over the whole file
+        habit_ids = list(range(1, args.habits + 1, max(1, args.habits // args.delete)))[:args.delete]
+        scenarios = [
+            ("delete, old statements per habit", lambda db: delete_one_by_one(db, habit_ids, legacy_delete)),
+            ("delete, delete_from_database", lambda db: delete_one_by_one(db, habit_ids,
+                                                                          tracker_method('delete_from_database'))),
+            ("delete, delete_habits_bulk", lambda db: delete_habits_bulk(db, habit_ids)),
+            ("reset, clear_progress", lambda db: delete_one_by_one(db, habit_ids, tracker_method('clear_progress'))),
+            ("reset, clear_progress_bulk", lambda db: clear_progress_bulk(db, habit_ids)),
+        ]
+        print(f"\n{len(habit_ids)} habits:")
+        for label, scenario in scenarios:
+            _, db = fresh_copy()
+            _, seconds = measure(scenario, db)
+            db.close()
+            print(f"  {label:<36} {seconds:>8.3f} s")
+
+        before = START.replace(hour=0) + timedelta(days=args.prune_days)
+        print(f"\nPruning completions before {before:%Y-%m-%d}:")
+        for label, func, extra in [("one transaction, then rebuild", prune_at_once, ()),
+                                   (f"prune_progress, chunks of {args.chunk_size}", prune_progress,
+                                    (None, args.chunk_size))]:
+            _, db = fresh_copy()
+            pruned, seconds, longest = longest_transaction(func, db, before, *extra)
+            db.close()
+            print(f"  {label:<36} {pruned:>9} rows {seconds:>8.3f} s {pruned / seconds:>10,.0f} rows/s   "
+                  f"longest transaction {longest:>7.3f} s")
+
+        path, db = fresh_copy()
+        prune_progress(db, before, chunk_size=args.chunk_size)
+        db.close()
+        pruned_size = file_size(path)
+        copy = os.path.join(directory, 'vacuum.db')
+        shutil.copyfile(path, copy)
+        db = initialize_database(path)
+        pages, seconds = measure(compact_database, db)
+        db.close()
+        print(f"\nAfter pruning, {pruned_size:.1f} MB:")
+        print(f"  {'compact_database':<36} {seconds:>8.3f} s   {pages} pages released, {file_size(path):.1f} MB")
+        db = initialize_database(copy)
+        _, seconds = measure(db.execute, 'VACUUM')
+        db.close()
+        print(f"  {'full VACUUM':<36} {seconds:>8.3f} s   {file_size(copy):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
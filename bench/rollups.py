@@ -0,0 +1,73 @@
+"""Compares range aggregates answered from the rollup tables with the same aggregates scanned from progress_log."""
+import argparse
+from datetime import date
+
+from analyse import completion_counts, weekday_completion_rates
+from bench.common import measure, temporary_database
+from preload_db import generate_dataset
+from rollups import rebuild_rollups
+
+
+def raw_monthly_counts(db, habit_name=None):
+    """Completions per calendar month, grouped straight from the raw log."""
+    query = '''
+        SELECT substr(date(day_ordinal + 1721424.5), 1, 7) AS month, COUNT(*)
+        FROM progress_log
+    '''
+    if habit_name is not None:
+        query += ' WHERE habit_id = (SELECT id FROM habits WHERE name = ?)'
+    rows = db.execute(query + ' GROUP BY month ORDER BY month', () if habit_name is None else (habit_name,))
+    return {date(int(month[:4]), int(month[5:]), 1): count for month, count in rows}
+
+
+def raw_weekly_counts(db):
+    """Completions per ISO week over all habits, grouped straight from the raw log."""
+    rows = db.execute('SELECT (day_ordinal - 1) / 7 AS week, COUNT(*) FROM progress_log GROUP BY week ORDER BY week')
+    return {date.fromordinal(week * 7 + 1): count for week, count in rows}
+
+
+def raw_weekday_rates(db, habit_name):
+    """Share of each weekday with a completion, from the distinct days in the raw log."""
+    days = sorted({row[0] for row in db.execute(
+        'SELECT day_ordinal FROM progress_log WHERE habit_id = (SELECT id FROM habits WHERE name = ?)', (habit_name,)
+    )})
+    if not days:
+        return [0.0] * 7
+    completed, totals = [0] * 7, [0] * 7
+    for day in range(days[0], days[-1] + 1):
+        totals[(day - 1) % 7] += 1
+    for day in days:
+        completed[(day - 1) % 7] += 1
+    return [done / total if total else 0.0 for done, total in zip(completed, totals)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        rows = generate_dataset(db, args.habits, args.days, fast=True)
+        _, seconds = measure(rebuild_rollups, db)
+        print(f"{rows} completions; rebuilding the rollups takes {seconds:.3f} s")
+        habit = "Habit 1"
+
+        for label, raw, rolled_up in (
+            ("monthly counts, all habits", lambda: raw_monthly_counts(db), lambda: completion_counts(db, 'month')),
+            ("weekly counts, all habits", lambda: raw_weekly_counts(db), lambda: completion_counts(db, 'week')),
+            ("monthly counts, one habit", lambda: raw_monthly_counts(db, habit),
+             lambda: completion_counts(db, 'month', habit)),
+            ("weekday rates, one habit", lambda: raw_weekday_rates(db, habit),
+             lambda: weekday_completion_rates(db, habit)),
+        ):
+            raw_result, raw_seconds = min((measure(raw) for _ in range(args.repeat)), key=lambda run: run[1])
+            result, seconds = min((measure(rolled_up) for _ in range(args.repeat)), key=lambda run: run[1])
+            assert result == raw_result, label
+            print(f"{label:<30} raw scan {raw_seconds * 1000:>9.2f} ms   rollups {seconds * 1000:>9.2f} ms   "
+                  f"{raw_seconds / seconds:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Load-tests the HTTP service and reports requests/s and p50/p99 latency per endpoint.
+
+By default a service is started in a subprocess on a seeded temporary database. Pass --url to
+load-test a service that is already running instead (it needs habits named "Habit 1", ...):
+
+    python -m bench.service --concurrency 32 --seconds 10
+    python -m bench.service --url http://127.0.0.1:8080 --habits 5
+
+Each client keeps one connection open and sends a random mix of streak lookups, completions
+and listings. Client-side latency includes the network round trip; the service's own figures
+(from /metrics) are printed below it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+from bench.common import seed_history, temporary_database
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def request(reader, writer, method, path, body=None):
+    """Sends one request on an open keep-alive connection and returns its status and decoded body."""
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def client(host, port, habits, mix, deadline, samples, failures, rng):
+    """Sends requests until the deadline, appending each latency in seconds to samples[label]."""
+    reader, writer = await asyncio.open_connection(host, port)
+    moment = 0
+    try:
+        while time.perf_counter() < deadline:
+            habit = quote(f"Habit {rng.randint(1, habits)}")
+            label = rng.choices(list(mix), weights=list(mix.values()))[0]
+            if label == 'GET /habits/{name}/streak':
+                method, path, body = 'GET', f'/habits/{habit}/streak', None
+            elif label == 'POST /habits/{name}/completions':
+                moment += 1  # Distinct timestamps in the future, so streaks keep changing
+                method, path = 'POST', f'/habits/{habit}/completions'
+                body = {'tracked_at': f'2100-01-01T00:{moment // 60 % 60:02}:{moment % 60:02}'}
+            else:
+                method, path, body = 'GET', '/habits?periodicity=Weekly', None
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, body)
+            samples.setdefault(label, []).append(time.perf_counter() - start)
+            if status >= 400:
+                failures[status] = failures.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def load(url, habits, concurrency, seconds, mix, seed):
+    parts = urlsplit(url)
+    samples, failures = {}, {}
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*(client(parts.hostname, parts.port, habits, mix, deadline, samples, failures,
+                                  random.Random(rng.random())) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(latencies) for latencies in samples.values())
+    print(f"{total} requests in {elapsed:.1f} s with {concurrency} connections: {total / elapsed:,.0f} requests/s")
+    if failures:
+        print(f"Error responses by status: {failures}")
+    every = sorted(latency for latencies in samples.values() for latency in latencies)
+    for label, latencies in [('all', every)] + sorted(samples.items()):
+        latencies = sorted(latencies)
+        print(f"  {label:<36} {len(latencies):>8} req   p50 {percentile(latencies, 0.5) * 1000:>8.2f} ms   "
+              f"p99 {percentile(latencies, 0.99) * 1000:>8.2f} ms")
+
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    _, metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    print(f"Service side (rejected as busy: {metrics['rejected']}):")
+    for entry in metrics['endpoints']:
+        print(f"  {entry['action']:<36} {entry['calls']:>8} req   p50 {entry['p50_ms']:>8.2f} ms   "
+              f"p99 {entry['p99_ms']:>8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='an already running service to load-test')
+    parser.add_argument('--habits', type=int, default=200, help='habits to seed, or present at --url')
+    parser.add_argument('--days', type=int, default=365, help='history length of the seeded habits')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4, help='database threads of the started service')
+    parser.add_argument('--writes', type=float, default=0.2, help='share of requests logging a completion')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    mix = {
+        'GET /habits/{name}/streak': 0.9 - args.writes,
+        'POST /habits/{name}/completions': args.writes,
+        'GET /habits': 0.1,
+    }
+
+    if args.url:
+        asyncio.run(load(args.url, args.habits, args.concurrency, args.seconds, mix, args.seed))
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'service.db')
+        with temporary_database() as db:
+            seed_history(db, args.habits, args.days, periodicities=("Daily", "Weekly"))
+            db.execute('VACUUM INTO ?', (path,))
+        server = subprocess.Popen(
+            [sys.executable, 'service.py', '--database', path, '--port', '0', '--workers', str(args.workers)],
+            cwd=PROJECT_ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            url = server.stdout.readline().split(' on ')[-1].strip()
+            asyncio.run(load(url, args.habits, args.concurrency, args.seconds, mix, args.seed))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Measures the AnalyticsSnapshot on a million-row history: getting it ready and answering queries.
+
+The snapshot is read from SQLite, saved, and opened again from the saved file, which maps the
+day arrays instead of reading them. Query latency is then compared with the same queries
+answered by analyse.py and db.py directly from SQLite, including the first query after a
+completion was logged, when the snapshot re-reads that habit, and reopening the saved file after
+another connection wrote to the database, when it is caught up.
+"""
+import argparse
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from analyse import compute_current_streak, compute_longest_streak, compute_longest_streaks
+from bench.common import measure, temporary_database
+from db import fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker, initialize_database
+from preload_db import generate_dataset
+from snapshot import AnalyticsSnapshot, database_fingerprint
+
+START = datetime(2020, 1, 1, 6)
+
+
+def per_query(func, arguments):
+    """Calls func once per argument tuple and returns the mean latency in microseconds."""
+    def run():
+        for args in arguments:
+            func(*args)
+    return measure(run)[1] / len(arguments) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=1_250)
+    parser.add_argument('--queries', type=int, default=2_000, help='queries per single-habit scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        rows = generate_dataset(db, args.habits, args.days, start=START, fast=True)
+        db.commit()
+        print(f"{args.habits} habits, {rows:,} completions")
+
+        snapshot, seconds = measure(AnalyticsSnapshot.load, db)
+        print(f"\n{'read from SQLite (load)':<34} {seconds * 1000:>10.1f} ms")
+        path, seconds = measure(snapshot.save)
+        print(f"{'save':<34} {seconds * 1000:>10.1f} ms   {os.path.getsize(path) / 1e6:.1f} MB")
+        snapshot.close()
+        snapshot, seconds = measure(AnalyticsSnapshot.open, db)
+        print(f"{'open the saved file (mmap)':<34} {seconds * 1000:>10.1f} ms")
+        _, seconds = measure(database_fingerprint, db.cursor())
+        print(f"{'  of which checking the fingerprint':<34} {seconds * 1000:>10.1f} ms")
+        _, seconds = measure(snapshot.longest_streaks)
+        print(f"{'first longest_streaks after open':<34} {seconds * 1000:>10.1f} ms")
+
+        rng = random.Random(args.seed)
+        names = fetch_all_habit_names(db)
+        picked = [(rng.choice(names),) for _ in range(args.queries)]
+        today = START.date() + timedelta(days=args.days)
+        scenarios = [
+            ("longest_streak(name)", compute_longest_streak, snapshot.longest_streak, picked),
+            ("current_streak(name)", compute_current_streak, snapshot.current_streak,
+             [(name, today) for name, in picked]),
+            ("longest_streaks()", compute_longest_streaks, snapshot.longest_streaks, [()] * 20),
+            ("habits_by_periodicity()", fetch_habits_by_periodicity, snapshot.habits_by_periodicity,
+             [(periodicity,) for periodicity in ("Daily", "Weekly")] * 50),
+        ]
+        print(f"\n{'mean latency':<34} {'SQLite':>12} {'snapshot':>12}")
+        for label, direct, cached, arguments in scenarios:
+            sqlite_us = per_query(lambda *query: direct(db, *query), arguments)
+            snapshot_us = per_query(cached, arguments)
+            print(f"{label:<34} {sqlite_us:>9.1f} us {snapshot_us:>9.1f} us   {sqlite_us / snapshot_us:>7.1f}x")
+
+        trackers = {name: get_habit_tracker(db, name) for name, in picked[:100]}
+        moment = datetime.combine(date.today(), datetime.min.time())
+        logged = []
+        for name, tracker in trackers.items():
+            tracker.log_progress(db, moment)
+            logged.append(measure(snapshot.longest_streak, name)[1])
+        print(f"{'longest_streak after a log':<34} {'':>12} {sum(logged) / len(logged) * 1e6:>9.1f} us")
+        _, seconds = measure(snapshot.save)
+        print(f"{'save after those writes':<34} {seconds * 1000:>10.1f} ms")
+        snapshot.close()
+
+        other = initialize_database(db.execute('PRAGMA database_list').fetchone()[2])
+        for name, tracker in list(trackers.items())[:10]:
+            get_habit_tracker(other, name).log_progress(other, moment + timedelta(days=1))
+        other.close()
+        snapshot, seconds = measure(AnalyticsSnapshot.open, db)
+        print(f"{'open after another connection wrote':<34} {seconds * 1000:>10.1f} ms")
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measures cold-start cost of a scripted `main.py list` with and without the interactive prompt library imported.
+
+Each run is a fresh interpreter. Import time is the sum of the top-level entries reported by
+`python -X importtime`; wall time covers the whole process, including opening the database.
+The eager variant imports questionary up front, as main.py did before the menu imported it lazily.
+If questionary is not installed, prompt_toolkit (which it is built on, and which dominates its
+import time) stands in for it.
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import seed_history, temporary_database
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prompt_library():
+    """Returns the module the interactive menu pulls in, or None if neither candidate is installed."""
+    for module in ('questionary', 'prompt_toolkit'):
+        if importlib.util.find_spec(module) is not None:
+            return module
+    return None
+
+
+def run(code):
+    """Runs code in a fresh interpreter and returns its wall time and total import time, in milliseconds."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=PROJECT_ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    wall = (time.perf_counter() - start) * 1000
+    imported = 0
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nested imports are indented
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if not name[1:].startswith(' '):
+                imported += int(cumulative)
+    return wall, imported / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    library = prompt_library()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'startup.db')
+        with temporary_database() as db:
+            seed_history(db, 20, 30)
+            db.execute('VACUUM INTO ?', (path,))
+        command = f"import sys, main; sys.exit(main.cli(['--database', {path!r}, 'list']))"
+        variants = [("lazy (current)", command)]
+        if library is not None:
+            variants.insert(0, (f"eager ({library} imported)", f"import {library}; {command}"))
+        else:
+            print("Neither questionary nor prompt_toolkit is installed; only the current startup is measured.")
+
+        for label, code in variants:
+            run(code)  # Warm the file system cache and bytecode
+            walls, imports = zip(*(run(code) for _ in range(args.repeat)))
+            print(f"{label:<36} wall {statistics.median(walls):>8.1f} ms   imports {statistics.median(imports):>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
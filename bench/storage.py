@@ -0,0 +1,79 @@
+"""Measures file size and history-read latency of progress_log before and after the integer storage conversion."""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from bench.common import measure, report
+from counter import CompletionLog
+from db import migrate_database
+from storage import convert_progress_log
+from streaks import scan_all_streak_states
+
+
+def create_legacy_file(path, habits, days, seed=0):
+    """Writes a database in the original text-only format, as produced before schema version 4."""
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, description TEXT,
+            periodicity TEXT NOT NULL, creation_date TEXT NOT NULL
+        );
+        CREATE TABLE progress_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, tracked_at TEXT NOT NULL,
+            FOREIGN KEY(habit_id) REFERENCES habits(id)
+        );
+    ''')
+    db.executemany("INSERT INTO habits (name, description, periodicity, creation_date) VALUES (?, ?, ?, ?)",
+                   [(f"Habit {i}", "Benchmark habit", "Daily", "2021-01-01 08:00:00") for i in range(habits)])
+    rng = random.Random(seed)
+    start = datetime(2021, 1, 1, 8)
+    db.executemany("INSERT INTO progress_log (habit_id, tracked_at) VALUES (?, ?)", (
+        (habit_id, (start + timedelta(days=day, minutes=rng.randrange(600))).strftime("%Y-%m-%d %H:%M:%S"))
+        for habit_id in range(1, habits + 1) for day in range(days) if rng.random() < 0.9
+    ))
+    db.commit()
+    return db
+
+
+def file_size(db, path):
+    db.execute('VACUUM')
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=500)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        db = create_legacy_file(path, args.habits, args.days)
+        rows = db.execute('SELECT COUNT(*) FROM progress_log').fetchone()[0]
+        db.execute('CREATE INDEX idx_progress_log_habit_tracked ON progress_log (habit_id, tracked_at)')
+        text_size = file_size(db, path)  # The text format with the history index of schema version 1
+        migrate_database(db)
+
+        _, seconds = measure(scan_all_streak_states, db.cursor())
+        report("streak scan, text format", rows, seconds)
+        _, seconds = measure(CompletionLog.load_all, db)
+        report("CompletionLog.load_all, text format", rows, seconds)
+
+        _, seconds = measure(convert_progress_log, db)
+        report("convert_progress_log", rows, seconds)
+
+        _, seconds = measure(scan_all_streak_states, db.cursor())
+        report("streak scan, integer format", rows, seconds)
+        _, seconds = measure(CompletionLog.load_all, db)
+        report("CompletionLog.load_all, integer format", rows, seconds)
+        integer_size = file_size(db, path)
+        db.close()
+
+    print(f"file size: text format {text_size / 1e6:.1f} MB, integer format {integer_size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compares the original per-habit streak loop against the single-pass scan and the materialized habit_streaks lookups."""
+import argparse
+from datetime import datetime
+
+from analyse import compute_longest_streak, compute_longest_streaks
+from bench.common import measure, report, seed_history, temporary_database
+from db import fetch_all_habit_names
+from streaks import rebuild_habit_streaks, scan_all_streak_states
+
+
+def legacy_longest_streak(db, habit_name):
+    """The original implementation: a JOIN per habit and a strptime per completion."""
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT tracked_at
+        FROM progress_log
+        INNER JOIN habits ON progress_log.habit_id = habits.id
+        WHERE habits.name = ?
+        ORDER BY tracked_at ASC
+    ''', (habit_name,))
+    completion_dates = cursor.fetchall()
+    if not completion_dates:
+        return 0
+    dates = sorted([datetime.strptime(date[0], "%Y-%m-%d %H:%M:%S") for date in completion_dates])
+    max_streak = current_streak = 1
+    prev_date = dates[0]
+    for date in dates[1:]:
+        diff = (date - prev_date).days
+        if diff == 1:
+            current_streak += 1
+        elif diff > 1:
+            max_streak = max(max_streak, current_streak)
+            current_streak = 1
+        prev_date = date
+    return max(max_streak, current_streak)
+
+
+def per_habit_loop(db, streak_function):
+    return {name: streak_function(db, name) for name in fetch_all_habit_names(db)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        rows = seed_history(db, args.habits, args.days)
+
+        legacy, seconds = measure(per_habit_loop, db, legacy_longest_streak)
+        report("legacy loop (strptime per row)", rows, seconds)
+        states, seconds = measure(scan_all_streak_states, db.cursor())
+        report("scan_all_streak_states (one pass)", rows, seconds)
+        _, seconds = measure(rebuild_habit_streaks, db)
+        report("rebuild_habit_streaks", rows, seconds)
+        looped, seconds = measure(per_habit_loop, db, compute_longest_streak)
+        report("compute_longest_streak per habit", rows, seconds)
+        materialized, seconds = measure(compute_longest_streaks, db)
+        report("compute_longest_streaks", rows, seconds)
+
+        names = dict(db.execute("SELECT id, name FROM habits"))
+        assert legacy == looped == materialized == {names[i]: s.longest_streak for i, s in states.items()}
+
+
+if __name__ == "__main__":
+    main()
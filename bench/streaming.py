@@ -0,0 +1,66 @@
+"""Measures peak Python memory and time of materialized (fetchall) vs. streaming (fetchmany) history reads."""
+import argparse
+import tracemalloc
+from datetime import datetime
+
+from bench.common import measure, report, temporary_database
+from counter import HabitTracker
+from db import iter_progress
+from storage import epoch_seconds, progress_columns
+from streaks import period_sql, scan_streak_state, summarize_periods
+
+
+def fetchall_streak(db, habit_id):
+    """The previous approach: fetch the whole history into a list, then fold it."""
+    cursor = db.cursor()
+    columns = progress_columns(cursor)
+    cursor.execute(f'''
+        SELECT {period_sql(columns.day_ordinal)}
+        FROM progress_log
+        INNER JOIN habits ON habits.id = progress_log.habit_id
+        WHERE progress_log.habit_id = ?
+        ORDER BY {columns.order}
+    ''', (habit_id,))
+    return summarize_periods([row[0] for row in cursor.fetchall()])
+
+
+def traced(func, *args):
+    """Runs func and returns its result, the elapsed seconds and the peak traced allocation in bytes."""
+    tracemalloc.start()
+    try:
+        result, seconds = measure(func, *args)
+        return result, seconds, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with temporary_database() as db:
+        tracker = HabitTracker("Hourly", "Benchmark habit", "Daily")
+        tracker.save_to_database(db)
+        start = datetime(2000, 1, 1)
+        db.execute('''
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1)
+            INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal)
+            SELECT ?, '', ? + i * 3600, ? + i / 24 FROM n
+        ''', (args.rows, tracker.habit_id, epoch_seconds(start), start.toordinal()))
+        db.commit()
+
+        for label, func, call_args in (
+            ("streak fold, fetchall", fetchall_streak, (db, tracker.habit_id)),
+            ("streak fold, streaming", scan_streak_state, (db.cursor(), tracker.habit_id)),
+            ("iter_progress", lambda: sum(1 for _ in iter_progress(db, tracker.habit_id, batch_size=args.batch_size)),
+             ()),
+        ):
+            _, seconds, peak = traced(func, *call_args)
+            report(label, args.rows, seconds)
+            print(f"{'':<40} peak {peak / 1e6:>8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
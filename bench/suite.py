@@ -0,0 +1,167 @@
+"""
+Times the core habit operations on generated datasets of several sizes and checks them against a baseline.
+
+Results are written as JSON. When a baseline file exists, the run fails (exit status 1) if the median
+time of any operation grew by more than the threshold. Sizes with a slower operation are timed twice
+more and compared by the middle median of each operation over the three runs, so a single noisy run
+neither fails nor passes the check. A new baseline keeps the middle median over three runs as well:
+
+    python -m bench.suite --output bench-results.json
+    python -m bench.suite --update-baseline      # Record the current machine's numbers as the baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from analyse import compute_longest_streak
+from bench.common import temporary_database
+from counter import HabitTracker
+from db import fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker
+from preload_db import generate_dataset
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+NOISE_FLOOR_MS = 0.05  # Slowdowns smaller than this are timer noise, whatever their ratio
+ROUNDS = 3  # Runs per size when recording a baseline or confirming a slowdown (odd, so there is a middle one)
+
+
+def timed(calls):
+    """Runs every zero-argument callable once and returns the median and 95th percentile in milliseconds."""
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'median_ms': round(samples[len(samples) // 2], 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'runs': len(samples),
+    }
+
+
+def run_size(habits, days, repeat):
+    """Generates a dataset with the given number of habits and times each operation on it."""
+    with temporary_database() as db:
+        rows = generate_dataset(db, habits, days, seed=habits, fast=True)
+        names = fetch_all_habit_names(db)
+        # Write operations that consume a habit each get their own, so no run sees another's leftovers
+        repeat = max(1, min(repeat, len(names) // 3))
+        read_names = [names[i * len(names) // repeat] for i in range(repeat)]
+        cleared = [get_habit_tracker(db, name) for name in names[:repeat]]
+        deleted = [get_habit_tracker(db, name) for name in names[repeat:2 * repeat]]
+        logged = get_habit_tracker(db, names[-1])
+        moment = datetime.now()
+
+        results = {
+            'fetch_all_habit_names': timed(lambda: fetch_all_habit_names(db) for _ in range(repeat)),
+            'fetch_habits_by_periodicity': timed(lambda: fetch_habits_by_periodicity(db, "Weekly") for _ in range(repeat)),
+            'get_habit_tracker': timed((lambda name=name: get_habit_tracker(db, name)) for name in read_names),
+            'compute_longest_streak': timed((lambda name=name: compute_longest_streak(db, name)) for name in read_names),
+            'save_to_database': timed(
+                (lambda i=i: HabitTracker(f"Suite {i}", "Benchmark habit", "Daily").save_to_database(db))
+                for i in range(repeat)
+            ),
+            'log_progress': timed(lambda: logged.log_progress(db, moment) for _ in range(repeat)),
+            'clear_progress': timed((lambda tracker=tracker: tracker.clear_progress(db)) for tracker in cleared),
+            'delete_from_database': timed((lambda tracker=tracker: tracker.delete_from_database(db))
+                                          for tracker in deleted),
+        }
+    return {'habits': habits, 'days': days, 'completions': rows, 'operations': results}
+
+
+def typical(runs):
+    """Merges runs of the same size, keeping the timing with the middle median of each operation."""
+    operations = {
+        operation: sorted((run['operations'][operation] for run in runs), key=lambda t: t['median_ms'])[len(runs) // 2]
+        for operation in runs[0]['operations']
+    }
+    return dict(runs[0], operations=operations)
+
+
+def regressions(results, baseline, threshold):
+    """Lists (size, description) for every operation whose median grew by more than threshold (a fraction)."""
+    found = []
+    for size, run in results['sizes'].items():
+        previous = baseline.get('sizes', {}).get(size, {}).get('operations', {})
+        for operation, timing in run['operations'].items():
+            if operation not in previous:
+                continue
+            before, after = previous[operation]['median_ms'], timing['median_ms']
+            if after > before * (1 + threshold) and after - before > NOISE_FLOOR_MS:
+                found.append((size, f"{operation} at {size} habits: {before:.3f} ms -> {after:.3f} ms "
+                                    f"(+{(after / before - 1) * 100:.0f}%)"))
+    return found
+
+
+def confirmed_regressions(results, baseline, args):
+    """
+    Lists the regressions that persist when the sizes they were found at are timed again.
+
+    Each flagged size is timed until it has ROUNDS runs, and results keeps their typical (middle) timings.
+    """
+    found = regressions(results, baseline, args.threshold)
+    if not found:
+        return found
+    for size in sorted({size for size, _ in found}, key=int):
+        print(f"Timing {size} habits again to confirm a slowdown")
+        runs = [results['sizes'][size]] + [run_size(int(size), args.days, args.repeat) for _ in range(ROUNDS - 1)]
+        results['sizes'][size] = typical(runs)
+    return regressions(results, baseline, args.threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times core habit operations and compares them to a baseline.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 5_000], help='habit counts to test')
+    parser.add_argument('--days', type=int, default=365, help='history length per habit')
+    parser.add_argument('--repeat', type=int, default=50, help='timed calls per operation')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (default: %(default)s)')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'sizes': {},
+    }
+    for habits in args.sizes:
+        run = run_size(habits, args.days, args.repeat)
+        if args.update_baseline:
+            run = typical([run] + [run_size(habits, args.days, args.repeat) for _ in range(ROUNDS - 1)])
+        results['sizes'][str(habits)] = run
+        print(f"{habits} habits, {run['completions']} completions")
+        for operation, timing in run['operations'].items():
+            print(f"  {operation:<30} median {timing['median_ms']:>9.3f} ms   p95 {timing['p95_ms']:>9.3f} ms")
+
+    found = None
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            found = confirmed_regressions(results, json.load(file), args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {args.baseline}.")
+        return
+    if found is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.")
+        return
+    if found:
+        print(f"Regressions beyond {args.threshold:.0%}:")
+        for _, line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
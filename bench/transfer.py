@@ -0,0 +1,98 @@
+"""
+Measures export and import throughput (MB/s, rows/s) and peak Python memory for each dataset format.
+
+Each operation runs twice: once for its time and once under tracemalloc for its peak allocation
+(tracing slows it down too much to time it in the same run). Parquet is included when pyarrow is
+installed. For comparison, the export is also done the materialized way: fetchall, then write.
+"""
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+
+from bench.common import measure, temporary_database
+from db import initialize_database
+from preload_db import generate_dataset
+from transfer import FORMATS, export_dataset, import_dataset, pa
+
+
+def materialized_export(db, directory):
+    """Exports completions as NDJSON after fetching them all into a list."""
+    rows = db.execute('''
+        SELECT habits.name, progress_log.tracked_at
+        FROM habits INNER JOIN progress_log ON progress_log.habit_id = habits.id
+        ORDER BY habits.id, progress_log.day_ordinal, progress_log.tracked_epoch
+    ''').fetchall()
+    with open(os.path.join(directory, 'completions.ndjson'), 'w') as file:
+        file.write(''.join(json.dumps({'habit': name, 'tracked_at': tracked_at}) + '\n' for name, tracked_at in rows))
+    return len(rows)
+
+
+def peak_memory(func, *args):
+    """Runs func again under tracemalloc and returns its peak traced allocation in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def dataset_size(directory):
+    """Returns the total size of the files in a directory in bytes."""
+    return sum(entry.stat().st_size for entry in os.scandir(directory))
+
+
+def show(label, rows, seconds, size, peak=None):
+    memory = f"   peak {peak / 1e6:>7.2f} MB" if peak is not None else ""
+    print(f"{label:<32} {rows:>9} rows {seconds:>7.2f} s {rows / seconds:>10,.0f} rows/s "
+          f"{size / seconds / 1e6:>7.1f} MB/s{memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=1_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    args = parser.parse_args()
+
+    formats = [file_format for file_format in FORMATS if file_format != 'parquet' or pa is not None]
+    if pa is None:
+        print("pyarrow is not installed; skipping parquet.")
+    with temporary_database() as db, tempfile.TemporaryDirectory() as directory:
+        rows = generate_dataset(db, args.habits, args.days, fast=True)
+        print(f"{args.habits} habits, {rows} completions")
+
+        target = os.path.join(directory, 'materialized')
+        os.makedirs(target)
+        _, seconds = measure(materialized_export, db, target)
+        show("export ndjson, materialized", rows, seconds, dataset_size(target), peak_memory(materialized_export, db,
+                                                                                            target))
+
+        for file_format in formats:
+            target = os.path.join(directory, file_format)
+            _, seconds = measure(export_dataset, db, target, file_format)
+            show(f"export {file_format}", rows, seconds, dataset_size(target),
+                 peak_memory(export_dataset, db, target, file_format))
+
+        for file_format in formats:
+            source = os.path.join(directory, file_format)
+            path = os.path.join(directory, f'import-{file_format}.db')
+            imported = initialize_database(path)
+            imported.execute('PRAGMA synchronous = OFF')
+            counts, seconds = measure(import_dataset, imported, source)
+            assert counts.completions == rows
+            # A second import finds every row already stored, so it measures the de-duplication path
+            _, again = measure(import_dataset, imported, source)
+            imported.close()
+            os.remove(path)
+            imported = initialize_database(path)
+            imported.execute('PRAGMA synchronous = OFF')
+            peak = peak_memory(import_dataset, imported, source)
+            imported.close()
+            show(f"import {file_format}", rows, seconds, dataset_size(source), peak)
+            show(f"import {file_format}, all duplicates", rows, again, dataset_size(source))
+
+
+if __name__ == "__main__":
+    main()
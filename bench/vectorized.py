@@ -0,0 +1,48 @@
+"""Compares the NumPy analytics backend in analyse_numpy.py against its pure-Python fallback."""
+import argparse
+
+import analyse_numpy
+from analyse_numpy import completion_rates, load_history, streak_summaries, weekday_histogram
+from bench.common import measure, report, seed_history, temporary_database
+
+
+def full_report(db):
+    """Loads every history once and computes all analytics for every habit."""
+    history = load_history(db)
+    streaks = streak_summaries(history)
+    for _, days in history.values():
+        completion_rates(days, 'week')
+        completion_rates(days, 'month')
+        weekday_histogram(days)
+    return streaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--habits', type=int, default=3_000)
+    parser.add_argument('--days', type=int, default=10 * 365)
+    parser.add_argument('--probability', type=float, default=0.92)
+    args = parser.parse_args()
+
+    numpy = analyse_numpy.np
+    with temporary_database() as db:
+        rows = seed_history(db, args.habits, args.days, args.probability, periodicities=("Daily", "Weekly"))
+
+        results = []
+        for backend in ((numpy, None) if numpy is not None else (None,)):
+            analyse_numpy.np = backend
+            label = "numpy" if backend is not None else "pure python"
+            _, seconds = measure(load_history, db)
+            report(f"load_history ({label})", rows, seconds)
+            streaks, seconds = measure(full_report, db)
+            report(f"full report ({label})", rows, seconds)
+            results.append(streaks)
+        analyse_numpy.np = numpy
+
+        if numpy is None:
+            print("NumPy is not installed; only the pure-Python fallback was measured.")
+        assert all(streaks == results[0] for streaks in results)
+
+
+if __name__ == "__main__":
+    main()
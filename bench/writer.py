@@ -0,0 +1,81 @@
+"""Compares direct log_progress calls from concurrent producers against the BackgroundWriter queue."""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from counter import HabitTracker
+from db import ConnectionManager
+from writer import BackgroundWriter
+
+
+def run_producers(producers, events, submit):
+    """Runs producer threads that each call submit(producer, i) events times; returns latencies and elapsed time."""
+    latencies = [[] for _ in range(producers)]
+
+    def produce(producer):
+        record = latencies[producer].append
+        for i in range(events):
+            start = time.perf_counter()
+            submit(producer, i)
+            record(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=produce, args=(producer,)) for producer in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(sample for samples in latencies for sample in samples), time.perf_counter() - start
+
+
+def print_line(label, latencies, seconds):
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<34} {len(latencies) / seconds:>10,.0f} events/s   p50 {p50:>7.3f} ms   p99 {p99:>7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--producers', type=int, default=8)
+    parser.add_argument('--events', type=int, default=2_000, help='events per producer')
+    parser.add_argument('--max-pending', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=1_000)
+    args = parser.parse_args()
+    start = datetime(2024, 1, 1, 8)
+
+    for mode in ('direct', 'background'):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = ConnectionManager(os.path.join(directory, 'bench.db'))
+            with manager.writer() as db:
+                trackers = [HabitTracker(f"Source {i}", "Benchmark habit", "Daily") for i in range(args.producers)]
+                for tracker in trackers:
+                    tracker.save_to_database(db)
+
+            if mode == 'direct':
+                def submit(producer, i):
+                    with manager.writer() as db:
+                        trackers[producer].log_progress(db, start + timedelta(hours=i))
+
+                latencies, seconds = run_producers(args.producers, args.events, submit)
+                print_line("log_progress (commit per event)", latencies, seconds)
+            else:
+                writer = BackgroundWriter(manager, args.max_pending, args.batch_size)
+                latencies, seconds = run_producers(
+                    args.producers, args.events,
+                    lambda producer, i: writer.submit(trackers[producer].habit_id, start + timedelta(hours=i)),
+                )
+                print_line("BackgroundWriter.submit", latencies, seconds)
+                flush_start = time.perf_counter()
+                writer.flush()
+                total = seconds + time.perf_counter() - flush_start
+                writer.close()
+                print(f"{'  ... until durable':<34} {writer.committed / total:>10,.0f} events/s   "
+                      f"{writer.batches} transactions, {writer.committed / writer.batches:.0f} events each")
+            manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Memoized analytics and listing queries, invalidated by writes.
+
+Every cached result is keyed by the query, its arguments and the version of the data it was
+computed from: a per-habit version for single-habit queries and a catalog version for queries
+over all habits. HabitTracker writes on the cached connection bump those versions, so results
+computed before a write are simply never looked up again and age out of the LRU order.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from analyse import compute_current_streak, compute_longest_streak, compute_longest_streaks
+from counter import add_write_listener, remove_write_listener
+from db import fetch_habits_by_periodicity
+
+
+class QueryCache:
+    """A bounded LRU cache of streak and listing queries for one database connection.
+
+    Writes made through HabitTracker (or log_progress_bulk and transfer.import_dataset) on the
+    same connection invalidate the affected results automatically. Other writes, such as plain
+    SQL or writes through another connection, are not seen; call clear() after those.
+
+    Attributes:
+        db: The database connection the results are computed on.
+        max_entries (int): The number of results kept before the least recently used is evicted.
+        hits (int): The number of queries answered from memory.
+        misses (int): The number of queries that had to be computed.
+        evictions (int): The number of results dropped to stay within max_entries.
+
+    Methods:
+        longest_streak(habit_name): Cached analyse.compute_longest_streak.
+        current_streak(habit_name, today): Cached analyse.compute_current_streak.
+        longest_streaks(): Cached analyse.compute_longest_streaks.
+        habits_by_periodicity(periodicity): Cached db.fetch_habits_by_periodicity.
+        stats(): Returns the hit, miss and size figures.
+        clear(): Drops every cached result.
+        close(): Stops following the connection's writes.
+    """
+
+    def __init__(self, db, max_entries: int = 1024) -> None:
+        """
+        Creates an empty cache and starts following the connection's writes.
+
+        Args:
+            db: The database connection object.
+            max_entries: (Optional) The maximum number of cached results.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        self.db = db
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._habit_ids = {}          # Habit name -> id, for the per-habit versions
+        self._habit_versions = {}     # Habit id -> version, bumped by every write to the habit
+        self._catalog_version = 0     # Bumped when habits are added or removed
+        self._data_version = 0        # Bumped by every write
+        self._lock = threading.RLock()
+        add_write_listener(self._on_write)
+
+    def _on_write(self, db, event, habit_ids, tracker) -> None:
+        if db is not self.db:
+            return
+        with self._lock:
+            self._data_version += 1
+            for habit_id in habit_ids:
+                self._habit_versions[habit_id] = self._habit_versions.get(habit_id, 0) + 1
+            if event in ('saved', 'deleted'):
+                self._catalog_version += 1
+                # A name can be deleted and created again, with a new id
+                self._habit_ids = {name: habit_id for name, habit_id in self._habit_ids.items()
+                                   if habit_id not in habit_ids}
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            result = compute()
+            self._entries[key] = result
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return result
+
+    def _habit_key(self, habit_name):
+        """Returns the (habit id, version) the results of a habit are keyed by, or None for unknown habits."""
+        habit_id = self._habit_ids.get(habit_name)
+        if habit_id is None:
+            row = self.db.execute('SELECT id FROM habits WHERE name = ?', (habit_name,)).fetchone()
+            if row is None:
+                return None
+            habit_id = self._habit_ids[habit_name] = row[0]
+        return habit_id, self._habit_versions.get(habit_id, 0)
+
+    def longest_streak(self, habit_name) -> int:
+        """Returns compute_longest_streak(db, habit_name), from memory if the habit has not changed since."""
+        with self._lock:
+            key = self._habit_key(habit_name)
+            if key is None:
+                return compute_longest_streak(self.db, habit_name)
+            return self._cached(('longest_streak', *key), lambda: compute_longest_streak(self.db, habit_name))
+
+    def current_streak(self, habit_name, today=None) -> int:
+        """Returns compute_current_streak(db, habit_name, today), from memory if the habit has not changed since."""
+        today = today or date.today()
+        with self._lock:
+            key = self._habit_key(habit_name)
+            if key is None:
+                return compute_current_streak(self.db, habit_name, today)
+            return self._cached(('current_streak', *key, today),
+                                lambda: compute_current_streak(self.db, habit_name, today))
+
+    def longest_streaks(self) -> dict:
+        """Returns compute_longest_streaks(db), from memory if nothing was written since."""
+        with self._lock:
+            return dict(self._cached(('longest_streaks', self._data_version), lambda: compute_longest_streaks(self.db)))
+
+    def habits_by_periodicity(self, periodicity) -> list:
+        """Returns fetch_habits_by_periodicity(db, periodicity), from memory if no habit was added or removed since."""
+        with self._lock:
+            return list(self._cached(('habits_by_periodicity', periodicity, self._catalog_version),
+                                     lambda: fetch_habits_by_periodicity(self.db, periodicity)))
+
+    def stats(self) -> dict:
+        """
+        Returns the cache's effectiveness figures.
+
+        Returns:
+            dict: hits, misses, evictions, the number of cached entries and the hit rate (0.0 to 1.0).
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Drops every cached result, e.g. after writes the cache could not see."""
+        with self._lock:
+            self._entries.clear()
+            self._habit_ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        """Stops following the connection's writes."""
+        remove_write_listener(self._on_write)
@@ -0,0 +1,144 @@
+from counter import HabitTracker, add_write_listener, remove_write_listener
+from db import get_habit_tracker
+
+
+class HabitCatalog:
+    """An in-memory index of all habits of one database connection, kept in sync with its writes.
+
+    Lookups by name or id and periodicity filters are answered from memory. Habits saved or
+    deleted through HabitTracker on the same connection are added to or removed from the
+    catalog automatically.
+
+    Attributes:
+        db: The database connection the catalog mirrors.
+        hits (int): The number of lookups answered from memory.
+        misses (int): The number of lookups that had to query the database.
+
+    Methods:
+        reload(): Re-reads all habits from the database.
+        get(name): Returns the HabitTracker with the given name.
+        get_by_id(habit_id): Returns the HabitTracker with the given id.
+        names(): Returns the names of all habits.
+        names_by_periodicity(periodicity): Returns the names of habits with the given periodicity.
+        close(): Stops following the connection's writes.
+    """
+
+    def __init__(self, db) -> None:
+        """
+        Loads every habit of the database and starts following its writes.
+
+        Args:
+            db: The database connection object.
+        """
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+        self._by_name = {}
+        self._by_id = {}
+        self._by_periodicity = {}
+        self.reload()
+        add_write_listener(self._on_write)
+
+    def reload(self) -> None:
+        """Re-reads all habits from the database, replacing the cached ones."""
+        cursor = self.db.cursor()
+        cursor.execute('SELECT id, name, description, periodicity, creation_date FROM habits ORDER BY id')
+        self._by_name.clear()
+        self._by_id.clear()
+        self._by_periodicity.clear()
+        for row in cursor.fetchall():
+            self._add(HabitTracker.from_row(row))
+
+    def _add(self, tracker) -> None:
+        self._by_name[tracker.name] = tracker
+        self._by_id[tracker.habit_id] = tracker
+        self._by_periodicity.setdefault(tracker.periodicity, {})[tracker.name] = tracker
+
+    def _discard(self, habit_id) -> None:
+        tracker = self._by_id.pop(habit_id, None)
+        if tracker is not None and self._by_name.get(tracker.name) is tracker:
+            del self._by_name[tracker.name]
+            del self._by_periodicity[tracker.periodicity][tracker.name]
+
+    def _on_write(self, db, event, habit_ids, tracker) -> None:
+        if db is not self.db:
+            return
+        if event == 'saved':
+            self._add(tracker)
+        elif event == 'deleted':
+            for habit_id in habit_ids:
+                self._discard(habit_id)
+
+    def get(self, name):
+        """
+        Returns the habit with the given name.
+
+        Names missing from memory are looked up in the database once, in case the habit was
+        created through another connection.
+
+        Args:
+            name: The name of the habit.
+
+        Returns:
+            HabitTracker: The habit tracker if found, otherwise None.
+        """
+        tracker = self._by_name.get(name)
+        if tracker is not None:
+            self.hits += 1
+            return tracker
+        self.misses += 1
+        tracker = get_habit_tracker(self.db, name)
+        if tracker is not None:
+            self._add(tracker)
+        return tracker
+
+    def get_by_id(self, habit_id):
+        """
+        Returns the habit with the given id.
+
+        Args:
+            habit_id: The id of the habit.
+
+        Returns:
+            HabitTracker: The habit tracker if found, otherwise None.
+        """
+        tracker = self._by_id.get(habit_id)
+        if tracker is not None:
+            self.hits += 1
+            return tracker
+        self.misses += 1
+        cursor = self.db.cursor()
+        cursor.execute('SELECT name FROM habits WHERE id = ?', (habit_id,))
+        row = cursor.fetchone()
+        tracker = get_habit_tracker(self.db, row[0]) if row else None
+        if tracker is not None:
+            self._add(tracker)
+        return tracker
+
+    def names(self) -> list:
+        """Returns the names of all habits, in the order they were loaded or created."""
+        self.hits += 1
+        return list(self._by_name)
+
+    def names_by_periodicity(self, periodicity) -> list:
+        """
+        Returns the names of habits with a specific periodicity.
+
+        Args:
+            periodicity: The periodicity to filter by (e.g., 'Daily', 'Weekly').
+
+        Returns:
+            list: A list of habit names matching the periodicity.
+        """
+        self.hits += 1
+        return list(self._by_periodicity.get(periodicity, ()))
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, name) -> bool:
+        return self.get(name) is not None
+
+    def close(self) -> None:
+        """Stops following the connection's writes."""
+        remove_write_listener(self._on_write)
@@ -1,4 +1,41 @@
-from datetime import datetime
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from rollups import clear_rollups, record_rollups
+from storage import epoch_seconds, progress_columns, progress_row
+from streaks import (fetch_periodicities, forget_streak, period_of, record_completion_batch, record_completions,
+                     reset_streak)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_CHUNK_SIZE = 5000  # Rows handed to a single executemany call during bulk logging
+ID_CHUNK_SIZE = 500  # Habit ids per IN (...) list, below the 999 parameters older SQLite versions allow
+
+# Callables notified after every committed write made through this module, see add_write_listener
+_write_listeners = []
+
+
+def add_write_listener(listener) -> None:
+    """
+    Registers a callable that is notified after every committed write made through this module.
+
+    Args:
+        listener: Called as listener(db, event, habit_ids, tracker), where event is one of 'saved',
+                  'logged', 'cleared' or 'deleted', habit_ids is the set of affected habit ids and
+                  tracker is the HabitTracker that made the change (None for the bulk functions).
+    """
+    _write_listeners.append(listener)
+
+
+def remove_write_listener(listener) -> None:
+    """Unregisters a callable previously passed to add_write_listener."""
+    _write_listeners.remove(listener)
+
+
+def notify_write_listeners(db, event, habit_ids, tracker=None) -> None:
+    """Notifies every registered write listener of a committed write, for writers outside this module."""
+    for listener in list(_write_listeners):
+        listener(db, event, habit_ids, tracker)
 
 class HabitTracker:
     """Represents a habit to be tracked, along with its progress over time.
@@ -13,10 +50,14 @@ class HabitTracker:
     Methods:
         save_to_database(database): Saves the habit details to the provided database.
         log_progress(database, timestamp=None): Logs a completion of the habit at the given or current time.
+        log_progress_many(database, timestamps, chunk_size): Logs many completions in a single transaction.
+        from_row(row): Creates a HabitTracker from a stored habits row.
         clear_history(database): Removes all completion records for the habit.
         delete_from_database(database): Deletes the habit and all associated completion records.
     """
 
+    __slots__ = ('habit_id', 'name', 'description', 'periodicity', 'creation_date')
+
     def __init__(self, name: str, description: str, periodicity: str, habit_id: int = None) -> None:
         """
         Initializes a new HabitTracker instance.
@@ -31,7 +72,22 @@ class HabitTracker:
         self.name = name
         self.description = description
         self.periodicity = periodicity
-        self.creation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.creation_date = datetime.now().strftime(TIMESTAMP_FORMAT)
+
+    @classmethod
+    def from_row(cls, row) -> "HabitTracker":
+        """
+        Creates a HabitTracker from a stored habits row without recomputing any of its values.
+
+        Args:
+            row: The (id, name, description, periodicity, creation_date) columns of a habits row.
+
+        Returns:
+            HabitTracker: The habit tracker for the row.
+        """
+        tracker = cls.__new__(cls)
+        tracker.habit_id, tracker.name, tracker.description, tracker.periodicity, tracker.creation_date = row
+        return tracker
 
     def save_to_database(self, db):
         """
@@ -50,8 +106,9 @@ class HabitTracker:
         )
         db.commit()
         self.habit_id = cursor.lastrowid  # Retrieve the auto-generated ID
+        notify_write_listeners(db, 'saved', {self.habit_id}, self)
 
-    def log_progress(self, db, tracked_at: datetime = None) -> None:
+    def log_progress(self, db, tracked_at: datetime = None) -> bool:
         """
         Logs progress for the habit on a specific date and time.
 
@@ -59,6 +116,10 @@ class HabitTracker:
             db: The database connection object.
             tracked_at: (Optional) The datetime when the progress was made.
                         Defaults to the current datetime if not provided.
+
+        Returns:
+            bool: True if the completion was logged, False if the database keeps one completion
+                  per period (see dedup.py) and the habit's period was already completed.
         """
         if self.habit_id is None:  # Check if habit is saved before logging
             raise ValueError("Habit must be saved to the database before logging progress.")
@@ -66,14 +127,41 @@ class HabitTracker:
         cursor = db.cursor()
         tracked_at = tracked_at or datetime.now()  # Use current time if not provided
 
+        period = period_of(tracked_at, self.periodicity)
+        row = progress_row(self.habit_id, tracked_at, TIMESTAMP_FORMAT)
         cursor.execute(
             """
-            INSERT INTO progress_log (habit_id, tracked_at)
-            VALUES (?, ?)
+            INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal, period_key)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
             """,
-            (self.habit_id, tracked_at.strftime("%Y-%m-%d %H:%M:%S")),
+            (*row, period),
         )
+        if cursor.rowcount == 0:
+            db.commit()
+            return False
+        record_completions(cursor, self.habit_id, [period])
+        record_rollups(cursor, [(self.habit_id, row[3])])
         db.commit()
+        notify_write_listeners(db, 'logged', {self.habit_id}, self)
+        return True
+
+    def log_progress_many(self, db, timestamps, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """
+        Logs many completions for the habit at once, e.g. when importing history from another app.
+
+        Args:
+            db: The database connection object.
+            timestamps: An iterable of datetimes at which the habit was completed.
+            chunk_size: (Optional) The number of rows inserted per executemany call.
+
+        Returns:
+            int: The number of completions logged.
+        """
+        if self.habit_id is None:  # Check if habit is saved before logging
+            raise ValueError("Habit must be saved to the database before logging progress.")
+
+        return log_progress_bulk(db, ((self.habit_id, tracked_at) for tracked_at in timestamps), chunk_size, self)
 
     def clear_progress(self, db) -> None:
         """
@@ -85,15 +173,7 @@ class HabitTracker:
         if self.habit_id is None:  # Check if habit is saved before clearing
             raise ValueError("Habit must be saved to the database before clearing progress.")
 
-        cursor = db.cursor()
-        cursor.execute(
-            """
-            DELETE FROM progress_log
-            WHERE habit_id = ?
-            """,
-            (self.habit_id,),
-        )
-        db.commit()
+        clear_progress_bulk(db, [self.habit_id], self)
 
     def delete_from_database(self, db) -> None:
         """
@@ -105,7 +185,247 @@ class HabitTracker:
         if self.habit_id is None:  # Check if habit is saved before deleting
             raise ValueError("Habit must be saved to the database before deleting.")
 
-        cursor = db.cursor()
-        cursor.execute("DELETE FROM habits WHERE id = ?", (self.habit_id,))
-        cursor.execute("DELETE FROM progress_log WHERE habit_id = ?", (self.habit_id,))
+        delete_habits_bulk(db, [self.habit_id], self)
+
+
+def log_progress_bulk(db, entries, chunk_size: int = DEFAULT_CHUNK_SIZE, tracker=None) -> int:
+    """
+    Logs completions for any number of habits in a single transaction.
+
+    The entries are consumed lazily and written in chunks with executemany, so arbitrarily
+    large histories can be streamed in without building them in memory first. Either all
+    entries are stored or, if anything fails, none of them are. If the database keeps one
+    completion per period (see dedup.py), entries in periods already completed are skipped.
+
+    Args:
+        db: The database connection object.
+        entries: An iterable of (habit_id, tracked_at) pairs, where tracked_at is a datetime.
+        chunk_size: (Optional) The number of rows inserted per executemany call.
+        tracker: (Optional) The HabitTracker logging its own history, passed on to write listeners.
+
+    Returns:
+        int: The number of completions logged, not counting skipped ones.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+
+    cursor = db.cursor()
+    entries = iter(entries)
+    habit_ids = set()
+    total = 0
+    try:
+        while True:
+            chunk = list(islice(entries, chunk_size))
+            if not chunk:
+                break
+            periodicities = fetch_periodicities(cursor, {habit_id for habit_id, _ in chunk})
+            rows = [
+                (*progress_row(habit_id, tracked_at, TIMESTAMP_FORMAT),
+                 period_of(tracked_at, periodicities[habit_id]) if habit_id in periodicities else None)
+                for habit_id, tracked_at in chunk
+            ]
+            last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM progress_log').fetchone()[0]
+            cursor.executemany(
+                """
+                INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal, period_key)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+                """,
+                rows,
+            )
+            if cursor.rowcount == len(rows):
+                days = [(row[0], row[3]) for row in rows]
+            else:  # Some periods were already completed; the rows that were inserted got the new ids
+                days = cursor.execute('SELECT habit_id, day_ordinal FROM progress_log WHERE id > ?',
+                                      (last_id,)).fetchall()
+                chunk = [(habit_id, date.fromordinal(day_ordinal)) for habit_id, day_ordinal in days]
+            if chunk:
+                record_completion_batch(cursor, chunk, periodicities)
+                record_rollups(cursor, days)
+            habit_ids.update(habit_id for habit_id, _ in chunk)
+            total += len(chunk)
         db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if habit_ids:
+        notify_write_listeners(db, 'logged', habit_ids, tracker)
+    return total
+
+
+def _id_chunks(habit_ids):
+    """Yields the distinct habit ids in sorted lists of up to ID_CHUNK_SIZE, with their IN (...) placeholders."""
+    habit_ids = sorted(set(habit_ids))
+    for start in range(0, len(habit_ids), ID_CHUNK_SIZE):
+        chunk = habit_ids[start:start + ID_CHUNK_SIZE]
+        yield chunk, ', '.join('?' * len(chunk))
+
+
+def delete_habits_bulk(db, habit_ids, tracker=None) -> int:
+    """
+    Deletes any number of habits with all their progress logs, streaks and rollups in a single transaction.
+
+    With foreign keys enforced (see db.CONNECTION_PRAGMAS), deleting the habits rows cascades to
+    their progress logs and streaks through the habit_id indexes. The rollups are cleared first,
+    once per chunk of ids, to keep the totals over all habits right. On connections without
+    enforcement the other dependent rows are deleted explicitly, so nothing is left behind either way.
+
+    Args:
+        db: The database connection object.
+        habit_ids: An iterable of habit ids. Ids of habits that do not exist are ignored.
+        tracker: (Optional) The HabitTracker deleting itself, passed on to write listeners.
+
+    Returns:
+        int: The number of habits deleted.
+    """
+    cursor = db.cursor()
+    cascades = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+    deleted = set()
+    try:
+        for chunk, placeholders in _id_chunks(habit_ids):
+            clear_rollups(cursor, chunk)  # Also takes the habits' counts off the totals
+            if not cascades:
+                cursor.execute(f'DELETE FROM progress_log WHERE habit_id IN ({placeholders})', chunk)
+                for habit_id in chunk:
+                    forget_streak(cursor, habit_id)
+            cursor.execute(f'DELETE FROM habits WHERE id IN ({placeholders}) RETURNING id', chunk)
+            deleted.update(row[0] for row in cursor.fetchall())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if deleted:
+        notify_write_listeners(db, 'deleted', deleted, tracker)
+    return len(deleted)
+
+
+def clear_progress_bulk(db, habit_ids, tracker=None) -> int:
+    """
+    Clears the progress logs of any number of habits in a single transaction, keeping the habits.
+
+    Args:
+        db: The database connection object.
+        habit_ids: An iterable of habit ids. Ids of habits that do not exist are ignored.
+        tracker: (Optional) The HabitTracker clearing its own history, passed on to write listeners.
+
+    Returns:
+        int: The number of completions removed.
+    """
+    cursor = db.cursor()
+    cleared = set()
+    removed = 0
+    try:
+        for chunk, placeholders in _id_chunks(habit_ids):
+            cursor.execute(f'SELECT id FROM habits WHERE id IN ({placeholders})', chunk)
+            existing = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'DELETE FROM progress_log WHERE habit_id IN ({placeholders})', chunk)
+            removed += cursor.rowcount
+            for habit_id in existing:
+                reset_streak(cursor, habit_id)
+            if existing:
+                clear_rollups(cursor, existing)
+            cleared.update(existing)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if cleared:
+        notify_write_listeners(db, 'cleared', cleared, tracker)
+    return removed
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class CompletionLog:
+    """The completion times of one habit, held compactly in memory for analytics.
+
+    Timestamps are stored as whole seconds since 1970-01-01 in an array('q') (8 bytes each)
+    instead of one datetime object per completion. Like tracked_at, they are wall-clock times
+    without a time zone.
+
+    Attributes:
+        habit_id (int): The id of the habit the completions belong to.
+        timestamps (array): The completion times as epoch seconds, in the order they were added.
+
+    Methods:
+        load(database, habit_id): Reads a habit's completions from the database.
+        load_all(database): Reads the completions of every habit in a single query.
+        append(tracked_at): Adds a completion.
+        day_ordinals(): Returns the date ordinal of every completion.
+    """
+
+    __slots__ = ('habit_id', 'timestamps')
+
+    def __init__(self, habit_id: int, timestamps=()) -> None:
+        """
+        Initializes a CompletionLog.
+
+        Args:
+            habit_id: The id of the habit.
+            timestamps: (Optional) Completion times as epoch seconds.
+        """
+        self.habit_id = habit_id
+        self.timestamps = array('q', timestamps)
+
+    @classmethod
+    def load(cls, db, habit_id: int) -> "CompletionLog":
+        """
+        Reads the completions of one habit from the database, oldest first.
+
+        Args:
+            db: The database connection object.
+            habit_id: The id of the habit.
+
+        Returns:
+            CompletionLog: The habit's completions.
+        """
+        return cls.load_all(db, habit_id).get(habit_id) or cls(habit_id)
+
+    @classmethod
+    def load_all(cls, db, habit_id: int = None) -> dict:
+        """
+        Reads the completions of every habit (or of one habit) in a single ordered query.
+
+        Args:
+            db: The database connection object.
+            habit_id: (Optional) Restricts the result to this habit.
+
+        Returns:
+            dict: A CompletionLog per habit id that has any completions.
+        """
+        condition, parameters = ('WHERE habit_id = ?', (habit_id,)) if habit_id is not None else ('', ())
+        cursor = db.cursor()
+        columns = progress_columns(cursor)
+        cursor.execute(
+            f"""
+            SELECT habit_id, {columns.epoch}
+            FROM progress_log
+            {condition}
+            ORDER BY habit_id, {columns.order}
+            """,
+            parameters,
+        )
+        logs = {}
+        for row_habit_id, seconds in cursor:
+            log = logs.get(row_habit_id)
+            if log is None:
+                log = logs[row_habit_id] = cls(row_habit_id)
+            log.timestamps.append(seconds)
+        return logs
+
+    def append(self, tracked_at: datetime) -> None:
+        """Adds a completion at the given datetime."""
+        self.timestamps.append(epoch_seconds(tracked_at))
+
+    def day_ordinals(self) -> array:
+        """Returns the date ordinal (see datetime.date.toordinal) of every completion."""
+        offset = EPOCH.toordinal()
+        return array('I', (seconds // 86400 + offset for seconds in self.timestamps))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self):
+        """Yields the completions as datetimes."""
+        return (EPOCH + timedelta(seconds=seconds) for seconds in self.timestamps)
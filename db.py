@@ -1,14 +1,68 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+
 from counter import HabitTracker  # Import the HabitTracker class
+from dedup import add_period_keys
+from profiling import ProfiledConnection
+from rollups import create_rollup_tables, create_totals_table, refresh_all_rollups, refresh_totals
+from storage import (DEFAULT_BATCH_SIZE, add_integer_columns, forget_progress_columns, iter_rows, progress_columns,
+                     time_range_condition)
+from streaks import refresh_all_streaks
+
+DATABASE_PATH = os.environ.get('HABITS_DB', 'habits.db')  # Override with the HABITS_DB environment variable
+TIME_WINDOW_INDEX = 'idx_progress_log_day_epoch'
+
+# Applied to every connection: write-ahead logging lets readers proceed while a write is in progress,
+# and with WAL, synchronous=NORMAL only syncs at checkpoints instead of on every commit.
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,       # 32 MB page cache per connection
+    'mmap_size': 268435456,     # Read pages through a 256 MB memory map
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # Wait up to 5 s for a lock instead of failing immediately
+    'foreign_keys': 'ON',       # Deleting a habit cascades to its completions and streak
+}
+
+def configure_connection(connection, **overrides):
+    """
+    Applies the performance settings in CONNECTION_PRAGMAS to a connection.
+
+    Args:
+        connection: The database connection object.
+        overrides: PRAGMA values that replace or extend the defaults.
+
+    Returns:
+        sqlite3.Connection: The same connection, for chaining.
+    """
+    for pragma, value in {**CONNECTION_PRAGMAS, **overrides}.items():
+        connection.execute(f'PRAGMA {pragma} = {value}')
+    return connection
 
-def initialize_database():
+def initialize_database(path=DATABASE_PATH, check_same_thread=True, profiler=None):
     """
     Sets up the database connection and creates the necessary tables if they don't exist.
 
+    Args:
+        path: (Optional) The location of the SQLite database file.
+        check_same_thread: (Optional) Set to False to allow using the connection from other threads.
+        profiler: (Optional) A profiling.QueryProfiler that records every statement run on the connection.
+
     Returns:
         sqlite3.Connection: The database connection object.
     """
-    connection = sqlite3.connect('habits.db')  # Using a different database name
+    if profiler is None:
+        connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+    else:
+        connection = sqlite3.connect(path, check_same_thread=check_same_thread, factory=ProfiledConnection)
+        connection.attach(profiler)
+    # Only takes effect on a new, empty database, and has to precede the switch to WAL;
+    # existing databases are converted by retention.compact_database
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    connection = configure_connection(connection)
     cursor = connection.cursor()
 
     # Create habits table
@@ -33,8 +87,316 @@ def initialize_database():
     ''')
 
     connection.commit()
+    migrate_database(connection)
     return connection
 
+def _add_lookup_indexes(cursor):
+    """
+    Schema version 1: indexes habit names, periodicities and each habit's completion history.
+
+    Habit names were never enforced to be unique, so duplicates are merged into the oldest
+    habit of that name (keeping all of their progress logs) before the unique index is built.
+    """
+    cursor.execute('''
+        UPDATE progress_log
+        SET habit_id = (
+            SELECT MIN(original.id)
+            FROM habits AS duplicate
+            INNER JOIN habits AS original ON original.name = duplicate.name
+            WHERE duplicate.id = progress_log.habit_id
+        )
+        WHERE habit_id NOT IN (SELECT MIN(id) FROM habits GROUP BY name)
+          AND habit_id IN (SELECT id FROM habits)
+    ''')
+    cursor.execute('DELETE FROM habits WHERE id NOT IN (SELECT MIN(id) FROM habits GROUP BY name)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_habits_name ON habits (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_habits_periodicity ON habits (periodicity)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_log_habit_tracked ON progress_log (habit_id, tracked_at)')
+
+def _add_habit_streaks(cursor):
+    """
+    Schema version 2: materializes each habit's current streak, longest streak and last completed period.
+
+    The table is kept up to date by the HabitTracker write methods; existing histories are summarized here once.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS habit_streaks (
+            habit_id INTEGER PRIMARY KEY,
+            current_streak INTEGER NOT NULL,
+            longest_streak INTEGER NOT NULL,
+            last_period INTEGER,
+            FOREIGN KEY(habit_id) REFERENCES habits(id)
+        )
+    ''')
+    refresh_all_streaks(cursor)
+
+def _recompute_streak_periods(cursor):
+    """Schema version 3: streaks count each habit's own periods, i.e. ISO weeks for weekly habits."""
+    refresh_all_streaks(cursor)
+
+def _add_integer_progress_columns(cursor):
+    """
+    Schema version 4: stores each completion as epoch seconds and a day ordinal next to the text timestamp.
+
+    Existing rows are converted afterwards by storage.convert_progress_log, without blocking the app.
+    """
+    add_integer_columns(cursor)
+
+def _add_time_window_index(cursor):
+    """
+    Schema version 5: indexes completions by time across all habits, for recent-activity queries.
+
+    The per-habit index starts with habit_id, so without this one a window over all habits
+    has to read the whole progress log. Version 10 makes the index opt-in again.
+    """
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS {TIME_WINDOW_INDEX}
+        ON progress_log (day_ordinal, tracked_epoch, habit_id)
+    ''')
+
+def _add_rollups(cursor):
+    """Schema version 6: per-habit completion counts per day and per ISO week (see rollups.py), filled from the log."""
+    create_rollup_tables(cursor)
+    refresh_all_rollups(cursor)
+
+def _rebuild_table(cursor, table, definition):
+    """
+    Replaces a table by one with a new definition, keeping its rows, indexes and triggers.
+
+    SQLite cannot add constraints to an existing table, so the rows are copied into a new one.
+    Rows of habits that no longer exist are left behind.
+    """
+    extras = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+    cursor.execute(f'CREATE TABLE {table}_rebuilt {definition}')
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table}_rebuilt)').fetchall()]
+    cursor.execute(f'''
+        INSERT INTO {table}_rebuilt ({', '.join(columns)})
+        SELECT {', '.join(f'{table}.{column}' for column in columns)}
+        FROM {table} INNER JOIN habits ON habits.id = {table}.habit_id
+    ''')
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {table}_rebuilt RENAME TO {table}')
+    for (sql,) in extras:
+        cursor.execute(sql)
+
+def _add_delete_cascades(cursor):
+    """
+    Schema version 7: rows that belong to a habit are deleted together with it (ON DELETE CASCADE).
+
+    Completions of habits that had already been deleted, left behind by interrupted deletes or
+    by other tools, are dropped in the process.
+    """
+    _rebuild_table(cursor, 'progress_log', '''(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+        tracked_at TEXT NOT NULL,
+        tracked_epoch INTEGER,
+        day_ordinal INTEGER
+    )''')
+    _rebuild_table(cursor, 'habit_streaks', '''(
+        habit_id INTEGER PRIMARY KEY REFERENCES habits (id) ON DELETE CASCADE,
+        current_streak INTEGER NOT NULL,
+        longest_streak INTEGER NOT NULL,
+        last_period INTEGER
+    )''')
+    _rebuild_table(cursor, 'daily_rollups', '''(
+        habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+        day_ordinal INTEGER NOT NULL,
+        completions INTEGER NOT NULL,
+        PRIMARY KEY (habit_id, day_ordinal)
+    ) WITHOUT ROWID''')
+    _rebuild_table(cursor, 'weekly_rollups', '''(
+        habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+        week INTEGER NOT NULL,
+        completions INTEGER NOT NULL,
+        PRIMARY KEY (habit_id, week)
+    ) WITHOUT ROWID''')
+
+def _add_period_keys(cursor):
+    """
+    Schema version 8: stores the period (day or ISO week) of each completion, for the opt-in
+    one-completion-per-period mode in dedup.py.
+    """
+    add_period_keys(cursor)
+
+def _add_rollup_totals(cursor):
+    """
+    Schema version 9: completion counts per day summed over all habits, which replace the
+    indexes of the rollup tables by day and by week (see rollups.create_totals_table).
+    """
+    cursor.execute('DROP INDEX IF EXISTS idx_daily_rollups_day')
+    cursor.execute('DROP INDEX IF EXISTS idx_weekly_rollups_week')
+    create_totals_table(cursor)
+    refresh_totals(cursor)
+
+def _drop_time_window_index(cursor):
+    """
+    Schema version 10: makes the time index of version 5 opt-in (see enable_time_window_index).
+
+    Every completion lands in it next to the completions of all other habits on that day, so it
+    costs each log an extra scattered write and makes clearing or deleting a habit touch a page
+    per day of its history. Only fetch_completions_between reads it.
+    """
+    cursor.execute(f'DROP INDEX IF EXISTS {TIME_WINDOW_INDEX}')
+
+def _drop_rollup_cascades(cursor):
+    """
+    Schema version 11: the rollup tables no longer reference the habits table.
+
+    counter.py clears a habit's rollups itself before deleting it, since the totals over all habits
+    have to be reduced by them anyway. A declared foreign key made each of those deletes about
+    seven times slower, as SQLite can then no longer delete the habit's rows in a single pass.
+    """
+    _rebuild_table(cursor, 'daily_rollups', '''(
+        habit_id INTEGER NOT NULL,
+        day_ordinal INTEGER NOT NULL,
+        completions INTEGER NOT NULL,
+        PRIMARY KEY (habit_id, day_ordinal)
+    ) WITHOUT ROWID''')
+    _rebuild_table(cursor, 'weekly_rollups', '''(
+        habit_id INTEGER NOT NULL,
+        week INTEGER NOT NULL,
+        completions INTEGER NOT NULL,
+        PRIMARY KEY (habit_id, week)
+    ) WITHOUT ROWID''')
+
+# Schema migrations in the order they are applied. PRAGMA user_version stores how many of them
+# a database has already received, so each one runs exactly once per database file.
+MIGRATIONS = [
+    _add_lookup_indexes,
+    _add_habit_streaks,
+    _recompute_streak_periods,
+    _add_integer_progress_columns,
+    _add_time_window_index,
+    _add_rollups,
+    _add_delete_cascades,
+    _add_period_keys,
+    _add_rollup_totals,
+    _drop_time_window_index,
+    _drop_rollup_cascades,
+]
+
+def migrate_database(db):
+    """
+    Upgrades the database schema in place to the latest version.
+
+    Every pending migration runs in its own transaction together with the version bump, so an
+    interrupted upgrade leaves the database at the last fully applied version.
+
+    Args:
+        db: The database connection object.
+
+    Returns:
+        int: The schema version of the database after migrating.
+    """
+    cursor = db.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            forget_progress_columns(db)  # Migrations rebuild the indexes the storage format is told apart by
+        version = number
+    return version
+
+class ConnectionManager:
+    """Hands out database connections to several threads sharing one database file.
+
+    All writes go through a single writer connection, serialized by a lock, since SQLite allows
+    only one writer at a time anyway. Reads use a small pool of separate read-only connections,
+    which in WAL mode never wait for the writer.
+
+    Attributes:
+        path (str): The location of the SQLite database file.
+        readers (int): The maximum number of read connections.
+
+    Methods:
+        writer(): Context manager yielding the writer connection.
+        reader(): Context manager yielding a pooled read-only connection.
+        close(): Closes all connections.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, readers: int = 4) -> None:
+        """
+        Opens the writer connection and brings the schema up to date.
+
+        Args:
+            path: (Optional) The location of the SQLite database file. Must be a file, not ':memory:'.
+            readers: (Optional) The maximum number of read connections kept in the pool.
+        """
+        if path == ':memory:':
+            raise ValueError("ConnectionManager needs a database file shared by all connections.")
+        self.path = path
+        self.readers = readers
+        self._writer = initialize_database(path, check_same_thread=False)
+        self._writer_lock = threading.Lock()
+        self._pool = queue.LifoQueue()
+        self._opened = 0
+        self._opened_lock = threading.Lock()
+
+    def _open_reader(self):
+        # Pooled connections move between threads, but only ever serve one thread at a time. Autocommit
+        # mode keeps a failed statement from leaving a transaction (and an old snapshot) open.
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        return configure_connection(connection, query_only='ON')
+
+    @contextmanager
+    def writer(self):
+        """Yields the writer connection, holding the write lock until the block is left."""
+        with self._writer_lock:
+            yield self._writer
+
+    @contextmanager
+    def reader(self):
+        """Yields a read-only connection from the pool, opening one if the pool is not full yet."""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            with self._opened_lock:
+                can_open = self._opened < self.readers
+                if can_open:
+                    self._opened += 1
+            connection = self._open_reader() if can_open else self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def close(self) -> None:
+        """Closes the writer and every pooled read connection."""
+        with self._writer_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+def iter_habit_names(db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams the names of all habits stored in the database.
+
+    Args:
+        db: The database connection object.
+        batch_size: (Optional) The number of rows fetched per round trip.
+
+    Yields:
+        str: One habit name at a time.
+    """
+    cursor = db.cursor()
+    cursor.execute('SELECT name FROM habits')
+    for row in iter_rows(cursor, batch_size):
+        yield row[0]
+
 def fetch_all_habit_names(db):
     """
     Retrieves the names of all habits stored in the database.
@@ -45,9 +407,147 @@ def fetch_all_habit_names(db):
     Returns:
         list: A list of habit names.
     """
+    return list(iter_habit_names(db))
+
+def iter_progress(db, habit_id, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams the completions of a habit in chronological order.
+
+    Rows are fetched batch_size at a time, so only one batch is held in memory however long
+    the habit's history is. A time window is answered by a range seek on the habit's index,
+    so its cost depends on the number of completions inside the window only.
+
+    Args:
+        db: The database connection object.
+        habit_id: The id of the habit.
+        since: (Optional) Only yields completions at or after this datetime.
+        until: (Optional) Only yields completions before this datetime.
+        batch_size: (Optional) The number of rows fetched per round trip.
+
+    Yields:
+        tuple: The (tracked_epoch, day_ordinal) of each completion, i.e. its time in epoch
+        seconds and its calendar day as a date ordinal.
+    """
     cursor = db.cursor()
-    cursor.execute('SELECT name FROM habits')
-    return [row[0] for row in cursor.fetchall()]
+    columns = progress_columns(cursor)
+    window, parameters = time_range_condition(columns, since, until)
+    cursor.execute(f'''
+        SELECT {columns.epoch}, {columns.day_ordinal}
+        FROM progress_log
+        WHERE progress_log.habit_id = ? AND {window}
+        ORDER BY {columns.order}
+    ''', (habit_id, *parameters))
+    yield from iter_rows(cursor, batch_size)
+
+def iter_completion_log(db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams every completion of every habit, e.g. for an export.
+
+    Args:
+        db: The database connection object.
+        batch_size: (Optional) The number of rows fetched per round trip.
+
+    Yields:
+        tuple: The (habit name, periodicity, tracked_at) of each completion, grouped by habit
+        and in chronological order within a habit. tracked_at is the stored timestamp text.
+    """
+    cursor = db.cursor()
+    columns = progress_columns(cursor)
+    cursor.execute(f'''
+        SELECT habits.name, habits.periodicity, progress_log.tracked_at
+        FROM habits
+        INNER JOIN progress_log ON progress_log.habit_id = habits.id
+        ORDER BY habits.id, {columns.order}
+    ''')
+    yield from iter_rows(cursor, batch_size)
+
+def time_window_index_enabled(cursor):
+    """Returns whether the progress log is indexed by time across all habits."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (TIME_WINDOW_INDEX,))
+    return cursor.fetchone() is not None
+
+def enable_time_window_index(db):
+    """
+    Indexes the progress log by time across all habits, so fetch_completions_between seeks instead of scanning.
+
+    Opt-in, since every completion logged, cleared or deleted then also updates this index, on a
+    page it shares with the other habits' completions of that day: with 1000 habits and a year of
+    history, logging gets about 20% slower and clearing or deleting a habit about 2.5 times slower.
+
+    Args:
+        db: The database connection object.
+    """
+    db.cursor().execute(f'''
+        CREATE INDEX IF NOT EXISTS {TIME_WINDOW_INDEX}
+        ON progress_log (day_ordinal, tracked_epoch, habit_id)
+    ''')
+    db.commit()
+
+def disable_time_window_index(db):
+    """Drops the index of enable_time_window_index; time windows are read by scanning the log again."""
+    db.cursor().execute(f'DROP INDEX IF EXISTS {TIME_WINDOW_INDEX}')
+    db.commit()
+
+def fetch_completions_between(db, since, until=None, limit=None):
+    """
+    Retrieves the completions of all habits in a time window, e.g. for a recent-activity view.
+
+    Once the progress log is stored in integer columns (see storage.convert_progress_log) and
+    enable_time_window_index has been called, the window is read from the (day_ordinal,
+    tracked_epoch, habit_id) index, so the cost grows with the number of completions in the
+    window rather than with the size of the table. Without the index, the whole log is scanned.
+
+    Args:
+        db: The database connection object.
+        since: The earliest datetime to include.
+        until: (Optional) The datetime the window ends at (exclusive). Open-ended by default.
+        limit: (Optional) The maximum number of completions to return.
+
+    Returns:
+        list: (habit_id, tracked_epoch, day_ordinal) tuples in chronological order.
+    """
+    cursor = db.cursor()
+    columns = progress_columns(cursor)
+    window, parameters = time_range_condition(columns, since, until)
+    query = f'''
+        SELECT progress_log.habit_id, {columns.epoch}, {columns.day_ordinal}
+        FROM progress_log
+        WHERE {window}
+        ORDER BY {columns.order}
+    '''
+    if limit is not None:
+        query += ' LIMIT ?'
+        parameters += (limit,)
+    cursor.execute(query, parameters)
+    return cursor.fetchall()
+
+def fetch_habit_page(db, after_id=0, limit=50, periodicity=None):
+    """
+    Retrieves one page of habits in id order, continuing after a given habit id (keyset paging).
+
+    Unlike OFFSET paging, every page is a seek on the primary key (or the periodicity index), so
+    a page deep into the list costs the same as the first one. Pass the habit_id of the last
+    tracker of a page as after_id to get the next page.
+
+    Args:
+        db: The database connection object.
+        after_id: (Optional) Only returns habits with a greater id. 0 starts at the beginning.
+        limit: (Optional) The maximum number of habits on the page.
+        periodicity: (Optional) Only returns habits with this periodicity.
+
+    Returns:
+        list: Up to limit HabitTracker instances. Fewer than limit means this was the last page.
+    """
+    cursor = db.cursor()
+    condition, parameters = 'id > ?', (after_id,)
+    if periodicity is not None:
+        condition, parameters = 'periodicity = ? AND id > ?', (periodicity, after_id)
+    cursor.execute(
+        f'SELECT id, name, description, periodicity, creation_date FROM habits '
+        f'WHERE {condition} ORDER BY id LIMIT ?',
+        (*parameters, limit),
+    )
+    return [HabitTracker.from_row(row) for row in cursor.fetchall()]
 
 def fetch_habits_by_periodicity(db, periodicity):
     """
@@ -76,10 +576,12 @@ def get_habit_tracker(db, habit_name):
         HabitTracker: The habit tracker if found, otherwise None.
     """
     cursor = db.cursor()
-    cursor.execute('SELECT * FROM habits WHERE name = ?', (habit_name,))  # Parameterized query
+    cursor.execute(
+        'SELECT id, name, description, periodicity, creation_date FROM habits WHERE name = ?', (habit_name,)
+    )  # Parameterized query
     habit_data = cursor.fetchone()
     if habit_data:
-        return HabitTracker(*habit_data[1:])  # Create a HabitTracker instance
+        return HabitTracker.from_row(habit_data)  # Create a HabitTracker instance
     return None
 
 # ... other functions in db.py ...
@@ -0,0 +1,136 @@
+"""
+One completion per habit and period, as an opt-in mode of the progress log.
+
+Every completion records the period it falls into in period_key (the number streaks.period_of
+gives: its day for daily habits, its ISO week for weekly ones). By default a period can hold
+any number of completions. enable_unique_periods (or `python dedup.py`) removes the repeats
+from a database and adds a unique index on (habit_id, period_key). From then on the writers in
+counter.py and transfer.py skip a completion whose period is already done, so a client that
+retries a request cannot log the same completion twice.
+"""
+from counter import notify_write_listeners
+from rollups import remove_rollups
+from storage import CONVERTING_COLUMNS, progress_columns
+from streaks import period_sql
+
+UNIQUE_INDEX = 'idx_progress_log_habit_period'
+
+
+def add_period_keys(cursor):
+    """
+    Adds the period_key column and a trigger filling it for inserts that leave it out.
+
+    Rows logged before the column existed are filled by enable_unique_periods, the only
+    reader of the column.
+
+    Args:
+        cursor: A cursor on the database connection, inside the migration transaction.
+    """
+    cursor.execute('ALTER TABLE progress_log ADD COLUMN period_key INTEGER')
+    # Writers in this project fill the column themselves; this catches everything else
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS progress_log_period_key
+        AFTER INSERT ON progress_log
+        WHEN NEW.period_key IS NULL
+        BEGIN
+            UPDATE progress_log
+            SET period_key = (
+                SELECT {period_sql(CONVERTING_COLUMNS.day_ordinal)} FROM habits WHERE habits.id = NEW.habit_id
+            )
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+def unique_periods_enabled(cursor):
+    """Returns whether the database keeps a single completion per habit and period."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (UNIQUE_INDEX,))
+    return cursor.fetchone() is not None
+
+
+def enable_unique_periods(db, chunk_size=50_000):
+    """
+    Removes repeated completions and enforces a single completion per habit and period from now on.
+
+    Missing period keys are filled first, one chunk of row ids per transaction. The repeats are
+    then deleted and the unique index built in a single transaction, keeping the earliest
+    completion of every period. Streaks only count periods, so they stay the same; the rollup
+    counts are reduced by the deleted completions.
+
+    Args:
+        db: The database connection object.
+        chunk_size: (Optional) The number of row ids covered by each transaction filling period keys.
+
+    Returns:
+        int: The number of completions removed.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+
+    cursor = db.cursor()
+    columns = progress_columns(cursor)
+    first, last = cursor.execute('SELECT MIN(id), MAX(id) FROM progress_log WHERE period_key IS NULL').fetchone()
+    start = first
+    while start is not None and start <= last:
+        cursor.execute(
+            f'''
+            UPDATE progress_log
+            SET period_key = (SELECT {period_sql(columns.day_ordinal)} FROM habits WHERE habits.id = progress_log.habit_id)
+            WHERE id BETWEEN ? AND ? AND period_key IS NULL
+            ''',
+            (start, start + chunk_size - 1),
+        )
+        db.commit()
+        start += chunk_size
+
+    try:
+        cursor.execute(f'''
+            DELETE FROM progress_log
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY habit_id, period_key ORDER BY {columns.epoch}, id
+                    ) AS position
+                    FROM progress_log
+                    WHERE period_key IS NOT NULL
+                )
+                WHERE position > 1
+            )
+            RETURNING habit_id, {columns.day_ordinal}
+        ''')
+        removed = cursor.fetchall()
+        remove_rollups(cursor, removed)
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON progress_log (habit_id, period_key)')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if removed:
+        notify_write_listeners(db, 'cleared', {habit_id for habit_id, _ in removed})
+    return len(removed)
+
+
+def disable_unique_periods(db):
+    """Allows any number of completions per period again. Completions removed before are not restored."""
+    db.execute(f'DROP INDEX IF EXISTS {UNIQUE_INDEX}')
+    db.commit()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import DATABASE_PATH, initialize_database
+
+    parser = argparse.ArgumentParser(description="Keeps a single completion per habit and period.")
+    parser.add_argument('--disable', action='store_true', help='allow repeated completions again')
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file (default: %(default)s)')
+    args = parser.parse_args()
+
+    db = initialize_database(args.database)
+    if args.disable:
+        disable_unique_periods(db)
+        print("Repeated completions within a period are allowed again.")
+    else:
+        print(f"Removed {enable_unique_periods(db)} repeated completions; "
+              "each habit now keeps one completion per period.")
+    db.close()
@@ -1,13 +1,166 @@
-import questionary
+"""
+Habit tracker command-line interface.
 
-from analyse import compute_longest_streak
+Without arguments, the interactive menu starts. Subcommands run a single action without any
+prompts, for scripts and cron jobs:
+
+    python main.py log "Study"
+    python main.py list --periodicity Weekly
+    python main.py streak "Study"
+    python main.py export --output completions.csv
+    python main.py --snapshot streak
+
+With --snapshot, streak and listing queries are answered from snapshot.AnalyticsSnapshot, kept
+in a file next to the database and mapped into memory instead of being read from SQLite.
+
+questionary (and prompt_toolkit below it) is only imported by the interactive menu, so the
+subcommands start without paying for it.
+"""
+import argparse
+import csv
+import os
+import sys
+from contextlib import nullcontext
+from datetime import datetime
+
+from analyse import compute_current_streak, compute_longest_streak, compute_longest_streaks, longest_streak_leader
+from cache import QueryCache
+from catalog import HabitCatalog
 from counter import HabitTracker
-from db import initialize_database, fetch_habits_by_periodicity, fetch_all_habit_names, get_habit_tracker
+from db import DATABASE_PATH, fetch_habit_page, get_habit_tracker, initialize_database, iter_completion_log
+from profiling import QueryProfiler
+from snapshot import AnalyticsSnapshot
+
+PAGE_SIZE = 20  # Habits listed per page
+
+
+def build_parser():
+    """Builds the argument parser for the subcommands."""
+    parser = argparse.ArgumentParser(description="Track daily and weekly habits. Starts the interactive menu "
+                                                 "when no command is given.")
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file (default: %(default)s)')
+    parser.add_argument('--snapshot', action='store_true', help='answer streak and listing queries from an in-memory '
+                                                                'snapshot saved next to the database')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    log = commands.add_parser('log', help='record a completion of a habit')
+    log.add_argument('name', help='the name of the habit')
+    log.add_argument('--at', type=datetime.fromisoformat, help='when it was completed, e.g. "2024-10-07 08:30" '
+                                                              '(default: now)')
+
+    listing = commands.add_parser('list', help='list the tracked habits')
+    listing.add_argument('--periodicity', choices=["Daily", "Weekly"], help='only list habits of this periodicity')
+
+    streak = commands.add_parser('streak', help='show streaks of one habit, or the longest streak of every habit')
+    streak.add_argument('name', nargs='?', help='the name of the habit')
+
+    export = commands.add_parser('export', help='write all completions as CSV')
+    export.add_argument('--output', help='the file to write to (default: standard output)')
+    return parser
 
 
-def cli():
-    """Main function for the command-line interface."""
-    db = initialize_database()
+def cli(argv=None):
+    """
+    Main function for the command-line interface.
+
+    Args:
+        argv: (Optional) The command-line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)  # Exits on --help or invalid arguments, before opening the database
+    profile_path = os.environ.get('HABITS_PROFILE')  # Set to a file name to record a query profile
+    profiler = QueryProfiler() if profile_path else None
+    db = initialize_database(args.database, profiler=profiler)
+    args.snapshot = AnalyticsSnapshot.open(db) if args.snapshot else None
+    try:
+        if args.command is None:
+            catalog = HabitCatalog(db)  # Habit names and trackers are served from memory from here on
+            menu_loop(db, catalog, profiler, args.snapshot if args.snapshot is not None else QueryCache(db),
+                      args.snapshot)
+            return 0
+        with profiler.action(args.command) if profiler else nullcontext():
+            return COMMANDS[args.command](db, args)
+    finally:
+        if args.snapshot is not None:
+            if args.snapshot.changed:
+                args.snapshot.save()  # So the next session can map it instead of rebuilding it
+            args.snapshot.close()
+        db.close()
+        if profiler is not None:
+            profiler.write_json(profile_path)
+            print(profiler.summary(), file=sys.stderr)
+            print(f"Profile written to {profile_path}.", file=sys.stderr)
+
+
+def log_command(db, args):
+    """Logs a completion of the named habit."""
+    tracker = get_habit_tracker(db, args.name)
+    if tracker is None:
+        print(f"No habit named '{args.name}'.", file=sys.stderr)
+        return 1
+    if tracker.log_progress(db, args.at):
+        print(f"Habit '{args.name}' incremented!")
+    else:
+        print(f"Habit '{args.name}' was already completed for this period.")
+    return 0
+
+
+def list_command(db, args):
+    """Prints the names of all habits, or of those with the given periodicity."""
+    list_habits(db, args.periodicity, interactive=False, snapshot=args.snapshot)
+    return 0
+
+
+def streak_command(db, args):
+    """Prints the current and longest streak of a habit, or the longest streak of every habit."""
+    snapshot = args.snapshot
+    if args.name is None:
+        streaks = snapshot.longest_streaks() if snapshot is not None else compute_longest_streaks(db)
+        for name, streak in streaks.items():
+            print(f"{name}\t{streak}")
+        return 0
+    known = args.name in snapshot if snapshot is not None else get_habit_tracker(db, args.name) is not None
+    if not known:
+        print(f"No habit named '{args.name}'.", file=sys.stderr)
+        return 1
+    if snapshot is not None:
+        print(f"Current streak: {snapshot.current_streak(args.name)}")
+        print(f"Longest streak: {snapshot.longest_streak(args.name)}")
+    else:
+        print(f"Current streak: {compute_current_streak(db, args.name)}")
+        print(f"Longest streak: {compute_longest_streak(db, args.name)}")
+    return 0
+
+
+def export_command(db, args):
+    """Writes every completion as a CSV row of habit name, periodicity and timestamp."""
+    with open(args.output, 'w', newline='') if args.output else nullcontext(sys.stdout) as file:
+        writer = csv.writer(file)
+        writer.writerow(['habit', 'periodicity', 'tracked_at'])
+        writer.writerows(iter_completion_log(db))
+    return 0
+
+
+COMMANDS = {
+    'log': log_command,
+    'list': list_command,
+    'streak': streak_command,
+    'export': export_command,
+}
+
+
+def menu_loop(db, catalog, profiler=None, cache=None, snapshot=None):
+    """
+    Shows the main menu until the user exits, timing each action if a profiler is given.
+
+    With a snapshot, habit listings are answered from it as well.
+    """
+    import questionary
+
+    if cache is None:
+        cache = QueryCache(db)  # Repeated analyses are answered from memory until a habit changes
 
     while not questionary.confirm("Hi User! Welcome to your Habit Tracking App! Wanna proceed?").ask():
         pass
@@ -24,24 +177,27 @@ def cli():
                 "Exit"
             ]).ask()
 
-        if choice == "Create a New Habit":
-            create_habit(db)
-        elif choice == "Increment Habit":
-            increment_habit(db)
-        elif choice == "Reset Habit":
-            reset_habit(db)
-        elif choice == "Analyze Habits":
-            analyze_habits(db)
-        elif choice == "Delete Habit":
-            delete_habit(db)
-        elif choice == "Exit":
+        if choice == "Exit":
             break  # Exit the loop
+        with profiler.action(choice) if profiler else nullcontext():
+            if choice == "Create a New Habit":
+                create_habit(db, catalog)
+            elif choice == "Increment Habit":
+                increment_habit(db, catalog)
+            elif choice == "Reset Habit":
+                reset_habit(db, catalog)
+            elif choice == "Analyze Habits":
+                analyze_habits(db, catalog, cache, snapshot)
+            elif choice == "Delete Habit":
+                delete_habit(db, catalog)
 
-def create_habit(db):
+def create_habit(db, catalog):
     """Guides the user through creating a new habit."""
+    import questionary
+
     name = questionary.text("What's the name of your new habit?").ask()
 
-    if get_habit_tracker(db, name):
+    if catalog.get(name):
         print("This habit already exists.")
     else:
         desc = questionary.text("How do you wanna describe your habit?").ask()
@@ -58,28 +214,36 @@ def create_habit(db):
         except Exception as e:
             print(f"An error occurred while creating the habit: {e}")
 
-def increment_habit(db):
+def increment_habit(db, catalog):
     """Guides the user through incrementing a habit's counter."""
-    habits = fetch_all_habit_names(db)
+    import questionary
+
+    habits = catalog.names()
     name = questionary.select(
         "What's the name of the habit you want to increment?", choices=habits + ["Exit"]).ask()
     if name != "Exit":
-        tracker = get_habit_tracker(db, name)
-        tracker.log_progress(db)  # Using the new method name
-        print(f"Habit '{name}' incremented!")
+        tracker = catalog.get(name)
+        if tracker.log_progress(db):  # Using the new method name
+            print(f"Habit '{name}' incremented!")
+        else:
+            print(f"Habit '{name}' was already completed for this period.")
 
-def reset_habit(db):
+def reset_habit(db, catalog):
     """Guides the user through resetting a habit's progress."""
-    habits = fetch_all_habit_names(db)
+    import questionary
+
+    habits = catalog.names()
     name = questionary.select(
         "What's the name of the habit you want to reset?", choices=habits + ["Exit"]).ask()
     if name != "Exit":
-        tracker = get_habit_tracker(db, name)
+        tracker = catalog.get(name)
         tracker.clear_progress(db)  # Using the new method name
         print(f"Habit '{name}' reset!")
 
-def analyze_habits(db):
-    """Guides the user through analyzing their habits."""
+def analyze_habits(db, catalog, cache, snapshot=None):
+    """Guides the user through analyzing their habits, reading streaks through the query cache."""
+    import questionary
+
     analysis_choice = questionary.select(
         "What analysis would you like to perform?",
         choices=[
@@ -91,46 +255,74 @@ def analyze_habits(db):
         ]).ask()
 
     if analysis_choice == "List all habits":
-        habits = fetch_all_habit_names(db)
         print("Currently tracked habits:")
-        for habit in habits:
-            print(habit)
+        list_habits(db, snapshot=snapshot)
     elif analysis_choice == "List habits by periodicity":
         periodicity = questionary.select(
             "Which periodicity are you interested in?", choices=["Daily", "Weekly"]).ask()
-        habits = fetch_habits_by_periodicity(db, periodicity)
         print(f"Habits with '{periodicity}' periodicity:")
-        for habit in habits:
-            print(habit)
+        list_habits(db, periodicity, snapshot=snapshot, cache=cache)
     elif analysis_choice == "Longest streak of all habits":
-        longest_streak = 0
-        habit_with_longest_streak = ""
-        habits = fetch_all_habit_names(db)
-
-        for habit in habits:
-            habit_streak = compute_longest_streak(db, habit)
-            if habit_streak > longest_streak:
-                longest_streak = habit_streak
-                habit_with_longest_streak = habit
-
-        print(f"The longest streak of all habits is {longest_streak} for habit '{habit_with_longest_streak}'.")
+        habit, longest_streak = longest_streak_leader(cache.longest_streaks())
+        if habit is None:
+            print("No habit has a streak yet.")
+        else:
+            print(f"The longest streak of all habits is {longest_streak} for habit '{habit}'.")
     elif analysis_choice == "Longest streak for a habit":
-        habits = fetch_all_habit_names(db)
+        habits = catalog.names()
         name = questionary.select("Select the habit", choices=habits + ["Exit"]).ask()
         if name != "Exit":
-            streak = compute_longest_streak(db, name)
+            streak = cache.longest_streak(name)
             print(f"The longest streak for habit '{name}' is {streak}.")
 
 
-def delete_habit(db):
+def list_habits(db, periodicity=None, interactive=True, snapshot=None, cache=None):
+    """
+    Prints habit names page by page, asking before each further page unless interactive is False.
+
+    With a snapshot, the names are taken from it instead of being read from the database. Without
+    one, a QueryCache answers listings by periodicity from memory until a habit is added or removed.
+    """
+    if snapshot is not None or (cache is not None and periodicity is not None):
+        if snapshot is not None:
+            names = snapshot.habit_names() if periodicity is None else snapshot.habits_by_periodicity(periodicity)
+        else:
+            names = cache.habits_by_periodicity(periodicity)
+        for start in range(0, len(names), PAGE_SIZE):
+            if start and interactive:
+                import questionary
+
+                if not questionary.confirm("Show more habits?").ask():
+                    break
+            print("\n".join(names[start:start + PAGE_SIZE]))
+        return
+    after_id = 0
+    while True:
+        # One extra row tells whether another page follows, without counting the whole table
+        page = fetch_habit_page(db, after_id, PAGE_SIZE + 1, periodicity)
+        for tracker in page[:PAGE_SIZE]:
+            print(tracker.name)
+        if len(page) <= PAGE_SIZE:
+            break
+        if interactive:
+            import questionary
+
+            if not questionary.confirm("Show more habits?").ask():
+                break
+        after_id = page[PAGE_SIZE - 1].habit_id
+
+
+def delete_habit(db, catalog):
     """Guides the user through deleting a habit."""
-    habits = fetch_all_habit_names(db)
+    import questionary
+
+    habits = catalog.names()
     name = questionary.select(
         "What's the name of the habit you want to delete?", choices=habits + ["Exit"]).ask()
     if name != "Exit":
-        tracker = get_habit_tracker(db, name)
+        tracker = catalog.get(name)
         tracker.delete_from_database(db)
         print(f"Habit '{name}' deleted!")
 
 if __name__ == "__main__":
-    cli()
+    sys.exit(cli())
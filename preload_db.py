@@ -0,0 +1,176 @@
+"""
+Fills a database with sample habits or a synthetic, reproducible completion history.
+
+Run without arguments to load five sample habits with a month of history, or pass --habits to
+generate a dataset for load and benchmark testing:
+
+    python preload_db.py --habits 1000 --days 1825 --seed 42 --fast
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from db import DATABASE_PATH, initialize_database
+from storage import epoch_seconds
+from rollups import refresh_all_rollups
+from streaks import PERIOD_DAYS, refresh_all_streaks
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SAMPLE_HABITS = [
+    ("Study", "Study for one hour", "Daily"),
+    ("Read", "Read a chapter", "Daily"),
+    ("Gaming", "Play a game", "Daily"),
+    ("Sport", "Work out", "Daily"),
+    ("Laundry", "Do the laundry", "Weekly"),
+]
+
+DAY_MINUTES = 16 * 60  # By default, completions are spread over the 16 hours after the start time
+
+
+def _deferred_indexes(cursor):
+    """
+    Returns the CREATE statements of the indexes on habits and progress_log, so they can be dropped and rebuilt.
+
+    Unique indexes stay in place: habit names must not collide with existing ones, and the index of
+    dedup.enable_unique_periods is what skips completions of periods that are already done.
+    """
+    cursor.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name IN ('habits', 'progress_log') AND sql IS NOT NULL
+          AND sql NOT LIKE 'CREATE UNIQUE %'
+    ''')
+    return cursor.fetchall()
+
+
+def _completions(habits, days, probability, rng, start, spread):
+    """
+    Yields progress_log rows (habit_id, tracked_at, tracked_epoch, day_ordinal, period_key) in habit order.
+
+    habits holds (habit_id, period length in days) pairs.
+
+    The text and integer values of each day are computed once and combined with a random minute,
+    which is much cheaper than formatting a datetime per row.
+    """
+    times = [(start + timedelta(minutes=minute)).strftime(" %H:%M:%S") for minute in range(max(spread, 1))]
+    calendar = []
+    for day in range(days):
+        moment = start + timedelta(days=day)
+        calendar.append((moment.strftime("%Y-%m-%d"), epoch_seconds(moment), moment.toordinal()))
+    scale = spread / probability if probability else 0
+    for habit_id, period_days in habits:
+        for text, epoch, ordinal in calendar:
+            draw = rng.random()
+            if draw < probability:
+                minute = int(draw * scale)  # Below the threshold, the draw itself is uniform: reuse it for the time
+                yield habit_id, text + times[minute], epoch + 60 * minute, ordinal, (ordinal - 1) // period_days
+
+
+def _load(db, habits, days, probability, seed, start, spread, fast):
+    """Inserts habits and their generated history in one transaction with deferred indexes."""
+    if days < 0 or spread < 0 or not 0 <= probability <= 1:
+        raise ValueError("days and spread must not be negative and probability must be between 0 and 1.")
+    cursor = db.cursor()
+    synchronous = cursor.execute('PRAGMA synchronous').fetchone()[0]
+    if fast:  # Skip fsyncs for the load; a crash can corrupt the file, so only use this for throwaway databases
+        cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('BEGIN')
+    try:
+        indexes = _deferred_indexes(cursor)
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+
+        first_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM habits").fetchone()[0]
+        created = start.strftime(TIMESTAMP_FORMAT)
+        cursor.executemany(
+            "INSERT INTO habits (id, name, description, periodicity, creation_date) VALUES (?, ?, ?, ?, ?)",
+            [(first_id + i, name, description, periodicity, created)
+             for i, (name, description, periodicity) in enumerate(habits)],
+        )
+        period_days = [(first_id + i, PERIOD_DAYS.get(periodicity, 1)) for i, (_, _, periodicity) in enumerate(habits)]
+        # With one completion per period enforced, repeats within a period are skipped like in log_progress
+        cursor.executemany(
+            "INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal, period_key) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            _completions(period_days, days, probability, random.Random(seed), start, spread),
+        )
+        rows = cursor.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id >= ?", (first_id,)).fetchone()[0]
+
+        for _, sql in indexes:  # Building each index once is much cheaper than updating it per row
+            cursor.execute(sql)
+        if habits:  # Only the new habits have history to summarise; existing summaries are left alone
+            id_range = (first_id, first_id + len(habits) - 1)
+            refresh_all_streaks(cursor, id_range)
+            refresh_all_rollups(cursor, id_range)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.execute(f'PRAGMA synchronous = {synchronous}')
+    return rows
+
+
+def generate_dataset(db, habits, days, probability=0.8, seed=0, start=datetime(2020, 1, 1, 6),
+                     periodicities=("Daily", "Weekly"), spread=DAY_MINUTES, fast=False):
+    """
+    Adds synthetic habits with a random completion history to the database.
+
+    The same arguments always produce the same habits and completions. Every habit is completed
+    on each day with the given probability, at a random time within spread minutes of the start time.
+
+    Args:
+        db: The database connection object.
+        habits: The number of habits to create, named "Habit 1", "Habit 2", ...
+        days: The length of each habit's history in days.
+        probability: (Optional) The chance that a habit is completed on any given day.
+        seed: (Optional) The random seed.
+        start: (Optional) The datetime of the first possible completion.
+        periodicities: (Optional) The periodicities assigned to the habits in turn.
+        spread: (Optional) The number of minutes after the start time completions are spread over.
+        fast: (Optional) Disables fsync (PRAGMA synchronous = OFF) while loading.
+
+    Returns:
+        int: The number of completions inserted.
+    """
+    offset = db.execute("SELECT COALESCE(MAX(id), 0) FROM habits").fetchone()[0]
+    rows = [(f"Habit {offset + i}", "Synthetic habit", periodicities[(i - 1) % len(periodicities)])
+            for i in range(1, habits + 1)]
+    return _load(db, rows, days, probability, seed, start, spread, fast)
+
+
+def preload_database(db):
+    """
+    Loads the sample habits with a month of completions (October 2024), unless they already exist.
+
+    Args:
+        db: The database connection object.
+
+    Returns:
+        int: The number of completions inserted.
+    """
+    existing = {row[0] for row in db.execute("SELECT name FROM habits")}
+    habits = [habit for habit in SAMPLE_HABITS if habit[0] not in existing]
+    return _load(db, habits, 31, 0.75, seed=2024, start=datetime(2024, 10, 1, 6),
+                 spread=DAY_MINUTES, fast=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fills the habit database with sample or synthetic data.")
+    parser.add_argument('--database', default=DATABASE_PATH, help="The database file (default: %(default)s)")
+    parser.add_argument('--habits', type=int, help="Generate this many synthetic habits instead of the samples")
+    parser.add_argument('--days', type=int, default=5 * 365, help="History length in days (default: %(default)s)")
+    parser.add_argument('--probability', type=float, default=0.8, help="Daily completion chance (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: %(default)s)")
+    parser.add_argument('--fast', action='store_true', help="Turn off fsync during the load (PRAGMA synchronous = OFF)")
+    args = parser.parse_args()
+
+    db = initialize_database(args.database)
+    if args.habits is None:
+        print(f"Sample data loaded successfully! ({preload_database(db)} completions)")
+    else:
+        started = datetime.now()
+        rows = generate_dataset(db, args.habits, args.days, args.probability, args.seed, fast=args.fast)
+        print(f"Generated {args.habits} habits with {rows} completions in "
+              f"{(datetime.now() - started).total_seconds():.1f} s.")
+    db.close()
@@ -0,0 +1,289 @@
+"""
+Opt-in instrumentation of database statements and menu actions.
+
+Pass a QueryProfiler to initialize_database to get a connection that records, per SQL statement,
+how often it ran, how long it took and how many rows it returned. Connections opened without a
+profiler are plain sqlite3 connections, so instrumentation costs nothing unless it is enabled.
+
+The interactive app enables it when the HABITS_PROFILE environment variable names a report file:
+
+    HABITS_PROFILE=profile.json python main.py
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+SAMPLE_WINDOW = 4096  # Most recent durations kept per statement or action for the percentiles
+
+
+def _percentile(ordered, fraction):
+    """Returns the value at the given fraction (0.0 to 1.0) of an ascending list (nearest rank)."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+class TimingStats:
+    """Accumulated timings of one statement or menu action.
+
+    Totals cover every call. The percentiles are taken from the most recent SAMPLE_WINDOW calls,
+    so memory and report cost stay bounded however long a process (like the HTTP service) runs.
+
+    Attributes:
+        calls (int): How often the statement was issued (or the action performed).
+        executions (int): How often SQLite ran the statement, e.g. once per row for executemany.
+        rows (int): The rows returned by queries, or changed by writes.
+        total (float): The summed duration of all calls in seconds, including fetching their rows.
+        maximum (float): The duration of the slowest call in seconds.
+        samples (list): The durations of the most recent calls in seconds, as a ring buffer.
+    """
+
+    __slots__ = ('calls', 'executions', 'rows', 'total', 'maximum', 'samples', '_recorded')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.executions = 0
+        self.rows = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = []
+        self._recorded = 0
+
+    def record(self, seconds) -> int:
+        """
+        Adds the duration of one call, replacing the oldest sample once the window is full.
+
+        Args:
+            seconds: The duration of the call.
+
+        Returns:
+            int: The position of the sample, for extend.
+        """
+        position = self._recorded % SAMPLE_WINDOW
+        if position == len(self.samples):
+            self.samples.append(seconds)
+        else:
+            self.samples[position] = seconds
+        self._recorded += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        return position
+
+    def extend(self, position, seconds) -> None:
+        """Adds time to a recorded call, e.g. for fetching its rows after the statement ran."""
+        self.samples[position] += seconds
+        self.total += seconds
+        self.maximum = max(self.maximum, self.samples[position])
+
+    def as_dict(self) -> dict:
+        """Returns the count, row and latency figures (in milliseconds) as a JSON-ready dict."""
+        ordered = sorted(self.samples)
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'rows': self.rows,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total / self._recorded * 1000, 3) if self._recorded else 0.0,
+            'p50_ms': round(_percentile(ordered, 0.50) * 1000, 3),
+            'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+            'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+            'max_ms': round(self.maximum * 1000, 3),
+        }
+
+
+class QueryProfiler:
+    """Collects statement and action timings from any number of instrumented connections.
+
+    Methods:
+        action(name): Context manager that times one menu action.
+        report(): Returns all figures as a JSON-ready dict.
+        write_json(path): Writes the report to a file.
+        summary(limit): Returns the slowest statements and all actions as printable text.
+    """
+
+    def __init__(self) -> None:
+        self.statements = {}
+        self.actions = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, table, key) -> TimingStats:
+        stats = table.get(key)
+        if stats is None:
+            with self._lock:
+                stats = table.setdefault(key, TimingStats())
+        return stats
+
+    def statement(self, sql) -> TimingStats:
+        """Returns the stats of a statement, keyed by its text with whitespace collapsed."""
+        return self._stats(self.statements, " ".join(sql.split()))
+
+    @contextmanager
+    def action(self, name):
+        """Times the enclosed block as one call of the named action."""
+        stats = self._stats(self.actions, name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats.calls += 1
+                stats.record(elapsed)
+
+    def report(self) -> dict:
+        """
+        Returns every statement and action with its counts and latency percentiles.
+
+        Returns:
+            dict: 'statements' and 'actions' lists, each sorted by total time, slowest first.
+        """
+        def ranked(table, label):
+            entries = [{label: key, **stats.as_dict()} for key, stats in list(table.items())]
+            return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+        return {'statements': ranked(self.statements, 'sql'), 'actions': ranked(self.actions, 'action')}
+
+    def write_json(self, path) -> None:
+        """Writes the report to a JSON file."""
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def summary(self, limit=10) -> str:
+        """
+        Formats the slowest statements and all actions as a table.
+
+        Args:
+            limit: (Optional) The number of statements to include.
+
+        Returns:
+            str: The summary text.
+        """
+        report = self.report()
+        lines = [f"{'calls':>7} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rows':>8}  statement"]
+        for entry in report['statements'][:limit]:
+            sql = entry['sql'] if len(entry['sql']) <= 70 else entry['sql'][:67] + '...'
+            lines.append(f"{entry['calls']:>7} {entry['total_ms']:>10.2f} {entry['p50_ms']:>8.3f} "
+                         f"{entry['p95_ms']:>8.3f} {entry['p99_ms']:>8.3f} {entry['rows']:>8}  {sql}")
+        if report['actions']:
+            lines.append(f"{'calls':>7} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  action")
+            for entry in report['actions']:
+                lines.append(f"{entry['calls']:>7} {entry['total_ms']:>10.2f} {entry['p50_ms']:>8.3f} "
+                             f"{entry['p95_ms']:>8.3f} {entry['p99_ms']:>8.3f}  {entry['action']}")
+        return "\n".join(lines)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """A cursor that times its statements and counts the rows they return."""
+
+    _stats = None
+    _sample = None
+
+    def _run(self, method, sql, parameters, executions=None):
+        connection = self.connection
+        stats = connection.profiler.statement(sql)
+        connection._active = stats
+        start = time.perf_counter()
+        try:
+            method(self, sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            connection._active = None
+            stats.calls += 1
+            stats.executions += 1 if executions is None else executions[0]
+            sample = stats.record(elapsed)
+        self._stats, self._sample = stats, sample
+        if self.description is None and self.rowcount > 0:  # A write: count the changed rows
+            stats.rows += self.rowcount
+        return self
+
+    def _fetched(self, start, rows):
+        if self._stats is not None:
+            self._stats.extend(self._sample, time.perf_counter() - start)
+            self._stats.rows += rows
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        executions = [0]
+
+        def counted(parameters):
+            for executions[0], row in enumerate(parameters, start=1):
+                yield row
+
+        return self._run(sqlite3.Cursor.executemany, sql, counted(seq_of_parameters), executions)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()  # StopIteration passes through untimed
+        self._fetched(start, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose cursors report to a QueryProfiler. Created by initialize_database(profiler=...)."""
+
+    profiler = None
+    _active = None  # The stats of the statement currently executing, for the trace callback
+
+    def attach(self, profiler) -> None:
+        """Starts reporting every statement of this connection to the profiler."""
+        self.profiler = profiler
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, sql) -> None:
+        # Called by SQLite for every statement it runs, with parameters already substituted. Statements
+        # issued through a ProfiledCursor are counted there (SQLite reports them again for every trigger
+        # they fire), so this only counts the rest: implicit BEGINs, commits and executescript.
+        if self._active is None:
+            keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+            self.profiler.statement(keyword if keyword in TRANSACTION_STATEMENTS else sql).executions += 1
+        elif sql.lstrip()[:5].upper() == 'BEGIN':  # The implicit BEGIN before a write
+            self.profiler.statement('BEGIN').executions += 1
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _timed(self, keyword, method):
+        stats = self.profiler.statement(keyword)
+        start = time.perf_counter()
+        try:
+            method()
+        finally:
+            stats.calls += 1
+            stats.record(time.perf_counter() - start)
+
+    def commit(self) -> None:
+        if self.profiler is None or not self.in_transaction:
+            return super().commit()
+        self._timed('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        if self.profiler is None or not self.in_transaction:
+            return super().rollback()
+        self._timed('ROLLBACK', super().rollback)
@@ -0,0 +1,162 @@
+"""
+Retention: prunes completions older than a cutoff and returns the freed space to the file system.
+
+Pruning deletes in bounded chunks, each in its own transaction, so the app stays usable while it
+runs and an interrupted run simply continues where it stopped when started again. Pruned
+completions can be archived to an NDJSON dataset first (see transfer.py), from which they can be
+imported again later:
+
+    python retention.py --before 2023-01-01 --archive archive
+
+Deleted rows leave free pages inside the database file. compact_database hands them back with
+incremental vacuum steps, which (unlike a full VACUUM) do not rewrite the whole file.
+"""
+from datetime import date, datetime, time
+
+from counter import notify_write_listeners
+from rollups import remove_rollups
+from storage import epoch_seconds, progress_columns
+from streaks import scan_streak_state, store_streak_state
+from transfer import append_to_dataset
+
+DEFAULT_CHUNK_SIZE = 10_000   # Completions deleted per transaction
+DEFAULT_VACUUM_PAGES = 1024   # Pages released per incremental vacuum step (4 MB with the default page size)
+AUTO_VACUUM_INCREMENTAL = 2   # The PRAGMA auto_vacuum value of incremental mode
+
+
+def prune_progress(db, before, archive=None, chunk_size=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Deletes every completion logged before a cutoff, a bounded chunk per transaction.
+
+    Habits are processed in id order. Their rollup counts are updated in the same transaction as
+    each deletion, and a habit's streak summary is recomputed from its remaining history before
+    every commit that removed some of its completions.
+
+    Args:
+        db: The database connection object.
+        before: The cutoff datetime (or date, meaning its midnight). Earlier completions are pruned.
+        archive: (Optional) A dataset directory the pruned habits and completions are appended to,
+                 before they are deleted.
+        chunk_size: (Optional) The maximum number of completions deleted per transaction.
+
+    Returns:
+        int: The number of completions pruned.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+    if not isinstance(before, datetime):
+        before = datetime.combine(before, time())
+
+    cursor = db.cursor()
+    columns = progress_columns(cursor)
+    cutoff = (before.toordinal(), epoch_seconds(before))
+    habits = cursor.execute('SELECT id, name, description, periodicity, creation_date FROM habits ORDER BY id').fetchall()
+    archived = set()   # Habits already written to the archive by this run
+    changed = set()    # Habits pruned in the current transaction
+    pruned = 0
+    budget = chunk_size
+    try:
+        for habit_id, name, *details in habits:
+            rescan = False
+            while True:
+                limit = budget
+                cursor.execute(
+                    f'''
+                    DELETE FROM progress_log
+                    WHERE id IN (
+                        SELECT id FROM progress_log
+                        WHERE habit_id = ? AND {columns.day_ordinal} <= ? AND {columns.epoch} < ?
+                        LIMIT ?
+                    )
+                    RETURNING tracked_at, {columns.day_ordinal}
+                    ''',
+                    (habit_id, *cutoff, limit),
+                )
+                rows = cursor.fetchall()
+                if rows:
+                    if archive is not None:
+                        append_to_dataset(archive, [] if habit_id in archived else [(name, *details)],
+                                          [(name, tracked_at) for tracked_at, _ in rows])
+                        archived.add(habit_id)
+                    remove_rollups(cursor, [(habit_id, day_ordinal) for _, day_ordinal in rows])
+                    changed.add(habit_id)
+                    pruned += len(rows)
+                    budget -= len(rows)
+                    rescan = True
+                finished = len(rows) < limit  # No older completions left for this habit
+                if rescan and (finished or budget == 0):
+                    # Before every commit, so that a stopped run leaves the streak matching the pruned log
+                    store_streak_state(cursor, habit_id, scan_streak_state(cursor, habit_id))
+                    rescan = False
+                if budget == 0:
+                    db.commit()
+                    notify_write_listeners(db, 'cleared', changed)
+                    changed = set()
+                    budget = chunk_size
+                if finished:
+                    break
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if changed:
+        notify_write_listeners(db, 'cleared', changed)
+    return pruned
+
+
+def compact_database(db, pages_per_step=DEFAULT_VACUUM_PAGES) -> int:
+    """
+    Returns the database's free pages to the file system.
+
+    Databases created before incremental vacuum was enabled are switched over with one full
+    VACUUM; from then on free pages are released in steps of pages_per_step, each its own
+    short write transaction. The file shrinks at the final WAL checkpoint.
+
+    Args:
+        db: The database connection object.
+        pages_per_step: (Optional) The number of pages released per step.
+
+    Returns:
+        int: The number of pages released.
+    """
+    if pages_per_step < 1:
+        raise ValueError("pages_per_step must be a positive integer.")
+
+    db.commit()  # VACUUM cannot run inside a transaction
+    cursor = db.cursor()
+    if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        pages = cursor.execute('PRAGMA page_count').fetchone()[0]
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')  # Changing the mode of an existing database only takes effect through a rebuild
+        released = pages - cursor.execute('PRAGMA page_count').fetchone()[0]
+    else:
+        released = 0
+        while free := cursor.execute('PRAGMA freelist_count').fetchone()[0]:
+            cursor.execute(f'PRAGMA incremental_vacuum({pages_per_step})').fetchall()
+            step = free - cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            if step <= 0:  # Nothing could be released, e.g. while another connection holds a lock
+                break
+            released += step
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return released
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import DATABASE_PATH, initialize_database
+
+    parser = argparse.ArgumentParser(description="Prunes old completions and compacts the database.")
+    parser.add_argument('--before', required=True, type=date.fromisoformat,
+                        help='prune completions before this date (YYYY-MM-DD)')
+    parser.add_argument('--archive', help='dataset directory to append the pruned completions to')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='completions deleted per transaction (default: %(default)s)')
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file (default: %(default)s)')
+    args = parser.parse_args()
+
+    db = initialize_database(args.database)
+    pruned = prune_progress(db, args.before, args.archive, args.chunk_size)
+    released = compact_database(db)
+    print(f"Pruned {pruned} completions and released {released} pages.")
+    db.close()
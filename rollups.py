@@ -0,0 +1,259 @@
+"""
+Per-habit completion counts per day and per ISO week, kept next to the raw progress log.
+
+Long-horizon questions (completions per month over years, completion rate per weekday) are
+answered from these small integer tables instead of scanning every raw completion. The
+daily_totals table holds the daily counts summed over all habits, for questions about every
+habit at once. They are maintained incrementally by the write functions in counter.py
+and by retention.prune_progress, and can be rebuilt from scratch with rebuild_rollups (or
+`python rollups.py`).
+"""
+from collections import Counter
+
+from storage import progress_columns
+
+
+def week_of(day_ordinal):
+    """Returns the ISO week number (in the numbering of streaks.period_of) of a day ordinal."""
+    return (day_ordinal - 1) // 7
+
+
+def create_rollup_tables(cursor):
+    """Creates the per-habit rollup tables and the daily totals over all habits if they do not exist."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            habit_id INTEGER NOT NULL,
+            day_ordinal INTEGER NOT NULL,
+            completions INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, day_ordinal)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_rollups (
+            habit_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            completions INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, week)
+        ) WITHOUT ROWID
+    ''')
+    create_totals_table(cursor)
+
+
+def create_totals_table(cursor):
+    """
+    Creates the daily_totals table if it does not exist.
+
+    Aggregates over all habits read this rather than an index of the rollups by day: every habit
+    has a row on most days, so such an index spreads each habit's rows over hundreds of pages, and
+    clearing or deleting a habit would rewrite all of them. The totals fit in a few pages, and
+    weekly totals are summed from them when asked for.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day_ordinal INTEGER PRIMARY KEY,
+            completions INTEGER NOT NULL
+        )
+    ''')
+
+
+def _count(completions):
+    """Counts (habit_id, day_ordinal) pairs per habit and day and per habit and week."""
+    days = Counter(completions)
+    weeks = Counter()
+    for (habit_id, day_ordinal), count in days.items():
+        weeks[habit_id, week_of(day_ordinal)] += count
+    return days, weeks
+
+
+def _adjust_totals(cursor, days, sign):
+    """
+    Adds (sign 1) or subtracts (sign -1) per-habit day counts to the daily totals over all habits.
+
+    Args:
+        cursor: A cursor on the database connection, inside the writing transaction.
+        days: Counts keyed by (habit_id, day_ordinal), as returned by _count.
+        sign: 1 for new completions, -1 for removed ones, whose totals are dropped once they reach zero.
+    """
+    totals = Counter()
+    for (_, day_ordinal), count in days.items():
+        totals[day_ordinal] += sign * count
+    rows = list(totals.items())
+    cursor.executemany(
+        '''
+        INSERT INTO daily_totals (day_ordinal, completions) VALUES (?, ?)
+        ON CONFLICT (day_ordinal) DO UPDATE SET completions = completions + excluded.completions
+        ''',
+        rows,
+    )
+    if sign < 0:
+        cursor.executemany('DELETE FROM daily_totals WHERE day_ordinal = ? AND completions <= 0',
+                           [row[:1] for row in rows])
+
+
+def record_rollups(cursor, completions):
+    """
+    Adds newly logged completions to the rollup counts.
+
+    Args:
+        cursor: A cursor on the database connection, inside the logging transaction.
+        completions: (habit_id, day_ordinal) pairs of the new completions, in any order.
+    """
+    days, weeks = _count(completions)
+    cursor.executemany(
+        '''
+        INSERT INTO daily_rollups (habit_id, day_ordinal, completions) VALUES (?, ?, ?)
+        ON CONFLICT (habit_id, day_ordinal) DO UPDATE SET completions = completions + excluded.completions
+        ''',
+        [(habit_id, day_ordinal, count) for (habit_id, day_ordinal), count in days.items()],
+    )
+    cursor.executemany(
+        '''
+        INSERT INTO weekly_rollups (habit_id, week, completions) VALUES (?, ?, ?)
+        ON CONFLICT (habit_id, week) DO UPDATE SET completions = completions + excluded.completions
+        ''',
+        [(habit_id, week, count) for (habit_id, week), count in weeks.items()],
+    )
+    _adjust_totals(cursor, days, 1)
+
+
+def remove_rollups(cursor, completions):
+    """
+    Subtracts deleted completions from the rollup counts, dropping counts that reach zero.
+
+    Args:
+        cursor: A cursor on the database connection, inside the deleting transaction.
+        completions: (habit_id, day_ordinal) pairs of the deleted completions, in any order.
+    """
+    days, weeks = _count(completions)
+    day_rows = [(count, habit_id, day_ordinal) for (habit_id, day_ordinal), count in days.items()]
+    week_rows = [(count, habit_id, week) for (habit_id, week), count in weeks.items()]
+    cursor.executemany(
+        'UPDATE daily_rollups SET completions = completions - ? WHERE habit_id = ? AND day_ordinal = ?', day_rows
+    )
+    cursor.executemany('DELETE FROM daily_rollups WHERE habit_id = ? AND day_ordinal = ? AND completions <= 0',
+                       [row[1:] for row in day_rows])
+    cursor.executemany('UPDATE weekly_rollups SET completions = completions - ? WHERE habit_id = ? AND week = ?',
+                       week_rows)
+    cursor.executemany('DELETE FROM weekly_rollups WHERE habit_id = ? AND week = ? AND completions <= 0',
+                       [row[1:] for row in week_rows])
+    _adjust_totals(cursor, days, -1)
+
+
+def clear_rollups(cursor, habit_ids):
+    """
+    Removes the rollup counts of habits whose progress was cleared or which are being deleted.
+
+    The rollups do not cascade from the habits (see db._drop_rollup_cascades), so this is called
+    before habits are deleted as well. The totals are adjusted once for all the given habits.
+
+    Args:
+        cursor: A cursor on the database connection, inside the clearing or deleting transaction.
+        habit_ids: A list of habit ids.
+    """
+    placeholders = ', '.join('?' * len(habit_ids))
+    # Set-based, since a habit has a row on most days: its slice of the primary key is read once
+    # and matched to the totals along theirs. This is cheaper than fetching the rows with
+    # DELETE ... RETURNING and applying them one by one like remove_rollups.
+    if len(habit_ids) == 1:  # Has one row per day already, and matching it directly is twice as fast
+        cursor.execute('''
+            UPDATE daily_totals SET completions = daily_totals.completions - habit.completions
+            FROM daily_rollups AS habit
+            WHERE habit.habit_id = ? AND daily_totals.day_ordinal = habit.day_ordinal
+        ''', habit_ids)
+    else:
+        cursor.execute(f'''
+            UPDATE daily_totals SET completions = daily_totals.completions - cleared.completions
+            FROM (
+                SELECT day_ordinal, SUM(completions) AS completions FROM daily_rollups
+                WHERE habit_id IN ({placeholders}) GROUP BY day_ordinal
+            ) AS cleared
+            WHERE daily_totals.day_ordinal = cleared.day_ordinal
+        ''', habit_ids)
+    # The totals hold one row per day, a few pages even for years of history, so scanning them
+    # is cheaper than looking up the habits' days once more
+    cursor.execute('DELETE FROM daily_totals WHERE completions <= 0')
+    cursor.execute(f'DELETE FROM daily_rollups WHERE habit_id IN ({placeholders})', habit_ids)
+    cursor.execute(f'DELETE FROM weekly_rollups WHERE habit_id IN ({placeholders})', habit_ids)
+
+
+def refresh_totals(cursor):
+    """Replaces the daily totals with sums over the per-habit daily rollups. The caller commits."""
+    cursor.execute('DELETE FROM daily_totals')
+    cursor.execute('''
+        INSERT INTO daily_totals (day_ordinal, completions)
+        SELECT day_ordinal, SUM(completions) FROM daily_rollups GROUP BY 1
+    ''')
+
+
+def _add_to_totals(cursor, condition, parameters, sign):
+    """Adds (sign 1) or subtracts (sign -1) the daily rollups matching condition to the daily totals."""
+    cursor.execute(f'''
+        INSERT INTO daily_totals (day_ordinal, completions)
+        SELECT day_ordinal, {sign} * SUM(completions) FROM daily_rollups {condition} GROUP BY 1
+        ON CONFLICT (day_ordinal) DO UPDATE SET completions = completions + excluded.completions
+    ''', parameters)
+
+
+def refresh_all_rollups(cursor, id_range=None):
+    """
+    Replaces the rollup tables and the daily totals with counts recomputed from the raw progress log.
+
+    Args:
+        cursor: A cursor on the database connection. The caller is responsible for committing.
+        id_range: (Optional) A (first, last) pair restricting the refresh to habits with ids in that
+                  range. Their old counts are taken off the totals and the new ones added.
+
+    Returns:
+        int: The number of (habit, day) rows written.
+    """
+    if id_range is None:
+        condition, parameters = '', ()
+    else:
+        condition, parameters = 'WHERE habit_id BETWEEN ? AND ?', tuple(id_range)
+        _add_to_totals(cursor, condition, parameters, -1)
+    columns = progress_columns(cursor)
+    cursor.execute(f'DELETE FROM daily_rollups {condition}', parameters)
+    cursor.execute(f'DELETE FROM weekly_rollups {condition}', parameters)
+    cursor.execute(f'''
+        INSERT INTO daily_rollups (habit_id, day_ordinal, completions)
+        SELECT progress_log.habit_id, {columns.day_ordinal}, COUNT(*)
+        FROM progress_log
+        {condition}
+        GROUP BY 1, 2
+    ''', parameters)
+    days = cursor.rowcount
+    cursor.execute(f'''
+        INSERT INTO weekly_rollups (habit_id, week, completions)
+        SELECT habit_id, (day_ordinal - 1) / 7, SUM(completions)
+        FROM daily_rollups
+        {condition}
+        GROUP BY 1, 2
+    ''', parameters)
+    if id_range is None:
+        refresh_totals(cursor)
+    else:
+        _add_to_totals(cursor, condition, parameters, 1)
+        cursor.execute('DELETE FROM daily_totals WHERE completions <= 0')
+    return days
+
+
+def rebuild_rollups(db):
+    """
+    Recomputes the rollup tables and the daily totals from the raw progress log.
+
+    Args:
+        db: The database connection object.
+
+    Returns:
+        int: The number of (habit, day) rows written.
+    """
+    count = refresh_all_rollups(db.cursor())
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    from db import initialize_database
+
+    db = initialize_database()
+    print(f"Rebuilt {rebuild_rollups(db)} daily rollups.")
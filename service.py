@@ -0,0 +1,328 @@
+"""
+A local HTTP API over the habit database, so several clients can share one habits.db.
+
+The server runs on asyncio; every request that touches the database is handed to a bounded
+thread pool, where writes go through the ConnectionManager's single writer connection and
+reads through its pool of read-only connections. Requests beyond max_pending in flight are
+turned away with 503 rather than queued without limit.
+
+    python service.py --port 8080
+
+Endpoints (habit names are URL-encoded path segments, bodies and responses are JSON):
+
+    GET    /habits[?periodicity=Daily]      List habit names
+    POST   /habits                          Create a habit: {"name", "description", "periodicity"}
+    POST   /habits/{name}/completions       Log a completion: {"tracked_at": ISO datetime} (optional)
+    DELETE /habits/{name}/completions       Reset a habit's progress
+    DELETE /habits/{name}                   Delete a habit
+    GET    /habits/{name}/streak            Current and longest streak
+    GET    /metrics                         Per-endpoint request counts and latency percentiles
+"""
+import asyncio
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from analyse import compute_current_streak, compute_longest_streak
+from counter import TIMESTAMP_FORMAT, HabitTracker
+from db import ConnectionManager, fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker
+from profiling import QueryProfiler
+
+PERIODICITIES = ("Daily", "Weekly")
+MAX_BODY = 64 * 1024  # Bytes accepted in a request body
+
+
+class HttpError(Exception):
+    """An error reported to the client with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HabitService:
+    """Serves the habit database over HTTP.
+
+    Attributes:
+        manager (ConnectionManager): Provides the database connections.
+        max_pending (int): The number of database requests in flight at which new ones get 503.
+        metrics (QueryProfiler): Latency of every endpoint, recorded as profiler actions.
+        rejected (int): The number of requests turned away because the service was busy.
+
+    Methods:
+        start(host, port): Starts listening and returns the asyncio server.
+        stop(): Stops listening and shuts the thread pool down.
+    """
+
+    def __init__(self, manager, workers: int = 4, max_pending: int = 64) -> None:
+        """
+        Creates the service and its thread pool.
+
+        Args:
+            manager: The ConnectionManager of the database to serve.
+            workers: (Optional) The number of threads running database work.
+            max_pending: (Optional) The number of database requests allowed in flight at once.
+        """
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be positive integers.")
+        self.manager = manager
+        self.max_pending = max_pending
+        self.metrics = QueryProfiler()
+        self.rejected = 0
+        self.server = None
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='habit-service')
+        self._pending = 0  # Only changed on the event loop, so it needs no lock
+        # (method, path pattern, handler, metrics label); handlers run in the thread pool
+        self._routes = [
+            ('GET', re.compile(r'/habits'), self._list_habits, 'GET /habits'),
+            ('POST', re.compile(r'/habits'), self._create_habit, 'POST /habits'),
+            ('POST', re.compile(r'/habits/([^/]+)/completions'), self._log_completion,
+             'POST /habits/{name}/completions'),
+            ('DELETE', re.compile(r'/habits/([^/]+)/completions'), self._reset_habit,
+             'DELETE /habits/{name}/completions'),
+            ('DELETE', re.compile(r'/habits/([^/]+)'), self._delete_habit, 'DELETE /habits/{name}'),
+            ('GET', re.compile(r'/habits/([^/]+)/streak'), self._streak, 'GET /habits/{name}/streak'),
+        ]
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """
+        Starts accepting connections.
+
+        Args:
+            host: (Optional) The interface to listen on.
+            port: (Optional) The TCP port; 0 picks a free one (see server.sockets).
+
+        Returns:
+            asyncio.Server: The listening server.
+        """
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+        return self.server
+
+    async def stop(self) -> None:
+        """Stops listening, then waits for running database work to finish."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def _serve_connection(self, reader, writer) -> None:
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as error:
+                    request, keep_alive = None, False
+                    self._write_response(writer, error.status, {'error': str(error)}, keep_alive)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, payload = await self.dispatch(method, target, body)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        try:
+            line = await reader.readline()
+            if not line:
+                return None
+            parts = line.decode('latin-1').split()
+            if len(parts) != 3:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+            method, target, version = parts
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:  # A line longer than the stream limit
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Request line or header too long.") from None
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.") from None
+        if length > MAX_BODY:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Bodies are limited to {MAX_BODY} bytes.")
+        body = await reader.readexactly(length) if length > 0 else b''
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method.upper(), target, body, keep_alive
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive) -> None:
+        status = HTTPStatus(status)
+        body = json.dumps(payload).encode()
+        connection = '' if keep_alive else 'Connection: close\r\n'
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"{connection}\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def dispatch(self, method, target, body=b''):
+        """
+        Answers one request.
+
+        Args:
+            method: The HTTP method.
+            target: The request target (path and query string).
+            body: (Optional) The raw request body.
+
+        Returns:
+            tuple: The HTTP status and the JSON-ready response payload.
+        """
+        url = urlsplit(target)
+        if url.path == '/metrics' and method == 'GET':
+            return HTTPStatus.OK, self._metrics()
+        path_known = False
+        for route_method, pattern, handler, label in self._routes:
+            match = pattern.fullmatch(url.path)
+            if match is None:
+                continue
+            path_known = True
+            if route_method != method:
+                continue
+            with self.metrics.action(label):
+                return await self._run(handler, [unquote(group) for group in match.groups()],
+                                       parse_qs(url.query), body)
+        if path_known:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{method} is not supported on {url.path}."}
+        return HTTPStatus.NOT_FOUND, {'error': f"No endpoint at {url.path}."}
+
+    async def _run(self, handler, arguments, query, body):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': "The service is busy, retry later."}
+        self._pending += 1
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "The request body must be a JSON object.")
+            return await asyncio.get_running_loop().run_in_executor(self._executor, handler, *arguments, query, data)
+        except HttpError as error:
+            return error.status, {'error': str(error)}
+        except ValueError as error:  # Includes malformed JSON and timestamps
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}
+        finally:
+            self._pending -= 1
+
+    def _metrics(self):
+        # Endpoint timings are profiler actions; the statement counters do not apply to them
+        endpoints = [{key: value for key, value in entry.items() if key not in ('executions', 'rows')}
+                     for entry in self.metrics.report()['actions']]
+        return {
+            'endpoints': endpoints,
+            'pending': self._pending,
+            'rejected': self.rejected,
+        }
+
+    def _write(self, operation):
+        """Runs operation(db) on the writer connection, rolling back whatever it left uncommitted on failure."""
+        with self.manager.writer() as db:
+            try:
+                return operation(db)
+            except Exception:
+                db.rollback()
+                raise
+
+    @staticmethod
+    def _tracker(db, name):
+        tracker = get_habit_tracker(db, name)
+        if tracker is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No habit named '{name}'.")
+        return tracker
+
+    def _list_habits(self, query, data):
+        periodicity = query.get('periodicity', [None])[0]
+        with self.manager.reader() as db:
+            names = fetch_habits_by_periodicity(db, periodicity) if periodicity else fetch_all_habit_names(db)
+        return HTTPStatus.OK, {'habits': names}
+
+    def _create_habit(self, query, data):
+        name, periodicity = data.get('name'), data.get('periodicity')
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("'name' must be a non-empty string.")
+        if periodicity not in PERIODICITIES:
+            raise ValueError(f"'periodicity' must be one of {', '.join(PERIODICITIES)}.")
+        tracker = HabitTracker(name, str(data.get('description', '')), periodicity)
+
+        def create(db):
+            if get_habit_tracker(db, name) is not None:
+                raise HttpError(HTTPStatus.CONFLICT, f"A habit named '{name}' already exists.")
+            tracker.save_to_database(db)
+
+        try:
+            self._write(create)
+        except sqlite3.IntegrityError:  # Created through another connection in the meantime
+            raise HttpError(HTTPStatus.CONFLICT, f"A habit named '{name}' already exists.") from None
+        return HTTPStatus.CREATED, {'id': tracker.habit_id, 'name': name, 'periodicity': periodicity}
+
+    def _log_completion(self, name, query, data):
+        tracked_at = data.get('tracked_at')
+        tracked_at = datetime.fromisoformat(tracked_at) if tracked_at else datetime.now()
+        logged = self._write(lambda db: self._tracker(db, name).log_progress(db, tracked_at))
+        # A retried request in a database keeping one completion per period changes nothing
+        return HTTPStatus.CREATED if logged else HTTPStatus.OK, {
+            'habit': name, 'tracked_at': tracked_at.strftime(TIMESTAMP_FORMAT), 'logged': logged,
+        }
+
+    def _reset_habit(self, name, query, data):
+        self._write(lambda db: self._tracker(db, name).clear_progress(db))
+        return HTTPStatus.OK, {'habit': name, 'reset': True}
+
+    def _delete_habit(self, name, query, data):
+        self._write(lambda db: self._tracker(db, name).delete_from_database(db))
+        return HTTPStatus.OK, {'habit': name, 'deleted': True}
+
+    def _streak(self, name, query, data):
+        with self.manager.reader() as db:
+            tracker = self._tracker(db, name)
+            return HTTPStatus.OK, {
+                'habit': name,
+                'periodicity': tracker.periodicity,
+                'current_streak': compute_current_streak(db, name),
+                'longest_streak': compute_longest_streak(db, name),
+            }
+
+
+async def serve(path, host, port, workers, max_pending):
+    """Runs the service until it is cancelled (e.g. with Ctrl+C)."""
+    manager = ConnectionManager(path, readers=workers)
+    service = HabitService(manager, workers, max_pending)
+    server = await service.start(host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Serving {path} on http://{host}:{port}", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await service.stop()
+        manager.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(description="Serves the habit database over HTTP.")
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file (default: %(default)s)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='TCP port; 0 picks a free one (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4, help='database threads (default: %(default)s)')
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='database requests in flight before answering 503 (default: %(default)s)')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.database, args.host, args.port, args.workers, args.max_pending))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,402 @@
+"""
+A memory-resident snapshot of every habit's completed days, for heavy reporting sessions.
+
+The snapshot holds each habit's distinct completion days as a sorted array of day ordinals and
+answers the streak and listing queries without a round trip to SQLite. It is saved next to the
+database (habits.db.snapshot) in a binary layout: a small JSON header with the habits and their
+streak summaries, followed by all day arrays as one block of unsigned 32-bit integers. Opening
+a saved snapshot maps that block into memory instead of reading it, so a new session can start
+answering queries in milliseconds instead of reading the whole progress log first.
+
+A saved snapshot records a fingerprint of the database (row counts and highest ids of habits
+and progress_log) and the number of completions of every habit. If the database has changed
+since, only the habits that gained or lost completions are read again: new completions are found
+by their ids, lost ones by the counts. HabitTracker writes on the same connection keep an open
+snapshot up to date as they happen.
+"""
+import json
+import mmap
+import os
+import sys
+import threading
+from array import array
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+
+from analyse import running_streak
+from counter import add_write_listener, remove_write_listener
+from storage import iter_rows, progress_columns
+from streaks import PERIOD_DAYS, StreakState, summarize_periods
+
+MAGIC = b'HABITSNP'
+FORMAT_VERSION = 2
+SNAPSHOT_SUFFIX = '.snapshot'
+_LENGTH_BYTES = 8  # The JSON header length, stored after MAGIC
+_ALIGNMENT = 8     # The day block starts at a multiple of this, so it can be cast to unsigned ints
+
+
+def database_fingerprint(cursor):
+    """
+    Summarizes the habits and progress_log tables cheaply enough to check on every open.
+
+    Ids only grow (AUTOINCREMENT), so any insert raises a highest id and any delete lowers a count.
+
+    Args:
+        cursor: A cursor on the database connection.
+
+    Returns:
+        list: The row count and highest id of habits and of progress_log.
+    """
+    return list(cursor.execute('''
+        SELECT (SELECT COUNT(*) FROM habits), (SELECT MAX(id) FROM habits),
+               (SELECT COUNT(*) FROM progress_log), (SELECT MAX(id) FROM progress_log)
+    ''').fetchone())
+
+
+def snapshot_path(db):
+    """Returns where the snapshot of a database is kept by default: next to its file, as <file>.snapshot."""
+    path = next((row[2] for row in db.execute('PRAGMA database_list') if row[1] == 'main'), '')
+    if not path:
+        raise ValueError("An in-memory database has no file to keep a snapshot next to; pass a path.")
+    return path + SNAPSHOT_SUFFIX
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+class AnalyticsSnapshot:
+    """The habits and completed days of a database, held in memory to answer analytics queries.
+
+    The query methods have the same results as their counterparts in analyse.py and db.py (and
+    the same interface as cache.QueryCache, so either can serve the menu). Writes made through
+    HabitTracker (or the bulk functions, transfer and retention) on the same connection mark the
+    affected habits, which are re-read from the database the next time they are queried. Other
+    writes, such as plain SQL or writes through another connection, are picked up by catch_up(),
+    which save() and open() call as well. Completions changed in place by an UPDATE are only seen
+    by reload().
+
+    Attributes:
+        db: The database connection the snapshot was taken from.
+        path (str): Where save() writes the snapshot by default.
+        changed (bool): Whether the connection wrote to the database since the snapshot was read or saved.
+
+    Methods:
+        load(database, path): Reads a snapshot from the database.
+        open(database, path): Maps a saved snapshot, caught up with the database, or loads and saves a new one.
+        catch_up(): Re-reads the habits whose completions changed in the database.
+        reload(): Re-reads everything from the database.
+        save(path): Writes the snapshot to a file.
+        habit_names(): The names of all habits.
+        habits_by_periodicity(periodicity): The names of the habits with a periodicity.
+        completion_days(habit_name): The distinct days a habit was completed on.
+        longest_streak(habit_name): Like analyse.compute_longest_streak.
+        current_streak(habit_name, today): Like analyse.compute_current_streak.
+        longest_streaks(): Like analyse.compute_longest_streaks.
+        longest_streak_overall(): Like analyse.compute_longest_streak_overall.
+        close(): Stops following the connection's writes and releases the mapped file.
+    """
+
+    def __init__(self, db, path=None) -> None:
+        """
+        Creates an empty snapshot following the connection's writes; use load() or open() instead.
+
+        Args:
+            db: The database connection object.
+            path: (Optional) Where save() writes the snapshot. Defaults to next to the database file.
+        """
+        self.db = db
+        self.path = path
+        self._habits = {}        # Habit id -> (name, periodicity), in id order
+        self._ids = {}           # Habit name -> id
+        self._days = {}          # Habit id -> ascending distinct day ordinals (array or view of the mapped file)
+        self._rows = {}          # Habit id -> number of completions, which can be more than the days
+        self._states = {}        # Habit id -> StreakState, computed on first use
+        self._stale = set()      # Habits whose completions changed since they were read
+        self._catalog_stale = False
+        self._fingerprint = None  # The database_fingerprint the habits and days were caught up to
+        self.changed = False     # Whether anything was written since the snapshot was read
+        self._mapping = None
+        self._lock = threading.RLock()
+        add_write_listener(self._on_write)
+
+    @classmethod
+    def load(cls, db, path=None) -> "AnalyticsSnapshot":
+        """
+        Reads every habit and its completed days from the database in a single ordered pass.
+
+        Args:
+            db: The database connection object.
+            path: (Optional) Where save() writes the snapshot.
+
+        Returns:
+            AnalyticsSnapshot: The snapshot.
+        """
+        snapshot = cls(db, path)
+        snapshot.reload()
+        return snapshot
+
+    @classmethod
+    def open(cls, db, path=None) -> "AnalyticsSnapshot":
+        """
+        Maps a saved snapshot into memory, or loads and saves a new one if there is none.
+
+        A saved snapshot the database has moved on from is caught up and saved again.
+
+        Args:
+            db: The database connection object.
+            path: (Optional) The snapshot file. Defaults to next to the database file.
+
+        Returns:
+            AnalyticsSnapshot: The snapshot.
+        """
+        path = path or snapshot_path(db)
+        snapshot = cls(db, path)
+        try:
+            snapshot._map(path)
+        except (OSError, ValueError, KeyError):  # Missing, unreadable or written by an incompatible version
+            snapshot.reload()
+            snapshot.save()
+            return snapshot
+        if snapshot.catch_up():
+            snapshot.save()
+        return snapshot
+
+    def _map(self, path):
+        """Maps a saved snapshot, as of the fingerprint it was saved with."""
+        with open(path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mapping[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a habit snapshot.")
+            start = len(MAGIC) + _LENGTH_BYTES
+            length = int.from_bytes(mapping[len(MAGIC):start], 'little')
+            header = json.loads(mapping[start:start + length])
+            if header['version'] != FORMAT_VERSION or header['byteorder'] != sys.byteorder:
+                raise ValueError(f"{path} was written in an incompatible format.")
+            days = memoryview(mapping)[_aligned(start + length):].cast('I')
+            if len(days) != sum(entry[4] for entry in header['habits']):
+                raise ValueError(f"{path} is truncated.")
+        except Exception:
+            mapping.close()
+            raise
+        with self._lock:
+            for habit_id, name, periodicity, offset, count, rows, *state in header['habits']:
+                self._habits[habit_id] = (name, periodicity)
+                self._ids[name] = habit_id
+                self._days[habit_id] = days[offset:offset + count]
+                self._rows[habit_id] = rows
+                self._states[habit_id] = StreakState(*state)
+            self._fingerprint = header['fingerprint']
+            self._mapping = mapping
+
+    def reload(self) -> None:
+        """Re-reads every habit, its completed days and its number of completions from the database."""
+        cursor = self.db.cursor()
+        columns = progress_columns(cursor)
+        with self._lock:
+            # Taken first, so that anything written during the pass shows up as a change later
+            fingerprint = database_fingerprint(cursor)
+            self._release()
+            self._read_catalog(cursor)
+            self._days = {habit_id: array('I') for habit_id in self._habits}
+            cursor.execute(f'SELECT DISTINCT habit_id, {columns.day_ordinal} FROM progress_log ORDER BY 1, 2')
+            for habit_id, rows in groupby(iter_rows(cursor), key=itemgetter(0)):
+                if habit_id in self._days:
+                    self._days[habit_id] = array('I', map(itemgetter(1), rows))
+            self._rows = dict.fromkeys(self._habits, 0)
+            cursor.execute('SELECT habit_id, COUNT(*) FROM progress_log GROUP BY habit_id')
+            self._rows.update((habit_id, rows) for habit_id, rows in cursor.fetchall() if habit_id in self._habits)
+            self._stale.clear()
+            self._fingerprint = fingerprint
+            self.changed = False
+
+    def catch_up(self) -> bool:
+        """
+        Re-reads the habits whose completions changed in the database since the snapshot was read.
+
+        Habits with completions newer than the highest id the snapshot knows of are found through
+        the primary key. If the completion count then does not add up, some were deleted, and the
+        habits they belonged to are found by comparing every habit's count in one index pass.
+
+        Returns:
+            bool: Whether anything had changed.
+        """
+        cursor = self.db.cursor()
+        with self._lock:
+            if self._fingerprint is None:
+                self.reload()
+                return True
+            fingerprint = database_fingerprint(cursor)
+            if fingerprint == self._fingerprint and not (self._stale or self._catalog_stale):
+                return False
+            self._read_catalog(cursor)
+            cursor.execute('SELECT DISTINCT habit_id FROM progress_log WHERE id > ?', (self._fingerprint[3] or 0,))
+            self._stale.update(row[0] for row in cursor.fetchall())
+            self._refresh()
+            if sum(self._rows.values()) != fingerprint[2]:
+                cursor.execute('SELECT habit_id, COUNT(*) FROM progress_log GROUP BY habit_id')
+                counts = dict(cursor.fetchall())
+                self._stale.update(habit_id for habit_id, rows in self._rows.items() if counts.get(habit_id, 0) != rows)
+                self._refresh()
+            self._fingerprint = fingerprint
+            return True
+
+    def _release(self):
+        """Drops everything read from the mapped file and unmaps it."""
+        self._days.clear()
+        self._rows.clear()
+        self._states.clear()
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:  # A view of it is still referenced somewhere; it is unmapped once collected
+                pass
+            self._mapping = None
+
+    def _read_catalog(self, cursor):
+        cursor.execute('SELECT id, name, periodicity FROM habits ORDER BY id')
+        self._habits = {habit_id: (name, periodicity) for habit_id, name, periodicity in cursor.fetchall()}
+        self._ids = {name: habit_id for habit_id, (name, _) in self._habits.items()}
+        for habit_id in list(self._days):
+            if habit_id not in self._habits:
+                del self._days[habit_id]
+                self._rows.pop(habit_id, None)
+                self._states.pop(habit_id, None)
+        self._stale.update(habit_id for habit_id in self._habits if habit_id not in self._days)
+        self._catalog_stale = False
+
+    def _on_write(self, db, event, habit_ids, tracker) -> None:
+        if db is not self.db:
+            return
+        with self._lock:
+            self.changed = True
+            self._stale.update(habit_ids)
+            if event in ('saved', 'deleted'):
+                self._catalog_stale = True
+
+    def _refresh(self):
+        """Re-reads the habits and completed days that changed since they were read."""
+        cursor = self.db.cursor()
+        if self._catalog_stale:
+            self._read_catalog(cursor)
+        if self._stale:
+            columns = progress_columns(cursor)
+            for habit_id in self._stale & self._habits.keys():
+                cursor.execute(
+                    f'SELECT {columns.day_ordinal}, COUNT(*) FROM progress_log WHERE habit_id = ? GROUP BY 1',
+                    (habit_id,),
+                )
+                rows = cursor.fetchall()
+                self._days[habit_id] = array('I', map(itemgetter(0), rows))
+                self._rows[habit_id] = sum(map(itemgetter(1), rows))
+                self._states.pop(habit_id, None)
+            self._stale.clear()
+
+    def _state(self, habit_id):
+        state = self._states.get(habit_id)
+        if state is None:
+            length = PERIOD_DAYS.get(self._habits[habit_id][1], 1)
+            state = summarize_periods((day - 1) // length for day in self._days[habit_id])  # As streaks.period_of
+            self._states[habit_id] = state
+        return state
+
+    def save(self, path=None) -> str:
+        """
+        Writes the snapshot to a file, replacing it atomically.
+
+        The snapshot is caught up with the database first (see catch_up), so that the file matches
+        the fingerprint it is saved with.
+
+        Args:
+            path: (Optional) The file to write. Defaults to the snapshot's path.
+
+        Returns:
+            str: The path written.
+        """
+        path = path or self.path or snapshot_path(self.db)
+        with self._lock:
+            self.catch_up()
+            offset = 0
+            habits = []
+            for habit_id, (name, periodicity) in self._habits.items():
+                count = len(self._days[habit_id])
+                habits.append([habit_id, name, periodicity, offset, count, self._rows[habit_id],
+                               *self._state(habit_id)])
+                offset += count
+            header = json.dumps({
+                'version': FORMAT_VERSION,
+                'byteorder': sys.byteorder,
+                'fingerprint': self._fingerprint,
+                'habits': habits,
+            }).encode()
+            start = len(MAGIC) + _LENGTH_BYTES + len(header)
+            temporary = f'{path}.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(MAGIC + len(header).to_bytes(_LENGTH_BYTES, 'little') + header)
+                file.write(bytes(_aligned(start) - start))
+                for habit_id in self._habits:
+                    file.write(self._days[habit_id])
+            os.replace(temporary, path)
+            self.changed = False
+        self.path = self.path or path
+        return path
+
+    def _habit_id(self, habit_name):
+        self._refresh()
+        return self._ids.get(habit_name)
+
+    def habit_names(self) -> list:
+        """Returns the names of all habits, in the order they were created."""
+        with self._lock:
+            self._refresh()
+            return list(self._ids)
+
+    def habits_by_periodicity(self, periodicity) -> list:
+        """Returns the names of the habits with the given periodicity, in the order they were created."""
+        with self._lock:
+            self._refresh()
+            return [name for name, habit_periodicity in self._habits.values() if habit_periodicity == periodicity]
+
+    def completion_days(self, habit_name) -> array:
+        """Returns the distinct days (as date ordinals) a habit was completed on, ascending; empty if unknown."""
+        with self._lock:
+            habit_id = self._habit_id(habit_name)
+            return array('I', self._days[habit_id]) if habit_id is not None else array('I')
+
+    def longest_streak(self, habit_name) -> int:
+        """Returns the longest streak of a habit, or 0 if there is no habit with that name."""
+        with self._lock:
+            habit_id = self._habit_id(habit_name)
+            return self._state(habit_id).longest_streak if habit_id is not None else 0
+
+    def current_streak(self, habit_name, today=None) -> int:
+        """Returns the streak a habit is currently on at today (default: the current date), or 0 if unknown."""
+        with self._lock:
+            habit_id = self._habit_id(habit_name)
+            if habit_id is None:
+                return 0
+            return running_streak(self._state(habit_id), self._habits[habit_id][1], today or date.today())
+
+    def longest_streaks(self) -> dict:
+        """Returns the longest streak per habit name. Habits without any completions map to 0."""
+        with self._lock:
+            self._refresh()
+            return {name: self._state(habit_id).longest_streak for habit_id, (name, _) in self._habits.items()}
+
+    def longest_streak_overall(self) -> int:
+        """Returns the longest streak among all habits."""
+        return max(self.longest_streaks().values(), default=0)
+
+    def __contains__(self, habit_name) -> bool:
+        with self._lock:
+            return self._habit_id(habit_name) is not None
+
+    def close(self) -> None:
+        """Stops following the connection's writes and releases the mapped file."""
+        remove_write_listener(self._on_write)
+        with self._lock:
+            self._release()
+            self._habits.clear()
+            self._ids.clear()
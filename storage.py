@@ -0,0 +1,254 @@
+"""
+How completions are stored in progress_log, and how readers get at them regardless of format.
+
+Besides the original tracked_at text column ("%Y-%m-%d %H:%M:%S"), every completion carries
+its time as whole epoch seconds (tracked_epoch) and its calendar day as a date ordinal
+(day_ordinal). Rows written before these columns existed are converted online, in chunks, by
+convert_progress_log. Until that has finished, readers fall back to deriving both values from
+the text column.
+"""
+import calendar
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+# The index on the text column that served ordered history reads before the integer columns existed.
+# convert_progress_log drops it once every row is converted, which is how readers tell the formats apart.
+LEGACY_INDEX = 'idx_progress_log_habit_tracked'
+INTEGER_INDEX = 'idx_progress_log_habit_day'
+
+DEFAULT_BATCH_SIZE = 1000  # Rows fetched per round trip by the streaming readers
+DETECTED_FORMATS = 64      # Connections whose storage format is remembered by progress_columns
+
+TEXT_EPOCH_SQL = "CAST(strftime('%s', progress_log.tracked_at) AS INTEGER)"
+TEXT_DAY_ORDINAL_SQL = "CAST(julianday(progress_log.tracked_at) + 0.5 AS INTEGER) - 1721425"
+
+ProgressColumns = namedtuple('ProgressColumns', ['day_ordinal', 'epoch', 'order'])
+ProgressColumns.__doc__ = """SQL expressions for reading progress_log in its current storage format.
+
+Attributes:
+    day_ordinal (str): The calendar day of a completion as a date ordinal.
+    epoch (str): The time of a completion in epoch seconds.
+    order (str): The columns to sort a habit's completions chronologically by (after habit_id).
+"""
+
+TEXT_COLUMNS = ProgressColumns(TEXT_DAY_ORDINAL_SQL, TEXT_EPOCH_SQL, "progress_log.tracked_at")
+CONVERTING_COLUMNS = ProgressColumns(
+    f"COALESCE(progress_log.day_ordinal, {TEXT_DAY_ORDINAL_SQL})",
+    f"COALESCE(progress_log.tracked_epoch, {TEXT_EPOCH_SQL})",
+    "progress_log.tracked_at",
+)
+INTEGER_COLUMNS = ProgressColumns(
+    "progress_log.day_ordinal",
+    "progress_log.tracked_epoch",
+    "progress_log.day_ordinal, progress_log.tracked_epoch",
+)
+
+
+_detected = OrderedDict()  # Connection -> ProgressColumns, oldest first
+_detected_lock = threading.Lock()
+
+
+def _detect_columns(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name IN (?, ?)", (LEGACY_INDEX, INTEGER_INDEX)
+    )
+    indexes = {row[0] for row in cursor.fetchall()}
+    if INTEGER_INDEX not in indexes:  # The integer columns have not been added yet
+        return TEXT_COLUMNS
+    return CONVERTING_COLUMNS if LEGACY_INDEX in indexes else INTEGER_COLUMNS
+
+
+def _is_open(connection):
+    try:
+        connection.total_changes
+    except sqlite3.ProgrammingError:
+        return False
+    return True
+
+
+def progress_columns(cursor):
+    """
+    Determines how to read progress_log in its current storage format.
+
+    The format is looked up in the schema once per connection and remembered (for the most
+    recent DETECTED_FORMATS connections). The format only ever advances, from text to converting
+    to integer, and the expressions of an earlier format stay correct in a later one, so a
+    connection that has not yet noticed a conversion made through another connection only reads
+    more slowly until forget_progress_columns is called for it.
+
+    Args:
+        cursor: A cursor on the database connection.
+
+    Returns:
+        ProgressColumns: Integer columns once all rows are converted, text-derived expressions before.
+    """
+    connection = cursor.connection
+    columns = _detected.get(connection)
+    if columns is not None:
+        return columns
+    columns = _detect_columns(cursor)
+    with _detected_lock:
+        for known in [known for known in _detected if not _is_open(known)]:
+            del _detected[known]
+        _detected[connection] = columns
+        while len(_detected) > DETECTED_FORMATS:
+            _detected.popitem(last=False)
+    return columns
+
+
+def forget_progress_columns(connection):
+    """Makes progress_columns look up the storage format of a connection again, after its schema changed."""
+    with _detected_lock:
+        _detected.pop(connection, None)
+
+
+def time_range_condition(columns, since=None, until=None, timestamp_format="%Y-%m-%d %H:%M:%S"):
+    """
+    Builds the WHERE condition for completions in a time window, in a form the current indexes can seek on.
+
+    Args:
+        columns: The ProgressColumns returned by progress_columns.
+        since: (Optional) The earliest datetime to include.
+        until: (Optional) The datetime the window ends at (exclusive).
+        timestamp_format: (Optional) The format of the tracked_at text column.
+
+    Returns:
+        tuple: The SQL condition ("1" for an unbounded window) and its parameters.
+    """
+    conditions, parameters = [], []
+    if columns is INTEGER_COLUMNS:
+        # The day bounds let indexes on day_ordinal skip the days outside the window entirely
+        if since is not None:
+            conditions.append("progress_log.day_ordinal >= ? AND progress_log.tracked_epoch >= ?")
+            parameters += [since.toordinal(), epoch_seconds(since)]
+        if until is not None:
+            conditions.append("progress_log.day_ordinal <= ? AND progress_log.tracked_epoch < ?")
+            parameters += [until.toordinal(), epoch_seconds(until)]
+    else:
+        if since is not None:
+            conditions.append("progress_log.tracked_at >= ?")
+            parameters.append(since.strftime(timestamp_format))
+        if until is not None:
+            conditions.append("progress_log.tracked_at < ?")
+            parameters.append(until.strftime(timestamp_format))
+    return " AND ".join(conditions) or "1", tuple(parameters)
+
+
+def iter_rows(cursor, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields the result rows of an executed query, fetching batch_size rows at a time.
+
+    Only one batch is held in memory, however large the result is.
+
+    Args:
+        cursor: A cursor on which a query has been executed.
+        batch_size: (Optional) The number of rows per fetchmany call.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def epoch_seconds(moment):
+    """Returns a (time zone naive) datetime as whole seconds since 1970-01-01."""
+    return calendar.timegm(moment.timetuple())
+
+
+def progress_row(habit_id, tracked_at, timestamp_format="%Y-%m-%d %H:%M:%S"):
+    """
+    Builds the progress_log values for one completion in every stored format.
+
+    Args:
+        habit_id: The id of the habit.
+        tracked_at: The datetime of the completion.
+        timestamp_format: (Optional) The format of the tracked_at text column.
+
+    Returns:
+        tuple: The (habit_id, tracked_at, tracked_epoch, day_ordinal) values.
+    """
+    return habit_id, tracked_at.strftime(timestamp_format), epoch_seconds(tracked_at), tracked_at.toordinal()
+
+
+def add_integer_columns(cursor):
+    """
+    Adds the integer columns, their covering index and a trigger filling them for text-only inserts.
+
+    On a database without any completions there is nothing to convert, so the legacy text index
+    is dropped straight away. Otherwise it stays until convert_progress_log has run.
+
+    Args:
+        cursor: A cursor on the database connection, inside the migration transaction.
+    """
+    cursor.execute('ALTER TABLE progress_log ADD COLUMN tracked_epoch INTEGER')
+    cursor.execute('ALTER TABLE progress_log ADD COLUMN day_ordinal INTEGER')
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS {INTEGER_INDEX}
+        ON progress_log (habit_id, day_ordinal, tracked_epoch)
+    ''')
+    # Writers in this project fill the integer columns themselves; this catches everything else
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS progress_log_integer_columns
+        AFTER INSERT ON progress_log
+        WHEN NEW.tracked_epoch IS NULL OR NEW.day_ordinal IS NULL
+        BEGIN
+            UPDATE progress_log
+            SET tracked_epoch = {TEXT_EPOCH_SQL}, day_ordinal = {TEXT_DAY_ORDINAL_SQL}
+            WHERE id = NEW.id;
+        END
+    ''')
+    if cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM progress_log)').fetchone()[0]:
+        cursor.execute(f'DROP INDEX IF EXISTS {LEGACY_INDEX}')
+    forget_progress_columns(cursor.connection)
+
+
+def convert_progress_log(db, chunk_size=50_000):
+    """
+    Fills the integer columns of rows written before they existed, one chunk per transaction.
+
+    The database stays usable while the conversion runs, and an interrupted conversion simply
+    continues where it stopped on the next call. Once every row is converted, the legacy text
+    index is dropped and readers switch to the integer columns.
+
+    Args:
+        db: The database connection object.
+        chunk_size: (Optional) The number of row ids covered by each transaction.
+
+    Returns:
+        int: The number of rows converted.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+
+    cursor = db.cursor()
+    first, last = cursor.execute('SELECT MIN(id), MAX(id) FROM progress_log WHERE tracked_epoch IS NULL').fetchone()
+    converted = 0
+    start = first
+    while start is not None and start <= last:
+        cursor.execute(
+            f'''
+            UPDATE progress_log
+            SET tracked_epoch = {TEXT_EPOCH_SQL}, day_ordinal = {TEXT_DAY_ORDINAL_SQL}
+            WHERE id BETWEEN ? AND ? AND (tracked_epoch IS NULL OR day_ordinal IS NULL)
+            ''',
+            (start, start + chunk_size - 1),
+        )
+        converted += cursor.rowcount
+        db.commit()
+        start += chunk_size
+
+    cursor.execute(f'DROP INDEX IF EXISTS {LEGACY_INDEX}')
+    db.commit()
+    forget_progress_columns(db)
+    return converted
+
+
+if __name__ == "__main__":
+    from db import initialize_database
+
+    db = initialize_database()
+    print(f"Converted {convert_progress_log(db)} progress log entries.")
@@ -0,0 +1,341 @@
+from array import array
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from storage import DEFAULT_BATCH_SIZE, iter_rows, progress_columns
+
+# The length of one period in days per periodicity. Habits with any other periodicity count as daily.
+PERIOD_DAYS = {'Daily': 1, 'Weekly': 7}
+
+
+def period_sql(day_ordinal_sql):
+    """
+    Builds the SQL expression for the period number of a completion, i.e. (day ordinal - 1) // period length.
+
+    Ordinal 1 is a Monday, so weekly periods line up with ISO weeks. The habits table must be joined in.
+
+    Args:
+        day_ordinal_sql: The SQL expression for the completion's day ordinal (see storage.progress_columns).
+
+    Returns:
+        str: The SQL expression.
+    """
+    cases = " ".join(f"WHEN '{name}' THEN {days}" for name, days in PERIOD_DAYS.items())
+    return f"({day_ordinal_sql} - 1) / CASE habits.periodicity {cases} ELSE 1 END"
+
+StreakState = namedtuple('StreakState', ['current_streak', 'longest_streak', 'last_period'])
+StreakState.__doc__ = """The streak summary of one habit, as stored in the habit_streaks table.
+
+Attributes:
+    current_streak (int): The length of the run that ends at last_period.
+    longest_streak (int): The length of the longest run ever completed.
+    last_period (int): The most recent period with a completion (see period_of), or None.
+"""
+
+EMPTY_STREAK = StreakState(0, 0, None)
+
+
+def period_of(moment, periodicity):
+    """
+    Determines which period of a habit a completion falls into.
+
+    Consecutive periods have consecutive numbers, so a streak is a run of consecutive period numbers.
+
+    Args:
+        moment: The date or datetime of the completion.
+        periodicity: The periodicity of the habit (e.g., 'Daily', 'Weekly').
+
+    Returns:
+        int: The period number.
+    """
+    return (moment.toordinal() - 1) // PERIOD_DAYS.get(periodicity, 1)
+
+
+def summarize_periods(periods):
+    """
+    Folds a chronologically ordered sequence of periods into a streak summary.
+
+    Args:
+        periods: Ascending period numbers. Repeated periods (several completions in one period) are allowed.
+
+    Returns:
+        StreakState: The current run, the longest run and the last period of the sequence.
+    """
+    longest = 0
+    current = 0
+    previous = None
+
+    for period in periods:
+        if period == previous:  # Multiple entries in the same period continue the streak
+            continue
+        if previous is not None and period == previous + 1:
+            current += 1
+        else:  # First completion, or a gap of more than one period starts a new streak
+            current = 1
+        if current > longest:
+            longest = current
+        previous = period
+
+    return StreakState(current, longest, previous)
+
+
+def advance_streak(state, period):
+    """
+    Extends a streak summary by one completion that is not older than state.last_period.
+
+    Args:
+        state: The StreakState before the completion.
+        period: The period of the new completion.
+
+    Returns:
+        StreakState: The updated summary.
+    """
+    if period == state.last_period:
+        return state
+    if state.last_period is not None and period == state.last_period + 1:
+        current = state.current_streak + 1
+    else:
+        current = 1
+    return StreakState(current, max(state.longest_streak, current), period)
+
+
+def fetch_streak_state(cursor, habit_id):
+    """
+    Reads the materialized streak summary of a habit.
+
+    Args:
+        cursor: A cursor on the database connection.
+        habit_id: The id of the habit.
+
+    Returns:
+        StreakState: The stored summary, or None if none has been materialized yet.
+    """
+    cursor.execute(
+        'SELECT current_streak, longest_streak, last_period FROM habit_streaks WHERE habit_id = ?',
+        (habit_id,),
+    )
+    row = cursor.fetchone()
+    return StreakState(*row) if row else None
+
+
+def store_streak_state(cursor, habit_id, state):
+    """Writes the streak summary of a habit, replacing any previous one."""
+    cursor.execute(
+        '''
+        INSERT OR REPLACE INTO habit_streaks (habit_id, current_streak, longest_streak, last_period)
+        VALUES (?, ?, ?, ?)
+        ''',
+        (habit_id, *state),
+    )
+
+
+def scan_streak_state(cursor, habit_id):
+    """
+    Recomputes the streak summary of a habit from its raw progress logs.
+
+    Args:
+        cursor: A cursor on the database connection.
+        habit_id: The id of the habit.
+
+    Returns:
+        StreakState: The summary of the habit's full history.
+    """
+    return summarize_periods(map(itemgetter(1), iter_completion_periods(cursor, habit_id)))
+
+
+def record_completions(cursor, habit_id, periods):
+    """
+    Updates the materialized streak summary of a habit after completions were logged.
+
+    Completions that extend or break the current run are applied incrementally. A back-dated
+    completion (older than the last stored period) or a habit without a stored summary falls
+    back to a rescan of its raw logs, so the new rows must already be inserted.
+
+    Args:
+        cursor: A cursor on the database connection, inside the logging transaction.
+        habit_id: The id of the habit.
+        periods: The periods of the newly logged completions.
+    """
+    state = fetch_streak_state(cursor, habit_id)
+    periods = sorted(periods)
+    if state is None or (periods and state.last_period is not None and periods[0] < state.last_period):
+        state = scan_streak_state(cursor, habit_id)
+    else:
+        for period in periods:
+            state = advance_streak(state, period)
+    store_streak_state(cursor, habit_id, state)
+
+
+def fetch_periodicities(cursor, habit_ids):
+    """Returns the periodicity per habit id of the given habits; ids of unknown habits are left out."""
+    habit_ids = sorted(habit_ids)
+    cursor.execute(
+        f'SELECT id, periodicity FROM habits WHERE id IN ({", ".join("?" * len(habit_ids))})',
+        habit_ids,
+    )
+    return dict(cursor.fetchall())
+
+
+def record_completion_batch(cursor, entries, periodicities=None):
+    """
+    Updates the streak summaries of several habits after a batch of completions was logged.
+
+    Args:
+        cursor: A cursor on the database connection, inside the logging transaction.
+        entries: (habit_id, tracked_at) pairs of the newly logged completions.
+        periodicities: (Optional) The periodicity per habit id, if the caller has already fetched them.
+    """
+    if periodicities is None:
+        periodicities = fetch_periodicities(cursor, {habit_id for habit_id, _ in entries})
+    periods = sorted(
+        (habit_id, period_of(tracked_at, periodicities[habit_id]))
+        for habit_id, tracked_at in entries
+        if habit_id in periodicities  # Completions of unknown habits have no streak to maintain
+    )
+    for habit_id, group in groupby(periods, key=itemgetter(0)):
+        record_completions(cursor, habit_id, [period for _, period in group])
+
+
+def reset_streak(cursor, habit_id):
+    """Resets the streak summary of a habit whose progress was cleared."""
+    store_streak_state(cursor, habit_id, EMPTY_STREAK)
+
+
+def forget_streak(cursor, habit_id):
+    """Removes the streak summary of a deleted habit."""
+    cursor.execute('DELETE FROM habit_streaks WHERE habit_id = ?', (habit_id,))
+
+
+def iter_completion_periods(cursor, habit_id=None, batch_size=DEFAULT_BATCH_SIZE, id_range=None):
+    """
+    Streams the completed periods of one or all habits in a single ordered query.
+
+    Rows are fetched batch_size at a time, so memory use does not grow with the length of the history.
+
+    Args:
+        cursor: A cursor on the database connection. It must not be reused until the iterator is exhausted.
+        habit_id: (Optional) Restricts the result to this habit.
+        batch_size: (Optional) The number of rows per fetchmany call.
+        id_range: (Optional) A (first, last) pair restricting the result to habits with ids in that range.
+
+    Yields:
+        tuple: (habit_id, period) pairs, ordered by habit and then chronologically. A period
+        repeats once per completion in it.
+    """
+    if habit_id is not None:
+        condition, parameters = 'WHERE progress_log.habit_id = ?', (habit_id,)
+    elif id_range is not None:
+        condition, parameters = 'WHERE progress_log.habit_id BETWEEN ? AND ?', tuple(id_range)
+    else:
+        condition, parameters = '', ()
+    columns = progress_columns(cursor)
+    cursor.execute(f'''
+        SELECT progress_log.habit_id, {period_sql(columns.day_ordinal)}
+        FROM progress_log
+        INNER JOIN habits ON habits.id = progress_log.habit_id
+        {condition}
+        ORDER BY progress_log.habit_id, {columns.order}
+    ''', parameters)
+    yield from iter_rows(cursor, batch_size)
+
+
+def load_completion_periods(cursor, habit_id=None):
+    """
+    Loads the distinct completed periods of one or all habits in a single ordered query.
+
+    Each habit's periods are kept in an array('I'), which takes 4 bytes per period instead of
+    a full Python object per completion.
+
+    Args:
+        cursor: A cursor on the database connection.
+        habit_id: (Optional) Restricts the result to this habit.
+
+    Returns:
+        dict: An ascending array('I') of period numbers per habit id. Habits without
+        completions map to an empty array.
+    """
+    if habit_id is None:
+        cursor.execute('SELECT id FROM habits')
+    else:
+        cursor.execute('SELECT id FROM habits WHERE id = ?', (habit_id,))
+    periods = {row[0]: array('I') for row in cursor.fetchall()}
+
+    for group_id, rows in groupby(iter_completion_periods(cursor, habit_id), key=itemgetter(0)):
+        # The periods arrive in ascending order, so dict.fromkeys drops repeats without re-sorting
+        periods[group_id] = array('I', dict.fromkeys(map(itemgetter(1), rows)))
+    return periods
+
+
+def scan_all_streak_states(cursor, batch_size=DEFAULT_BATCH_SIZE, id_range=None):
+    """
+    Recomputes the streak summaries of all habits in a single ordered pass over the progress log.
+
+    Each habit's periods are folded into its summary as they stream in, so memory use grows
+    with the number of habits but not with the length of their histories.
+
+    Args:
+        cursor: A cursor on the database connection.
+        batch_size: (Optional) The number of rows per fetchmany call.
+        id_range: (Optional) A (first, last) pair restricting the scan to habits with ids in that range.
+
+    Returns:
+        dict: The StreakState per habit id. Habits without any completions map to EMPTY_STREAK.
+    """
+    if id_range is None:
+        cursor.execute('SELECT id FROM habits')
+    else:
+        cursor.execute('SELECT id FROM habits WHERE id BETWEEN ? AND ?', tuple(id_range))
+    states = {row[0]: EMPTY_STREAK for row in cursor.fetchall()}
+    periods = iter_completion_periods(cursor, batch_size=batch_size, id_range=id_range)
+    for habit_id, rows in groupby(periods, key=itemgetter(0)):
+        states[habit_id] = summarize_periods(map(itemgetter(1), rows))
+    return states
+
+
+def refresh_all_streaks(cursor, id_range=None):
+    """
+    Replaces every stored streak summary with one recomputed from the raw progress logs.
+
+    Args:
+        cursor: A cursor on the database connection. The caller is responsible for committing.
+        id_range: (Optional) A (first, last) pair restricting the refresh to habits with ids in that range.
+
+    Returns:
+        int: The number of habits whose summary was rebuilt.
+    """
+    states = scan_all_streak_states(cursor, id_range=id_range)
+    if id_range is None:
+        cursor.execute('DELETE FROM habit_streaks')
+    else:
+        cursor.execute('DELETE FROM habit_streaks WHERE habit_id BETWEEN ? AND ?', tuple(id_range))
+    cursor.executemany(
+        '''
+        INSERT INTO habit_streaks (habit_id, current_streak, longest_streak, last_period)
+        VALUES (?, ?, ?, ?)
+        ''',
+        [(habit_id, *state) for habit_id, state in states.items()],
+    )
+    return len(states)
+
+
+def rebuild_habit_streaks(db):
+    """
+    Recomputes the habit_streaks table from the raw progress logs.
+
+    Args:
+        db: The database connection object.
+
+    Returns:
+        int: The number of habits whose summary was rebuilt.
+    """
+    count = refresh_all_streaks(db.cursor())
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    from db import initialize_database
+
+    db = initialize_database()
+    print(f"Rebuilt streaks for {rebuild_habit_streaks(db)} habits.")
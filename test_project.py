@@ -1,8 +1,49 @@
+import asyncio
+import http.client
+import io
+import json
+import os
+import queue
+import random
 import sqlite3
-from datetime import datetime, timedelta
-from counter import HabitTracker
-from analyse import compute_longest_streak, compute_longest_streak_overall
-from db import fetch_all_habit_names, fetch_habits_by_periodicity, get_habit_tracker
+import sys
+import tempfile
+import threading
+import tracemalloc
+from array import array
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+# Set before the project modules are imported, so nothing falling back to the default database touches habits.db
+_DEFAULT_DIRECTORY = tempfile.TemporaryDirectory(prefix='habits-test-')
+os.environ['HABITS_DB'] = os.path.join(_DEFAULT_DIRECTORY.name, 'habits.db')
+
+from counter import (CompletionLog, HabitTracker, add_write_listener, clear_progress_bulk, delete_habits_bulk,
+                     log_progress_bulk, remove_write_listener)
+from catalog import HabitCatalog
+from cache import QueryCache
+from analyse_numpy import completion_rates, load_history, streak_summaries, weekday_histogram
+from analyse import (completion_counts, compute_current_streak, compute_longest_streak, compute_longest_streak_leader,
+                     compute_longest_streak_overall, compute_longest_streaks, longest_streak_leader,
+                     weekday_completion_rates)
+from dedup import disable_unique_periods, enable_unique_periods, unique_periods_enabled
+from retention import compact_database, prune_progress
+from rollups import rebuild_rollups
+from storage import CONVERTING_COLUMNS, INTEGER_COLUMNS, convert_progress_log, epoch_seconds, progress_columns
+from streaks import (EMPTY_STREAK, StreakState, load_completion_periods, period_sql, rebuild_habit_streaks,
+                     scan_all_streak_states, scan_streak_state)
+from writer import FAILED_RANGES_KEPT, BackgroundWriter
+from analyse_parallel import StreakStatistics, compute_streak_statistics, partition, read_only_uri
+from profiling import SAMPLE_WINDOW, ProfiledConnection, QueryProfiler, TimingStats
+from preload_db import SAMPLE_HABITS, generate_dataset, preload_database
+from main import cli, list_habits
+from service import HabitService
+from snapshot import AnalyticsSnapshot, database_fingerprint
+from transfer import TransferCounts, export_dataset, import_dataset, pa
+from db import (MIGRATIONS, ConnectionManager, disable_time_window_index, enable_time_window_index,
+                fetch_all_habit_names, fetch_completions_between, fetch_habit_page, fetch_habits_by_periodicity,
+                get_habit_tracker, initialize_database, iter_habit_names, iter_progress, migrate_database,
+                time_window_index_enabled)
 
 
 def create_test_database():
@@ -26,6 +67,31 @@ def create_test_database():
             FOREIGN KEY (habit_id) REFERENCES habits (id)
         )
     ''')
+    migrate_database(db)
+    return db
+
+def create_legacy_database():
+    """Creates an in-memory database with the original, unversioned and unindexed schema."""
+    db = sqlite3.connect(':memory:')
+    cursor = db.cursor()
+    cursor.execute('''
+        CREATE TABLE habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            periodicity TEXT NOT NULL,
+            creation_date TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE progress_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER,
+            tracked_at TEXT NOT NULL,
+            FOREIGN KEY(habit_id) REFERENCES habits(id)
+        )
+    ''')
+    db.commit()
     return db
 
 def test_habit_creation():
@@ -149,6 +215,1220 @@ def test_get_habit_tracker():
     assert fetched_tracker is not None
     assert fetched_tracker.name == "Learning"
 
+def test_bulk_progress_logging():
+    """Tests logging many completions for one habit in a single call."""
+    db = create_test_database()
+    tracker = HabitTracker("Stretching", "Stretch for 5 minutes", "Daily")
+    tracker.save_to_database(db)
+
+    start = datetime(2024, 1, 1)
+    logged = tracker.log_progress_many(db, (start + timedelta(days=i) for i in range(25)), chunk_size=10)
+
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id = ?", (tracker.habit_id,))
+    assert logged == 25
+    assert cursor.fetchone()[0] == 25
+    assert compute_longest_streak(db, "Stretching") == 25
+
+def test_bulk_progress_logging_multiple_habits():
+    """Tests logging completions for several habits from (habit_id, tracked_at) pairs."""
+    db = create_test_database()
+    walk = HabitTracker("Walking", "Walk 10k steps", "Daily")
+    walk.save_to_database(db)
+    floss = HabitTracker("Flossing", "Floss teeth", "Daily")
+    floss.save_to_database(db)
+
+    day = datetime(2024, 3, 1)
+    entries = [(walk.habit_id, day), (floss.habit_id, day), (walk.habit_id, day + timedelta(days=1))]
+    assert log_progress_bulk(db, entries, chunk_size=2) == 3
+
+    cursor = db.cursor()
+    cursor.execute("SELECT habit_id, COUNT(*) FROM progress_log GROUP BY habit_id")
+    assert dict(cursor.fetchall()) == {walk.habit_id: 2, floss.habit_id: 1}
+
+def test_bulk_progress_logging_is_atomic():
+    """Tests that a failing bulk import leaves no partial history behind."""
+    db = create_test_database()
+    tracker = HabitTracker("Rowing", "Row for 20 minutes", "Daily")
+    tracker.save_to_database(db)
+
+    def entries():
+        yield tracker.habit_id, datetime(2024, 5, 1)
+        yield tracker.habit_id, datetime(2024, 5, 2)
+        yield tracker.habit_id, "not a datetime"
+
+    try:
+        log_progress_bulk(db, entries(), chunk_size=1)
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("Expected the malformed entry to abort the import")
+
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id = ?", (tracker.habit_id,))
+    assert cursor.fetchone()[0] == 0
+
+def test_migration_upgrades_legacy_database():
+    """Tests that an existing unversioned database is upgraded in place, merging duplicate habit names."""
+    db = create_legacy_database()
+    cursor = db.cursor()
+    cursor.executemany("INSERT INTO habits (name, description, periodicity, creation_date) VALUES (?, ?, ?, ?)",
+                       [("Tea", "Drink tea", "Daily", "2024-01-01 08:00:00"),
+                        ("Tea", "Drink tea", "Daily", "2024-01-02 08:00:00")])
+    cursor.executemany("INSERT INTO progress_log (habit_id, tracked_at) VALUES (?, ?)",
+                       [(1, "2024-01-01 09:00:00"), (2, "2024-01-02 09:00:00")])
+    db.commit()
+
+    assert migrate_database(db) == len(MIGRATIONS)
+    assert cursor.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert cursor.execute("SELECT id FROM habits").fetchall() == [(1,)]
+    assert cursor.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id = 1").fetchone()[0] == 2
+    assert compute_longest_streak(db, "Tea") == 2
+    assert completion_counts(db, 'day') == {date(2024, 1, 1): 1, date(2024, 1, 2): 1}  # From the totals
+    assert cursor.execute("SELECT name FROM sqlite_master WHERE tbl_name LIKE '%_rollups' AND type = 'index' "
+                          "AND sql IS NOT NULL").fetchall() == []
+
+    # Running the migrations again is a no-op
+    assert migrate_database(db) == len(MIGRATIONS)
+
+def test_hot_queries_avoid_full_scans():
+    """Tests that the habit lookups and the streak query are answered from indexes."""
+    db = create_test_database()
+    tracker = HabitTracker("Cycling", "Cycle to work", "Daily")
+    tracker.save_to_database(db)
+    tracker.log_progress(db, datetime(2024, 2, 1))
+
+    statements = []
+    db.set_trace_callback(statements.append)
+    get_habit_tracker(db, "Cycling")
+    fetch_habits_by_periodicity(db, "Daily")
+    compute_longest_streak(db, "Cycling")
+    db.set_trace_callback(None)
+
+    queries = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    assert len(queries) == 3
+    for query in queries:
+        plan = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + query)]
+        assert not any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan), (query, plan)
+
+def test_longest_streaks_for_all_habits():
+    """Tests the single-pass streak calculation over gaps, same-day entries and empty habits."""
+    db = create_test_database()
+    gym = HabitTracker("Gym", "Work out", "Daily")
+    gym.save_to_database(db)
+    nap = HabitTracker("Nap", "Take a nap", "Daily")
+    nap.save_to_database(db)
+    idle = HabitTracker("Idle", "Never done", "Daily")
+    idle.save_to_database(db)
+
+    gym.log_progress_many(db, [
+        datetime(2024, 4, 1, 23, 50), datetime(2024, 4, 2, 0, 10),  # Consecutive calendar days
+        datetime(2024, 4, 2, 18, 0), datetime(2024, 4, 3, 7, 0),     # Same-day repeat, then day three
+        datetime(2024, 4, 5, 7, 0),                                  # Gap resets the streak
+    ])
+    nap.log_progress_many(db, [datetime(2024, 4, 10) + timedelta(days=i) for i in range(4)])
+
+    assert compute_longest_streaks(db) == {"Gym": 3, "Nap": 4, "Idle": 0}
+    assert compute_longest_streak(db, "Gym") == 3
+    assert compute_longest_streak_overall(db) == 4
+    assert compute_longest_streak_leader(db) == ("Nap", 4)
+    assert longest_streak_leader({"Gym": 4, "Nap": 4}) == ("Gym", 4)  # Ties go to the habit listed first
+    assert longest_streak_leader({"Idle": 0}) == longest_streak_leader({}) == (None, 0)
+
+def stored_streak_states(db):
+    """Returns the materialized streak summaries keyed by habit id."""
+    cursor = db.cursor()
+    cursor.execute("SELECT habit_id, current_streak, longest_streak, last_period FROM habit_streaks")
+    return {row[0]: StreakState(*row[1:]) for row in cursor.fetchall()}
+
+def test_streak_table_matches_raw_logs():
+    """Tests that incremental streak maintenance agrees with a full recomputation from the raw logs."""
+    db = create_test_database()
+    rng = random.Random(42)
+    trackers = []
+    for i in range(5):
+        tracker = HabitTracker(f"Habit {i}", "Randomized", "Daily" if i % 2 else "Weekly")
+        tracker.save_to_database(db)
+        trackers.append(tracker)
+
+    start = datetime(2024, 1, 1, 12)
+    for step in range(400):
+        tracker = rng.choice(trackers)
+        action = rng.random()
+        if action < 0.80:  # Mostly in order, with the occasional back-dated entry
+            tracker.log_progress(db, start + timedelta(days=step // 4 - rng.choice([0, 0, 0, 1, 5])))
+        elif action < 0.95:
+            tracker.log_progress_many(db, [start + timedelta(days=step // 4 + d) for d in range(rng.randint(1, 4))])
+        elif action < 0.98:
+            tracker.clear_progress(db)
+        else:
+            tracker.delete_from_database(db)
+            trackers.remove(tracker)
+            replacement = HabitTracker(f"Habit {step}", "Randomized", "Daily")
+            replacement.save_to_database(db)
+            trackers.append(replacement)
+
+    expected = scan_all_streak_states(db.cursor())
+    stored = stored_streak_states(db)
+    assert {habit_id: stored.get(habit_id, EMPTY_STREAK) for habit_id in expected} == expected
+    assert set(stored) <= set(expected)  # Deleted habits leave no summary behind
+
+    assert rebuild_habit_streaks(db) == len(expected)
+    assert stored_streak_states(db) == expected
+
+def test_current_streak():
+    """Tests that the current streak runs until a day is skipped."""
+    db = create_test_database()
+    tracker = HabitTracker("Vitamins", "Take vitamins", "Daily")
+    tracker.save_to_database(db)
+    tracker.log_progress_many(db, [datetime(2024, 6, day, 9) for day in (1, 2, 4, 5, 6)])
+
+    assert compute_current_streak(db, "Vitamins", today=datetime(2024, 6, 6).date()) == 3
+    assert compute_current_streak(db, "Vitamins", today=datetime(2024, 6, 7).date()) == 3
+    assert compute_current_streak(db, "Vitamins", today=datetime(2024, 6, 8).date()) == 0
+    assert compute_longest_streak(db, "Vitamins") == 3
+
+def test_weekly_streaks():
+    """Tests that weekly habits count consecutive ISO weeks, including across a year boundary."""
+    db = create_test_database()
+    tracker = HabitTracker("Laundry", "Do the laundry", "Weekly")
+    tracker.save_to_database(db)
+    tracker.log_progress_many(db, [
+        datetime(2024, 12, 16, 10),  # Monday, ISO week 51
+        datetime(2024, 12, 28, 10),  # Saturday, week 52 (a day gap of 12 still continues the streak)
+        datetime(2024, 12, 29, 10),  # Sunday of the same week
+        datetime(2025, 1, 2, 10),    # Thursday, ISO week 1 of 2025
+        datetime(2025, 1, 20, 10),   # Week 4, after skipping week 3
+    ])
+
+    assert compute_longest_streak(db, "Laundry") == 3
+    assert compute_current_streak(db, "Laundry", today=datetime(2025, 1, 26).date()) == 1
+    assert compute_current_streak(db, "Laundry", today=datetime(2025, 1, 27).date()) == 1
+    assert compute_current_streak(db, "Laundry", today=datetime(2025, 2, 3).date()) == 0
+
+    periods = load_completion_periods(db.cursor(), tracker.habit_id)[tracker.habit_id]
+    assert periods.typecode == "I"
+    assert list(periods) == [periods[0] + offset for offset in (0, 1, 2, 5)]
+
+def test_vectorized_analytics():
+    """Tests the NumPy-backed analytics (or their pure-Python fallback) against the streak engine."""
+    db = create_test_database()
+    rng = random.Random(7)
+    for i, periodicity in enumerate(["Daily", "Weekly", "Daily"]):
+        tracker = HabitTracker(f"Habit {i}", "Randomized", periodicity)
+        tracker.save_to_database(db)
+        tracker.log_progress_many(db, [datetime(2023, 11, 1, 7) + timedelta(days=day, hours=rng.choice([0, 15]))
+                                       for day in range(120) if rng.random() < 0.7])
+    HabitTracker("Unused", "Never logged", "Daily").save_to_database(db)
+
+    history = load_history(db)
+    names = dict(db.execute("SELECT id, name FROM habits"))
+    expected = {names[habit_id]: state for habit_id, state in scan_all_streak_states(db.cursor()).items()}
+    assert streak_summaries(history) == expected
+    assert streak_summaries(load_history(db, "Habit 1")) == {"Habit 1": expected["Habit 1"]}
+
+    db = create_test_database()
+    tracker = HabitTracker("Piano", "Practice piano", "Daily")
+    tracker.save_to_database(db)
+    tracker.log_progress_many(db, [datetime(2024, 1, 29, 9), datetime(2024, 1, 29, 20), datetime(2024, 1, 31, 9),
+                                   datetime(2024, 2, 14, 9)])
+    _, days = load_history(db)["Piano"]
+
+    assert weekday_histogram(days) == [1, 0, 2, 0, 0, 0, 0]  # Two Wednesdays and a Monday
+    weekly = completion_rates(days, "week")
+    assert list(weekly) == [datetime(2024, 1, 29).date(), datetime(2024, 2, 5).date(), datetime(2024, 2, 12).date()]
+    assert list(weekly.values()) == [2 / 7, 0.0, 1 / 7]
+    assert completion_rates(days, "month") == {datetime(2024, 1, 1).date(): 2 / 31, datetime(2024, 2, 1).date(): 1 / 29}
+
+def test_connection_manager():
+    """Tests that pooled readers see the writer's commits, stay read-only and run alongside writes."""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = ConnectionManager(os.path.join(directory, "habits.db"), readers=2)
+        with manager.writer() as db:
+            assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            tracker = HabitTracker("Hydrate", "Drink water", "Daily")
+            tracker.save_to_database(db)
+
+        with manager.reader() as db:
+            assert fetch_all_habit_names(db) == ["Hydrate"]
+            try:
+                db.execute("DELETE FROM habits")
+            except sqlite3.OperationalError:
+                pass
+            else:
+                raise AssertionError("Reader connections must be read-only")
+
+        errors = []
+        def read_streaks():
+            try:
+                for _ in range(50):
+                    with manager.reader() as db:
+                        compute_longest_streaks(db)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=read_streaks) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for day in range(50):
+            with manager.writer() as db:
+                tracker.log_progress(db, datetime(2024, 1, 1) + timedelta(days=day))
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert manager._opened <= 2
+        with manager.reader() as db:
+            assert compute_longest_streak(db, "Hydrate") == 50
+        manager.close()
+
+def test_habit_catalog():
+    """Tests that the catalog serves lookups from memory and follows saves and deletions."""
+    db = create_test_database()
+    HabitTracker("Reading", "Read for 30 minutes", "Daily").save_to_database(db)
+    catalog = HabitCatalog(db)
+
+    assert catalog.get("Reading").habit_id == get_habit_tracker(db, "Reading").habit_id
+    assert (catalog.hits, catalog.misses) == (1, 0)
+
+    weekly = HabitTracker("Cleaning", "Clean the flat", "Weekly")
+    weekly.save_to_database(db)
+    assert catalog.get("Cleaning") is weekly
+    assert catalog.get_by_id(weekly.habit_id) is weekly
+    assert catalog.names() == ["Reading", "Cleaning"]
+    assert catalog.names_by_periodicity("Weekly") == ["Cleaning"]
+    assert catalog.misses == 0
+
+    weekly.delete_from_database(db)
+    assert "Cleaning" not in catalog
+    assert catalog.names_by_periodicity("Weekly") == []
+
+    # A habit created through another path is picked up on its first lookup
+    db.execute("INSERT INTO habits (name, description, periodicity, creation_date) "
+               "VALUES ('Baking', 'Bake bread', 'Weekly', '2024-01-01 10:00:00')")
+    db.commit()
+    misses = catalog.misses
+    assert catalog.get("Baking").periodicity == "Weekly"
+    assert catalog.get("Baking").habit_id is not None
+    assert catalog.misses == misses + 1
+
+    catalog.close()
+    HabitTracker("Painting", "Paint", "Weekly").save_to_database(db)
+    assert "Painting" not in catalog.names()
+
+def test_compact_habit_objects():
+    """Tests the slotted HabitTracker, hydration from stored rows and the array-backed CompletionLog."""
+    db = create_test_database()
+    tracker = HabitTracker("Chess", "Play a game of chess", "Daily")
+    tracker.creation_date = "2023-05-01 12:00:00"
+    tracker.save_to_database(db)
+    assert not hasattr(tracker, "__dict__")
+
+    fetched = get_habit_tracker(db, "Chess")
+    assert (fetched.habit_id, fetched.periodicity, fetched.creation_date) == (tracker.habit_id, "Daily",
+                                                                               "2023-05-01 12:00:00")
+
+    moments = [datetime(2024, 2, 28, 23, 59, 59), datetime(2024, 2, 29, 0, 0), datetime(2024, 3, 1, 6, 30)]
+    tracker.log_progress_many(db, reversed(moments))
+    log = CompletionLog.load(db, tracker.habit_id)
+    assert log.timestamps.typecode == "q"
+    assert list(log) == moments
+    assert list(log.day_ordinals()) == [moment.toordinal() for moment in moments]
+
+    log.append(datetime(2024, 3, 2, 8))
+    assert len(log) == 4
+    assert CompletionLog.load(db, 12345).timestamps.tolist() == []
+
+def test_integer_progress_storage():
+    """Tests the online conversion of text timestamps and that readers see the same history in every format."""
+    db = create_legacy_database()
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO habits (name, description, periodicity, creation_date) "
+                   "VALUES ('Tea', 'Drink tea', 'Daily', '2024-01-01 08:00:00')")
+    cursor.executemany("INSERT INTO progress_log (habit_id, tracked_at) VALUES (1, ?)",
+                       [(f"2024-01-{day:02d} 23:30:00",) for day in range(1, 8)])
+    db.commit()
+    migrate_database(db)
+    tea = get_habit_tracker(db, "Tea")
+    tea.log_progress(db, datetime(2024, 1, 8, 6))
+
+    assert progress_columns(cursor) == CONVERTING_COLUMNS
+    before = list(CompletionLog.load(db, 1))
+    tail = list(iter_progress(db, 1, since=datetime(2024, 1, 7)))
+    assert [day for _, day in tail] == [datetime(2024, 1, day).toordinal() for day in (7, 8)]
+    assert scan_all_streak_states(cursor)[1].longest_streak == 8
+
+    assert convert_progress_log(db, chunk_size=3) == 7
+    assert progress_columns(cursor) == INTEGER_COLUMNS
+    assert cursor.execute("SELECT COUNT(*) FROM progress_log WHERE tracked_epoch IS NULL "
+                          "OR day_ordinal IS NULL").fetchone()[0] == 0
+    assert list(CompletionLog.load(db, 1)) == before
+    assert list(iter_progress(db, 1, since=datetime(2024, 1, 7))) == tail
+    assert scan_all_streak_states(cursor)[1].longest_streak == 8
+    assert convert_progress_log(db) == 0
+
+    # Text-only inserts from other tools are filled in by the trigger
+    cursor.execute("INSERT INTO progress_log (habit_id, tracked_at) VALUES (1, '2024-01-09 12:00:00')")
+    assert cursor.execute("SELECT tracked_epoch, day_ordinal FROM progress_log WHERE id = last_insert_rowid()"
+                          ).fetchone() == (1704801600, datetime(2024, 1, 9).toordinal())
+
+    fresh = create_test_database()
+    assert progress_columns(fresh.cursor()) == INTEGER_COLUMNS
+
+    # The format is looked up once per connection, not by every reader and writer
+    assert progress_columns(cursor) == INTEGER_COLUMNS
+    statements = []
+    db.set_trace_callback(statements.append)
+    assert progress_columns(db.cursor()) == progress_columns(cursor) == INTEGER_COLUMNS
+    list(iter_progress(db, 1))
+    db.set_trace_callback(None)
+    assert not any('sqlite_master' in statement for statement in statements)
+
+
+def test_streaming_readers_use_constant_memory():
+    """Tests that streak folds and history readers stream a 5M-row progress log instead of materializing it."""
+    db = create_test_database()
+    cursor = db.cursor()
+    tracker = HabitTracker("Hourly", "Logged every hour", "Daily")
+    tracker.save_to_database(db)
+    start = datetime(2000, 1, 1)
+    rows = 5_000_000
+    # One completion per hour, generated inside SQLite so only the readers allocate Python objects
+    cursor.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1)
+        INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal)
+        SELECT ?, '', ? + i * 3600, ? + i / 24 FROM n
+    ''', (rows, tracker.habit_id, epoch_seconds(start), start.toordinal()))
+    db.commit()
+
+    tracemalloc.start()
+    try:
+        state = scan_streak_state(cursor, tracker.habit_id)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    days = -(-rows // 24)
+    assert state == StreakState(days, days, start.toordinal() + days - 2)
+    assert peak < 1024 * 1024  # A materialized history would take hundreds of MB
+
+    last_day = start + timedelta(days=days - 1)
+    tail = list(iter_progress(db, tracker.habit_id, since=last_day, batch_size=7))
+    assert len(tail) == rows - (days - 1) * 24
+    assert tail[0] == (epoch_seconds(last_day), last_day.toordinal())
+    assert list(iter_habit_names(db, batch_size=1)) == fetch_all_habit_names(db) == ["Hourly"]
+
+
+def test_synthetic_dataset():
+    """Tests that generated datasets are reproducible and leave indexes and streak summaries intact."""
+    def dump(db):
+        return db.execute("SELECT habit_id, tracked_at, tracked_epoch, day_ordinal FROM progress_log ORDER BY id").fetchall()
+
+    first, second = create_test_database(), create_test_database()
+    indexes = "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name"
+    expected_indexes = first.execute(indexes).fetchall()
+    rows = generate_dataset(first, 20, 60, probability=0.7, seed=7)
+    assert generate_dataset(second, 20, 60, probability=0.7, seed=7, fast=True) == rows
+    assert dump(first) == dump(second)
+    assert 0.6 < rows / (20 * 60) < 0.8
+    assert first.execute(indexes).fetchall() == expected_indexes
+    assert first.execute("PRAGMA synchronous").fetchone() == second.execute("PRAGMA synchronous").fetchone()
+    assert fetch_habits_by_periodicity(first, "Weekly") == [f"Habit {i}" for i in range(2, 21, 2)]
+
+    # Timestamps, epochs and day ordinals describe the same moments
+    for _, tracked_at, epoch, ordinal in dump(first)[::97]:
+        moment = datetime.strptime(tracked_at, "%Y-%m-%d %H:%M:%S")
+        assert (epoch_seconds(moment), moment.toordinal()) == (epoch, ordinal)
+
+    assert stored_streak_states(first) == scan_all_streak_states(first.cursor())
+    assert generate_dataset(first, 1, 10, probability=1.0) == 10
+    assert "Habit 21" in fetch_all_habit_names(first)
+
+    # Appending refreshes only the new habits, which leaves the same summaries as a full rebuild
+    rollups = "SELECT 'day', * FROM daily_rollups UNION ALL SELECT 'week', * FROM weekly_rollups " \
+              "UNION ALL SELECT 'days', NULL, * FROM daily_totals ORDER BY 1, 2, 3"
+    assert stored_streak_states(first) == scan_all_streak_states(first.cursor())
+    appended = first.execute(rollups).fetchall()
+    rebuild_rollups(first)
+    assert first.execute(rollups).fetchall() == appended
+
+    # Names stay unique during the load: "Habit 23" would be the name of the next generated habit
+    HabitTracker("Habit 23", "", "Daily").save_to_database(first)
+    try:
+        generate_dataset(first, 1, 10)
+        assert False, "A generated name must not collide with an existing habit"
+    except sqlite3.IntegrityError:
+        pass
+    assert first.execute(indexes).fetchall() == expected_indexes
+    assert first.execute("SELECT COUNT(*) FROM habits WHERE name = 'Habit 23'").fetchone() == (1,)
+
+    db = create_test_database()
+    assert preload_database(db) > 0
+    assert preload_database(db) == 0  # The samples are only loaded once
+    assert sorted(fetch_all_habit_names(db)) == sorted(name for name, _, _ in SAMPLE_HABITS)
+
+
+def test_query_profiler():
+    """Tests that an instrumented connection records statement counts, rows and latencies, and plain ones stay plain."""
+    assert type(initialize_database(':memory:')) is sqlite3.Connection
+
+    profiler = QueryProfiler()
+    db = initialize_database(':memory:', profiler=profiler)
+    assert isinstance(db, ProfiledConnection)
+    with profiler.action("Create a New Habit"):
+        tracker = HabitTracker("Run", "Go for a run", "Daily")
+        tracker.save_to_database(db)
+    tracker.log_progress_many(db, [datetime(2024, 1, day, 7) for day in range(1, 11)])
+    for _ in range(3):
+        assert fetch_all_habit_names(db) == ["Run"]
+    assert len(list(iter_progress(db, tracker.habit_id, batch_size=4))) == 10
+
+    statements = {entry['sql']: entry for entry in profiler.report()['statements']}
+    names = statements['SELECT name FROM habits']
+    assert (names['calls'], names['rows']) == (3, 3)
+    inserts = next(entry for sql, entry in statements.items() if sql.startswith('INSERT INTO progress_log'))
+    assert (inserts['calls'], inserts['executions'], inserts['rows']) == (1, 10, 10)
+    history = next(entry for sql, entry in statements.items() if 'FROM progress_log WHERE' in sql)
+    assert history['rows'] == 10 and history['p50_ms'] <= history['p99_ms'] <= history['max_ms']
+    assert statements['COMMIT']['calls'] >= 2
+    assert profiler.report()['actions'][0]['action'] == "Create a New Habit"
+    assert "SELECT name FROM habits" in profiler.summary(limit=len(statements))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profile.json')
+        profiler.write_json(path)
+        with open(path) as file:
+            assert json.load(file) == profiler.report()
+
+    # A long-running process keeps a bounded window of samples; the totals still cover every call
+    stats = TimingStats()
+    for millisecond in range(1, 2 * SAMPLE_WINDOW + 1):
+        stats.calls += 1
+        stats.record(millisecond / 1000)
+    figures = stats.as_dict()
+    assert len(stats.samples) == SAMPLE_WINDOW and figures['calls'] == 2 * SAMPLE_WINDOW
+    assert figures['p50_ms'] > SAMPLE_WINDOW and figures['max_ms'] == 2 * SAMPLE_WINDOW  # Recent calls only
+    assert abs(figures['total_ms'] - SAMPLE_WINDOW * (2 * SAMPLE_WINDOW + 1)) < 1
+
+
+def test_background_writer():
+    """Tests batched background writes from several threads, flush semantics and backpressure."""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = ConnectionManager(os.path.join(directory, 'habits.db'))
+        with manager.writer() as db:
+            trackers = [HabitTracker(f"Sensor {i}", "Synced from a device", "Daily") for i in range(4)]
+            for tracker in trackers:
+                tracker.save_to_database(db)
+
+        with BackgroundWriter(manager, max_pending=50, batch_size=100) as writer:
+            def produce(tracker):
+                for day in range(200):
+                    writer.submit(tracker.habit_id, datetime(2024, 1, 1, 8) + timedelta(days=day))
+
+            threads = [threading.Thread(target=produce, args=(tracker,)) for tracker in trackers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert writer.flush(timeout=10)
+            assert writer.committed == 800 and writer.batches < 800
+            with manager.reader() as db:
+                assert db.execute("SELECT COUNT(*) FROM progress_log").fetchone()[0] == 800
+                assert compute_longest_streaks(db) == {tracker.name: 200 for tracker in trackers}
+
+            # A stalled writer thread makes submit block, and fail once its timeout runs out
+            stalled, release = threading.Event(), threading.Event()
+
+            def stall(db, event, habit_ids, tracker):
+                stalled.set()
+                release.wait()
+
+            add_write_listener(stall)
+            try:
+                sequence = writer.submit(trackers[0].habit_id)
+                assert stalled.wait(5)
+                for _ in range(50):
+                    writer.submit(trackers[0].habit_id, timeout=1)
+                assert writer.pending() == 50
+                try:
+                    writer.submit(trackers[0].habit_id, timeout=0.01)
+                    assert False, "submit should fail while the queue is full"
+                except queue.Full:
+                    pass
+                assert not writer.wait_for(sequence, timeout=0.01)
+            finally:
+                release.set()
+                remove_write_listener(stall)
+            assert writer.wait_for(sequence, timeout=10) and writer.flush(timeout=10)
+        assert writer.committed == 851
+        try:
+            writer.submit(trackers[0].habit_id)
+            assert False, "submit should fail after close"
+        except RuntimeError:
+            pass
+
+        # Submits racing close() are either refused or written, never stranded behind the stop marker
+        writer = BackgroundWriter(manager, max_pending=10, batch_size=5)
+        accepted = []
+
+        def submit_until_closed():
+            try:
+                while True:
+                    accepted.append(writer.submit(trackers[1].habit_id))
+            except RuntimeError:
+                pass
+
+        threads = [threading.Thread(target=submit_until_closed) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while len(accepted) < 20:
+            threading.Event().wait(0.001)
+        writer.close(timeout=10)
+        for thread in threads:
+            thread.join(10)
+        assert not writer._thread.is_alive() and writer.committed == len(accepted)
+        assert writer.flush(timeout=1)
+
+        # Deterministically: a submit still waiting for the lock when close() begins is refused
+        writer = BackgroundWriter(manager)
+        outcome = []
+
+        def late_submit():
+            try:
+                outcome.append(writer.submit(trackers[1].habit_id))
+            except RuntimeError as error:
+                outcome.append(error)
+
+        with writer._submit_lock:
+            late = threading.Thread(target=late_submit)
+            late.start()
+            late.join(0.05)  # Now blocked on the lock
+            writer._closed = True  # What close() does before taking the lock
+        late.join(10)
+        assert isinstance(outcome[0], RuntimeError) and writer.pending() == 0
+        writer._closed = False
+        writer.close(timeout=10)
+
+        # An unknown habit id fails only its own event, not the batch it was coalesced into
+        writer = BackgroundWriter(manager, batch_size=1000)
+        stalled.clear()
+        release.clear()
+        add_write_listener(stall)
+        try:  # The first event holds the writer thread back until the others are queued
+            writer.submit(trackers[3].habit_id, datetime(2022, 1, 1, 8))
+            assert stalled.wait(5)
+            good = [writer.submit(trackers[2].habit_id, datetime(2023, 1, 1, 8) + timedelta(days=day))
+                    for day in range(400)]
+            bad = writer.submit(10_000, datetime(2024, 1, 1, 8))
+        finally:
+            release.set()
+            remove_write_listener(stall)
+        assert writer.wait_for(good[-1], timeout=10)
+        try:
+            writer.wait_for(bad, timeout=10)
+            assert False, "The event of an unknown habit must fail"
+        except RuntimeError:
+            pass
+        assert (writer.committed, writer.failed, writer.batches) == (401, 1, 2)
+        writer.close(timeout=10)
+
+        # Failures are remembered for waiters, but only the most recent ones for everybody else
+        with writer._done:
+            writer._failed_ranges.clear()
+            writer._waiting.append(5)
+            writer._record_failures(range(1, 4 * FAILED_RANGES_KEPT, 2))
+            assert writer._failed_ranges[0] == (5, 5) and len(writer._failed_ranges) > FAILED_RANGES_KEPT
+            writer._waiting.clear()
+            writer._record_failures([4 * FAILED_RANGES_KEPT + 1])
+        assert len(writer._failed_ranges) == FAILED_RANGES_KEPT
+        assert writer._failed_ranges[-1] == (4 * FAILED_RANGES_KEPT + 1,) * 2
+        manager.close()
+
+
+def test_parallel_streak_statistics():
+    """Tests that the process pool runner agrees with a serial scan and only reads the database."""
+    assert partition([1, 2, 3, 5, 8, 13, 21], 3) == [(1, 2), (3, 5), (8, 21)]
+    assert partition([4], 8) == [(4, 4)] and partition([], 4) == []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'habits.db')
+        db = initialize_database(path)
+        generate_dataset(db, 30, 120, probability=0.85, seed=3, start=datetime(2024, 1, 1, 6))
+        HabitTracker("Unused", "Never completed", "Weekly").save_to_database(db)
+        today = datetime(2024, 4, 30).date()
+        names = dict(db.execute("SELECT id, name FROM habits"))
+        periodicities = dict(db.execute("SELECT name, periodicity FROM habits"))
+        expected = {
+            names[habit_id]: StreakStatistics(periodicities[names[habit_id]],
+                                              compute_current_streak(db, names[habit_id], today),
+                                              state.longest_streak, state.last_period)
+            for habit_id, state in scan_all_streak_states(db.cursor()).items()
+        }
+        assert expected["Unused"] == StreakStatistics("Weekly", 0, 0, None)
+        assert compute_streak_statistics(path, workers=1, today=today) == expected
+        assert compute_streak_statistics(path, workers=2, chunks_per_worker=3, today=today) == expected
+
+        reader = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            reader.execute("DELETE FROM progress_log")
+            assert False, "a read-only connection must not write"
+        except sqlite3.OperationalError:
+            pass
+        reader.close()
+        db.close()
+
+
+def test_range_queries_use_indexes():
+    """Tests time-window and keyset-paged reads, and that each one seeks on an index."""
+    db = create_test_database()
+    generate_dataset(db, 45, 90, probability=0.9, seed=5, start=datetime(2024, 1, 1, 6), spread=600)
+    assert not time_window_index_enabled(db.cursor())  # Opt-in, since every write pays for it
+    enable_time_window_index(db)
+    assert time_window_index_enabled(db.cursor())
+    since, until = datetime(2024, 3, 1, 12), datetime(2024, 3, 11)
+    rows = db.execute("SELECT habit_id, tracked_epoch, day_ordinal FROM progress_log").fetchall()
+    expected = sorted((row for row in rows if epoch_seconds(since) <= row[1] < epoch_seconds(until)),
+                      key=lambda row: (row[2], row[1]))
+
+    statements = []
+    db.set_trace_callback(statements.append)
+    window = fetch_completions_between(db, since, until)
+    first = fetch_completions_between(db, since, limit=5)
+    history = list(iter_progress(db, 7, since=since, until=until))
+    pages, after_id = [], 0
+    while True:
+        page = fetch_habit_page(db, after_id, limit=10)
+        pages.append(page)
+        if len(page) < 10:
+            break
+        after_id = page[-1].habit_id
+    weekly = fetch_habit_page(db, 20, limit=5, periodicity="Weekly")
+    db.set_trace_callback(None)
+
+    assert [row[1] for row in window] == [row[1] for row in expected]
+    assert sorted(window) == sorted(expected) and first == window[:5]
+    assert history == [(epoch, day) for habit_id, epoch, day in expected if habit_id == 7]
+    assert [len(page) for page in pages] == [10, 10, 10, 10, 5]
+    assert [tracker.habit_id for page in pages for tracker in page] == list(range(1, 46))
+    assert [tracker.habit_id for tracker in weekly] == [22, 24, 26, 28, 30]
+
+    queries = [statement for statement in statements
+               if statement.lstrip().upper().startswith("SELECT") and "sqlite_master" not in statement]
+    assert len(queries) == 3 + len(pages) + 1
+    for query in queries:
+        plan = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + query)]
+        assert all(step.startswith("SEARCH") for step in plan), (query, plan)
+        assert not any("TEMP B-TREE" in step for step in plan), (query, plan)
+
+    disable_time_window_index(db)
+    assert fetch_completions_between(db, since, until) == window and not time_window_index_enabled(db.cursor())
+
+
+def test_rollups_match_raw_logs():
+    """Tests that the day and week rollups follow every write path and answer range aggregates like a raw scan."""
+    db = create_test_database()
+    rng = random.Random(11)
+    trackers = [HabitTracker(f"Habit {i}", "Rolled up", periodicity)
+                for i, periodicity in enumerate(["Daily", "Weekly"] * 2)]
+    for tracker in trackers:
+        tracker.save_to_database(db)
+    start = datetime(2023, 11, 20, 7)
+    for tracker in trackers:
+        tracker.log_progress_many(db, [start + timedelta(days=day, hours=rng.randrange(12))
+                                       for day in range(120) for _ in range(rng.choice((0, 1, 1, 2)))])
+    for _ in range(30):  # Single and back-dated completions
+        rng.choice(trackers).log_progress(db, start + timedelta(days=rng.randrange(150), hours=5))
+    trackers[2].clear_progress(db)
+    trackers[2].log_progress(db, datetime(2024, 1, 3, 9))
+    trackers[3].delete_from_database(db)
+
+    def raw(habit_name=None):
+        query = "SELECT day_ordinal FROM progress_log JOIN habits ON habits.id = progress_log.habit_id"
+        return [row[0] for row in db.execute(query + " WHERE name = ?" if habit_name else query,
+                                             (habit_name,) if habit_name else ())]
+
+    def counted(days, key):
+        counts = {}
+        for day in sorted(days):
+            counts[key(date.fromordinal(day))] = counts.get(key(date.fromordinal(day)), 0) + 1
+        return counts
+
+    since, until = date(2023, 12, 13), date(2024, 3, 2)
+    window = [day for day in raw() if since.toordinal() <= day < until.toordinal()]
+    assert completion_counts(db, 'day', since=since, until=until) == counted(window, lambda day: day)
+    assert completion_counts(db, 'month', since=since, until=until) == counted(window, lambda day: day.replace(day=1))
+    assert completion_counts(db, 'month', "Habit 0") == counted(raw("Habit 0"), lambda day: day.replace(day=1))
+    monday = lambda day: day - timedelta(days=day.weekday())
+    assert completion_counts(db, 'week', "Habit 1") == counted(raw("Habit 1"), monday)
+    assert completion_counts(db, 'week', "Habit 2") == {date(2024, 1, 1): 1}
+    assert completion_counts(db, 'day', "Habit 3") == {}
+
+    days = sorted(set(raw("Habit 0")))
+    expected_rates = []
+    for weekday in range(7):
+        candidates = [day for day in range(days[0], days[-1] + 1) if (day - 1) % 7 == weekday]
+        expected_rates.append(sum(day in days for day in candidates) / len(candidates))
+    assert weekday_completion_rates(db, "Habit 0") == expected_rates
+    assert weekday_completion_rates(db, "Habit 3") == [0.0] * 7
+    assert sum(weekday_completion_rates(db, "Habit 2", date(2024, 1, 1), date(2024, 1, 8))) == 1.0
+
+    tables = "SELECT 'day', * FROM daily_rollups UNION ALL SELECT 'week', * FROM weekly_rollups " \
+             "UNION ALL SELECT 'days', NULL, * FROM daily_totals ORDER BY 1, 2, 3"
+    maintained = db.execute(tables).fetchall()
+    rebuild_rollups(db)
+    assert db.execute(tables).fetchall() == maintained
+
+
+def test_command_line():
+    """Tests the non-interactive subcommands, which must not load the interactive prompt library."""
+    def run(*argv):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = cli(['--database', path, *argv])
+        return status, output.getvalue()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cli.db')
+        db = initialize_database(path)
+        HabitTracker("Study", "Study for an hour", "Daily").save_to_database(db)
+        HabitTracker("Laundry", "Do the laundry", "Weekly").save_to_database(db)
+        db.close()
+
+        assert run('log', 'Study', '--at', '2024-10-06 08:30') == (0, "Habit 'Study' incremented!\n")
+        assert run('log', 'Study')[0] == 0
+        assert run('log', 'Unknown')[0] == 1
+        assert run('list') == (0, "Study\nLaundry\n")
+        assert run('list', '--periodicity', 'Weekly') == (0, "Laundry\n")
+        assert run('streak', 'Study') == (0, "Current streak: 1\nLongest streak: 1\n")
+        assert run('streak') == (0, "Study\t1\nLaundry\t0\n")
+
+        export_path = os.path.join(directory, 'completions.csv')
+        assert run('export', '--output', export_path) == (0, "")
+        with open(export_path) as file:
+            lines = file.read().splitlines()
+        assert lines[:2] == ["habit,periodicity,tracked_at", "Study,Daily,2024-10-06 08:30:00"] and len(lines) == 3
+    assert 'questionary' not in sys.modules
+
+
+def test_export_import_round_trip():
+    """Tests that datasets survive export and import in every format, and that re-imports add nothing."""
+    source = initialize_database(':memory:')
+    generate_dataset(source, 6, 60, seed=5)
+    HabitTracker("Unused", 'Never done, "quoted"', "Weekly").save_to_database(source)
+    completions = "SELECT name, tracked_at, tracked_epoch, day_ordinal FROM progress_log " \
+                  "JOIN habits ON habits.id = progress_log.habit_id ORDER BY 1, 2"
+    habits = "SELECT name, description, periodicity, creation_date FROM habits ORDER BY name"
+    rollups = "SELECT name, day_ordinal, daily_rollups.completions FROM daily_rollups " \
+              "JOIN habits ON habits.id = daily_rollups.habit_id ORDER BY 1, 2"
+    expected_rows = source.execute(completions).fetchall()
+
+    formats = ['ndjson', 'csv'] + (['parquet'] if pa is not None else [])
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in formats:
+            path = os.path.join(directory, file_format)
+            assert export_dataset(source, path, file_format, chunk_size=50) == (7, len(expected_rows), 0)
+
+            target = initialize_database(':memory:')
+            HabitTracker("Habit 1", "Already here", "Daily").save_to_database(target)
+            catalog = HabitCatalog(target)
+            assert import_dataset(target, path, chunk_size=50) == TransferCounts(6, len(expected_rows), 1)
+            assert catalog.get("Unused").habit_id is not None  # Listeners learn about imported habits
+            imported_habits = target.execute(habits).fetchall()
+            assert imported_habits[0][:3] == ("Habit 1", "Already here", "Daily")  # Existing habits are kept
+            assert imported_habits[1:] == source.execute(habits).fetchall()[1:]
+            assert target.execute(completions).fetchall() == expected_rows
+            assert target.execute(rollups).fetchall() == source.execute(rollups).fetchall()
+            assert compute_longest_streaks(target) == compute_longest_streaks(source)
+            assert import_dataset(target, path) == TransferCounts(0, 0, 7 + len(expected_rows))
+            catalog.close()
+
+        # Repeated lines within a file are imported once; an unknown habit rolls the whole import back
+        path = os.path.join(directory, 'ndjson', 'completions.ndjson')
+        with open(path, 'a') as file:
+            file.write('{"habit": "Habit 2", "tracked_at": "2030-01-01T07:00:00"}\n' * 2)
+        target = initialize_database(':memory:')
+        assert import_dataset(target, os.path.dirname(path)).completions == len(expected_rows) + 1
+        assert target.execute("SELECT tracked_at FROM progress_log ORDER BY tracked_epoch DESC").fetchone() == \
+            ("2030-01-01 07:00:00",)
+        with open(path, 'a') as file:
+            file.write('{"habit": "Missing", "tracked_at": "2030-01-02 07:00:00"}\n')
+        target = initialize_database(':memory:')
+        try:
+            import_dataset(target, os.path.dirname(path))
+            assert False, "Completions of unknown habits must be rejected"
+        except ValueError:
+            pass
+        assert target.execute("SELECT COUNT(*) FROM habits").fetchone() == (0,)
+
+        if pa is None:
+            try:
+                export_dataset(source, directory, 'parquet')
+                assert False, "Parquet needs pyarrow"
+            except ImportError:
+                pass
+
+
+def test_http_service():
+    """Tests the HTTP endpoints end to end, over keep-alive connections to a service on its own event loop."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    with tempfile.TemporaryDirectory() as directory:
+        manager = ConnectionManager(os.path.join(directory, 'service.db'), readers=2)
+        service = HabitService(manager, workers=2)
+        server = asyncio.run_coroutine_threadsafe(service.start('127.0.0.1', 0), loop).result()
+        connection = http.client.HTTPConnection('127.0.0.1', server.sockets[0].getsockname()[1], timeout=10)
+
+        def call(method, path, body=None):
+            connection.request(method, path, json.dumps(body) if body is not None else None)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        try:
+            created = call('POST', '/habits', {"name": "Morning Run", "description": "5 km", "periodicity": "Daily"})
+            assert created[0] == 201 and created[1]['name'] == "Morning Run"
+            assert call('POST', '/habits', {"name": "Morning Run", "periodicity": "Daily"})[0] == 409
+            assert call('POST', '/habits', {"name": "Bad", "periodicity": "Hourly"})[0] == 400
+            assert call('POST', '/habits', [1])[0] == 400
+            for day in (date.today() - timedelta(days=1), date.today()):
+                status, body = call('POST', '/habits/Morning%20Run/completions', {"tracked_at": f"{day}T07:00"})
+                assert status == 201 and body['tracked_at'] == f"{day} 07:00:00"
+            assert call('POST', '/habits/Morning%20Run/completions', {"tracked_at": "yesterday"})[0] == 400
+            assert call('GET', '/habits/Morning%20Run/streak') == (200, {
+                'habit': "Morning Run", 'periodicity': "Daily", 'current_streak': 2, 'longest_streak': 2})
+            assert call('GET', '/habits?periodicity=Daily') == (200, {'habits': ["Morning Run"]})
+            assert call('GET', '/habits?periodicity=Weekly') == (200, {'habits': []})
+            assert call('DELETE', '/habits/Morning%20Run/completions') == (200, {'habit': "Morning Run", 'reset': True})
+            assert call('GET', '/habits/Morning%20Run/streak')[1]['longest_streak'] == 0
+            assert call('DELETE', '/habits/Morning%20Run')[0] == 200
+            assert call('GET', '/habits/Morning%20Run/streak')[0] == 404
+            assert call('DELETE', '/habits/Morning%20Run')[0] == 404
+            assert call('PUT', '/habits')[0] == 405
+            assert call('GET', '/nothing')[0] == 404
+
+            status, metrics = call('GET', '/metrics')
+            assert status == 200 and metrics['rejected'] == 0
+            calls = {entry['action']: entry['calls'] for entry in metrics['endpoints']}
+            assert calls['POST /habits'] == 4 and calls['GET /habits/{name}/streak'] == 3
+            assert all(entry['p99_ms'] >= entry['p50_ms'] > 0 for entry in metrics['endpoints'])
+
+            # With no room for database work in flight, requests are turned away instead of queued
+            service.max_pending = 0
+            assert call('GET', '/habits')[0] == 503 and service.rejected == 1
+        finally:
+            connection.close()
+            asyncio.run_coroutine_threadsafe(service.stop(), loop).result()
+            manager.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_query_cache():
+    """Tests that cached streak and listing queries match the uncached ones and follow every kind of write."""
+    db = create_test_database()
+    cache = QueryCache(db, max_entries=4)
+    reading = HabitTracker("Reading", "Read for 30 minutes", "Daily")
+    reading.save_to_database(db)
+    today = date.today()
+    reading.log_progress_many(db, [datetime.combine(today - timedelta(days=day), datetime.min.time())
+                                   for day in (0, 1, 2)])
+
+    assert cache.longest_streak("Reading") == cache.longest_streak("Reading") == 3
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.current_streak("Reading") == 3 and cache.habits_by_periodicity("Daily") == ["Reading"]
+    assert cache.longest_streak("Unknown") == 0 and len(cache) == 3  # Unknown habits are not cached
+
+    reading.log_progress(db, datetime.combine(today - timedelta(days=3), datetime.min.time()))
+    assert cache.longest_streak("Reading") == compute_longest_streak(db, "Reading") == 4
+    cache.habits_by_periodicity("Daily").append("Mutated")  # Callers get copies
+    assert cache.habits_by_periodicity("Daily") == ["Reading"]
+
+    cleaning = HabitTracker("Cleaning", "Clean the flat", "Weekly")
+    cleaning.save_to_database(db)
+    assert cache.habits_by_periodicity("Weekly") == ["Cleaning"]
+    assert cache.longest_streaks() == {"Reading": 4, "Cleaning": 0}
+    reading.clear_progress(db)
+    assert cache.longest_streak("Reading") == 0 and cache.longest_streaks() == {"Reading": 0, "Cleaning": 0}
+
+    reading.delete_from_database(db)
+    assert cache.habits_by_periodicity("Daily") == [] and cache.longest_streak("Reading") == 0
+    renewed = HabitTracker("Reading", "Read again", "Daily")
+    renewed.save_to_database(db)
+    renewed.log_progress(db)
+    assert cache.longest_streak("Reading") == 1  # The name now belongs to a new habit id
+
+    stats = cache.stats()
+    assert len(cache) <= 4 and stats['evictions'] > 0 and stats['entries'] == len(cache)
+    assert stats['hit_rate'] == stats['hits'] / (stats['hits'] + stats['misses'])
+
+    # Writes bypassing HabitTracker are not seen until the cache is cleared
+    assert cache.habits_by_periodicity("Weekly") == ["Cleaning"]
+    db.execute("DELETE FROM habits WHERE name = 'Cleaning'")
+    db.commit()
+    assert cache.habits_by_periodicity("Weekly") == ["Cleaning"]
+    listed = io.StringIO()
+    with redirect_stdout(listed):  # The menu's listing by periodicity is answered by the cache too
+        list_habits(db, "Weekly", interactive=False, cache=cache)
+    assert listed.getvalue() == "Cleaning\n"
+    cache.clear()
+    assert cache.habits_by_periodicity("Weekly") == [] and len(cache) == 1
+    cache.close()
+
+
+def test_bulk_deletes_and_retention():
+    """Tests cascading bulk deletes and resets, and that pruning keeps streaks and rollups in line with the log."""
+    dependents = "SELECT (SELECT COUNT(*) FROM progress_log WHERE habit_id = ?), " \
+                 "(SELECT COUNT(*) FROM habit_streaks WHERE habit_id = ?), " \
+                 "(SELECT COUNT(*) FROM daily_rollups WHERE habit_id = ?), " \
+                 "(SELECT COUNT(*) FROM weekly_rollups WHERE habit_id = ?)"
+    rollups = "SELECT 'day', * FROM daily_rollups UNION ALL SELECT 'week', * FROM weekly_rollups " \
+              "UNION ALL SELECT 'days', NULL, * FROM daily_totals ORDER BY 1, 2, 3"
+    with tempfile.TemporaryDirectory() as directory:
+        # Deletes cascade on connections enforcing foreign keys and are done by hand on the others
+        for db in (initialize_database(os.path.join(directory, 'habits.db')), create_test_database()):
+            generate_dataset(db, 4, 30, seed=3)
+            catalog = HabitCatalog(db)
+            assert delete_habits_bulk(db, [1, 3, 3, 99]) == 2
+            assert [db.execute(dependents, (habit_id,) * 4).fetchone() for habit_id in (1, 3)] == [(0, 0, 0, 0)] * 2
+            assert catalog.get("Habit 1") is None and fetch_all_habit_names(db) == ["Habit 2", "Habit 4"]
+            assert clear_progress_bulk(db, [2, 4]) > 0
+            assert [db.execute(dependents, (habit_id,) * 4).fetchone() for habit_id in (2, 4)] == [(0, 1, 0, 0)] * 2
+            assert compute_longest_streaks(db) == {"Habit 2": 0, "Habit 4": 0}
+            catalog.close()
+            db.close()
+
+        # Migrating adds the cascades and drops completions of habits that are already gone
+        db = create_legacy_database()
+        db.execute("INSERT INTO habits (name, description, periodicity, creation_date) "
+                   "VALUES ('Tea', '', 'Daily', '2024-01-01 08:00:00')")
+        db.executemany("INSERT INTO progress_log (habit_id, tracked_at) VALUES (?, ?)",
+                       [(1, "2024-01-01 09:00:00"), (7, "2024-01-01 09:00:00")])
+        db.commit()
+        migrate_database(db)
+        assert db.execute("SELECT habit_id FROM progress_log").fetchall() == [(1,)]
+        # The rollups are cleared by the deleting code, which has to adjust the totals anyway
+        tables = ("progress_log", "habit_streaks", "daily_rollups", "weekly_rollups")
+        assert [bool(db.execute(f"PRAGMA foreign_key_list({table})").fetchall()) for table in tables] == \
+               [True, True, False, False]
+        db.execute("PRAGMA foreign_keys = ON")
+        db.execute("DELETE FROM habits")
+        assert db.execute("SELECT COUNT(*) FROM progress_log").fetchone() == (0,)
+
+        # Pruning in small chunks with an archive: the archive holds exactly what was pruned
+        path = os.path.join(directory, 'retention.db')
+        db = initialize_database(path)
+        total = generate_dataset(db, 5, 200, seed=4)
+        before = datetime(2020, 4, 1, 12)
+        old = "SELECT name, tracked_at FROM progress_log JOIN habits ON habits.id = habit_id WHERE tracked_at < ? " \
+              "ORDER BY 1, 2"
+        expected_archive = db.execute(old, (str(before),)).fetchall()
+        events = []
+        listener = lambda db, event, habit_ids, tracker: events.append(event)
+        add_write_listener(listener)
+        archive = os.path.join(directory, 'archive')
+        assert prune_progress(db, before, archive, chunk_size=7) == len(expected_archive)
+        remove_write_listener(listener)
+        assert len(events) > len(expected_archive) // 7 and set(events) == {'cleared'}
+        assert db.execute("SELECT COUNT(*) FROM progress_log").fetchone()[0] == total - len(expected_archive)
+        assert db.execute("SELECT MIN(tracked_at) FROM progress_log").fetchone()[0] >= str(before)
+        assert prune_progress(db, before) == 0
+        incremental = db.execute(rollups).fetchall()
+        rebuild_rollups(db)
+        assert db.execute(rollups).fetchall() == incremental
+        stored = db.execute("SELECT habit_id, current_streak, longest_streak, last_period FROM habit_streaks")
+        assert scan_all_streak_states(db.cursor()) == {row[0]: StreakState(*row[1:]) for row in stored}
+        restored = initialize_database(':memory:')
+        assert import_dataset(restored, archive) == TransferCounts(5, len(expected_archive), 0)
+        assert restored.execute(old, (str(before),)).fetchall() == expected_archive
+
+        # A run stopped between two chunks of one habit leaves the stored streaks matching the log
+        stopped = create_test_database()
+        early = HabitTracker("Early", "A long run before the cutoff", "Daily")
+        early.save_to_database(stopped)
+        early.log_progress_many(stopped, [datetime(2020, 1, 1, 8) + timedelta(days=day) for day in range(30)] +
+                                [datetime(2020, 6, 1, 8) + timedelta(days=day) for day in range(5)])
+
+        def stop(db, event, habit_ids, tracker):
+            raise RuntimeError("stopped")
+
+        add_write_listener(stop)
+        try:
+            prune_progress(stopped, before, chunk_size=10)
+            assert False, "the listener should have stopped the run"
+        except RuntimeError:
+            pass
+        finally:
+            remove_write_listener(stop)
+        assert stopped.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id = 1 AND tracked_at < ?",
+                               (str(before),)).fetchone()[0] == 20
+        assert scan_all_streak_states(stopped.cursor()) == stored_streak_states(stopped)
+        assert compute_longest_streak(stopped, "Early") == 20
+        assert prune_progress(stopped, before, chunk_size=10) == 20
+        assert scan_all_streak_states(stopped.cursor()) == stored_streak_states(stopped)
+
+        # Freed pages go back to the file system
+        assert db.execute("PRAGMA auto_vacuum").fetchone() == (2,)
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(path)
+        assert compact_database(db) > 0 and os.path.getsize(path) < size
+        db.close()
+
+
+def test_unique_periods():
+    """Tests that the opt-in one-completion-per-period mode removes repeats and makes logging idempotent."""
+    db = create_test_database()
+    daily = HabitTracker("Stretch", "Stretch for 5 minutes", "Daily")
+    weekly = HabitTracker("Review", "Weekly review", "Weekly")
+    daily.save_to_database(db)
+    weekly.save_to_database(db)
+    assert daily.log_progress(db, datetime(2024, 3, 4, 9)) and daily.log_progress(db, datetime(2024, 3, 4, 7))
+    log_progress_bulk(db, [(daily.habit_id, datetime(2024, 3, 5, 8))] * 2 +
+                      [(weekly.habit_id, datetime(2024, 3, day, 8)) for day in (4, 6, 11)])
+    db.execute("INSERT INTO progress_log (habit_id, tracked_at) VALUES (?, '2024-03-08 20:00:00')", (weekly.habit_id,))
+    rebuild_rollups(db)  # Plain SQL writes leave the rollups behind
+    streaks = compute_longest_streaks(db)
+    rollups = "SELECT 'day', * FROM daily_rollups UNION ALL SELECT 'week', * FROM weekly_rollups " \
+              "UNION ALL SELECT 'days', NULL, * FROM daily_totals ORDER BY 1, 2, 3"
+    completions = "SELECT habit_id, tracked_at FROM progress_log ORDER BY 1, 2"
+
+    assert not unique_periods_enabled(db.cursor())
+    assert enable_unique_periods(db, chunk_size=2) == 4
+    assert unique_periods_enabled(db.cursor())
+    assert db.execute(completions).fetchall() == [
+        (daily.habit_id, "2024-03-04 07:00:00"), (daily.habit_id, "2024-03-05 08:00:00"),  # The earliest are kept
+        (weekly.habit_id, "2024-03-04 08:00:00"), (weekly.habit_id, "2024-03-11 08:00:00"),
+    ]
+    assert compute_longest_streaks(db) == streaks
+    incremental = db.execute(rollups).fetchall()
+    rebuild_rollups(db)
+    assert db.execute(rollups).fetchall() == incremental
+
+    # Retries change nothing; new periods are still logged
+    events = []
+    listener = lambda db, event, habit_ids, tracker: events.append(event)
+    add_write_listener(listener)
+    assert not daily.log_progress(db, datetime(2024, 3, 5, 21))
+    assert not weekly.log_progress(db, datetime(2024, 3, 9, 8))
+    assert events == []
+    assert log_progress_bulk(db, [(daily.habit_id, datetime(2024, 3, day, 8)) for day in (4, 5, 6, 6)]) == 1
+    assert events == ['logged']
+    remove_write_listener(listener)
+    assert db.execute("SELECT COUNT(*) FROM progress_log").fetchone() == (5,)
+    assert compute_longest_streak(db, "Stretch") == 3
+    incremental = db.execute(rollups).fetchall()
+    rebuild_rollups(db)
+    assert db.execute(rollups).fetchall() == incremental
+    try:
+        db.execute("INSERT INTO progress_log (habit_id, tracked_at) VALUES (?, '2024-03-06 22:00:00')",
+                   (daily.habit_id,))
+        assert False, "Other writers must not add a second completion to a period either"
+    except sqlite3.IntegrityError:
+        db.rollback()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = create_test_database()
+        HabitTracker("Stretch", "", "Daily").save_to_database(source)
+        log_progress_bulk(source, [(1, datetime(2024, 3, 6, 6)), (1, datetime(2024, 3, 7, 6))])
+        export_dataset(source, directory)
+        assert import_dataset(db, directory) == TransferCounts(0, 1, 2)
+
+    # The dataset generators keep the first completion of each period too
+    rows = generate_dataset(db, 4, 60, seed=6)
+    assert rows == db.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id > ?", (weekly.habit_id,)).fetchone()[0]
+    assert preload_database(db) > 0 and unique_periods_enabled(db.cursor())
+    repeats = "SELECT COUNT(*) FROM (SELECT 1 FROM progress_log GROUP BY habit_id, period_key HAVING COUNT(*) > 1)"
+    assert db.execute(repeats).fetchone() == (0,)
+    assert db.execute(f"SELECT COUNT(*) FROM progress_log JOIN habits ON habits.id = habit_id "
+                      f"WHERE period_key != {period_sql('day_ordinal')}").fetchone() == (0,)
+    assert db.execute("SELECT COUNT(*) FROM progress_log WHERE habit_id = ?", (weekly.habit_id + 2,)).fetchone()[0] <= 9
+    assert scan_all_streak_states(db.cursor()) == stored_streak_states(db)
+
+    disable_unique_periods(db)
+    assert daily.log_progress(db, datetime(2024, 3, 7, 22))
+
+
+def test_analytics_snapshot():
+    """Tests that the snapshot answers like the SQL queries, follows writes and is reopened from its mapped file."""
+    today = date(2024, 6, 30)
+
+    def check(snapshot):
+        names = fetch_all_habit_names(db)
+        assert sorted(snapshot.habit_names()) == names  # The SQL listing follows the name index
+        assert snapshot.longest_streaks() == compute_longest_streaks(db)
+        assert snapshot.longest_streak_overall() == compute_longest_streak_overall(db)
+        for name in names:
+            assert snapshot.longest_streak(name) == compute_longest_streak(db, name)
+            assert snapshot.current_streak(name, today) == compute_current_streak(db, name, today)
+        for periodicity in ("Daily", "Weekly"):
+            assert sorted(snapshot.habits_by_periodicity(periodicity)) == sorted(fetch_habits_by_periodicity(db,
+                                                                                                     periodicity))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.db')
+        db = initialize_database(path)
+        generate_dataset(db, 12, 60, seed=3, start=datetime(2024, 5, 1, 6))
+
+        snapshot = AnalyticsSnapshot.open(db)  # No file yet, so it is read from the database and saved
+        assert snapshot.path == path + '.snapshot' and os.path.exists(snapshot.path)
+        check(snapshot)
+        snapshot.close()
+
+        snapshot = AnalyticsSnapshot.open(db)
+        assert snapshot._mapping is not None and not snapshot.changed
+        check(snapshot)
+        assert snapshot.longest_streak("Unknown") == snapshot.current_streak("Unknown") == 0
+        assert "Unknown" not in snapshot and "Habit 1" in snapshot
+
+        streaking = HabitTracker("Streaking", "Keep going", "Daily")
+        streaking.save_to_database(db)
+        streaking.log_progress_many(db, [datetime(2024, 6, day, 7) for day in (28, 29, 29, 30)])
+        assert snapshot.completion_days("Streaking") == array('I', [date(2024, 6, day).toordinal()
+                                                                    for day in (28, 29, 30)])
+        assert snapshot.current_streak("Streaking", today) == 3
+        get_habit_tracker(db, "Habit 1").log_progress(db, datetime(2024, 6, 30, 7))
+        get_habit_tracker(db, "Habit 2").delete_from_database(db)
+        get_habit_tracker(db, "Habit 3").clear_progress(db)
+        check(snapshot)
+
+        assert snapshot.changed
+        snapshot.save()
+        snapshot.close()
+        snapshot = AnalyticsSnapshot.open(db)
+        assert snapshot._mapping is not None
+        check(snapshot)
+        snapshot.close()
+
+        # Writes the snapshot could not follow are caught up on open, re-reading only the habits they touched
+        other = initialize_database(path)
+        elsewhere = HabitTracker("Elsewhere", "Logged by another connection", "Weekly")
+        elsewhere.save_to_database(other)
+        elsewhere.log_progress(other, datetime(2024, 6, 29, 7))
+        get_habit_tracker(other, "Habit 4").clear_progress(other)
+        get_habit_tracker(other, "Habit 5").delete_from_database(other)
+        other.close()
+        snapshot = AnalyticsSnapshot.open(db)
+        assert snapshot._mapping is not None and "Elsewhere" in snapshot and "Habit 5" not in snapshot
+        check(snapshot)
+        snapshot.close()
+        snapshot = AnalyticsSnapshot.open(db)  # The caught-up file was saved again
+        assert snapshot._fingerprint == database_fingerprint(db.cursor()) and not snapshot.catch_up()
+        check(snapshot)
+        snapshot.close()
+        db.close()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            assert cli(['--database', path, '--snapshot', 'streak', 'Streaking']) == 0
+        assert output.getvalue().startswith("Current streak: ") and output.getvalue().endswith("Longest streak: 3\n")
+        for periodicity in ([], ['--periodicity', 'Weekly']):
+            listed = io.StringIO()
+            with redirect_stdout(listed):
+                assert cli(['--database', path, '--snapshot', 'list', *periodicity]) == 0
+            expected = io.StringIO()
+            with redirect_stdout(expected):
+                assert cli(['--database', path, 'list', *periodicity]) == 0
+            assert listed.getvalue() == expected.getvalue() and "Elsewhere" in listed.getvalue()
+
 
 if __name__ == "__main__":
     test_habit_creation()
@@ -160,4 +1440,32 @@ if __name__ == "__main__":
     test_get_habits()
     test_habits_by_periodicity()
     test_get_habit_tracker()
+    test_bulk_progress_logging()
+    test_bulk_progress_logging_multiple_habits()
+    test_bulk_progress_logging_is_atomic()
+    test_migration_upgrades_legacy_database()
+    test_hot_queries_avoid_full_scans()
+    test_longest_streaks_for_all_habits()
+    test_streak_table_matches_raw_logs()
+    test_current_streak()
+    test_weekly_streaks()
+    test_vectorized_analytics()
+    test_connection_manager()
+    test_habit_catalog()
+    test_compact_habit_objects()
+    test_integer_progress_storage()
+    test_streaming_readers_use_constant_memory()
+    test_synthetic_dataset()
+    test_query_profiler()
+    test_background_writer()
+    test_parallel_streak_statistics()
+    test_range_queries_use_indexes()
+    test_rollups_match_raw_logs()
+    test_command_line()
+    test_export_import_round_trip()
+    test_http_service()
+    test_query_cache()
+    test_bulk_deletes_and_retention()
+    test_unique_periods()
+    test_analytics_snapshot()
     print("All tests passed!")
\ No newline at end of file
@@ -0,0 +1,341 @@
+"""
+Streaming export and import of habits and their completions.
+
+A dataset is a directory with one file per table, habits.<ext> and completions.<ext>, in one of
+three formats:
+
+    ndjson   one JSON object per line
+    csv      with a header row
+    parquet  columnar; requires the optional pyarrow package
+
+Exports read the database in chunks and write through buffered files; imports insert in bulk
+within one transaction. Either way only one chunk of rows is held in memory. Habits are matched
+by name, so a dataset can be imported into a database that already has some of its habits, and
+completions that already exist are skipped rather than logged twice:
+
+    python transfer.py export backup --format csv
+    python transfer.py import backup
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import islice
+from operator import itemgetter
+
+from counter import TIMESTAMP_FORMAT, HabitTracker, notify_write_listeners
+from db import iter_completion_log
+from rollups import record_rollups
+from storage import INTEGER_COLUMNS, iter_rows, progress_columns
+from streaks import period_sql, record_completion_batch
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet is unavailable; NDJSON and CSV still work
+    pa = pq = None
+
+FORMATS = ('ndjson', 'csv', 'parquet')
+HABIT_FIELDS = ('name', 'description', 'periodicity', 'creation_date')
+COMPLETION_FIELDS = ('habit', 'tracked_at')
+DEFAULT_CHUNK_SIZE = 10_000  # Rows per fetch, write and insert
+FILE_BUFFER = 1 << 20        # Bytes buffered per file
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+TransferCounts = namedtuple('TransferCounts', ['habits', 'completions', 'duplicates'])
+TransferCounts.__doc__ = """The number of rows an export wrote or an import added.
+
+Attributes:
+    habits (int): Habits written, or imported as new habits.
+    completions (int): Completions written, or imported.
+    duplicates (int): Habits and completions skipped by an import because they already existed.
+"""
+
+
+def _chunks(rows, size):
+    """Yields lists of up to size rows from an iterable."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _path(directory, table, file_format):
+    return os.path.join(directory, f'{table}.{file_format}')
+
+
+def _require_format(file_format):
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format '{file_format}'. Choose one of: {', '.join(FORMATS)}.")
+    if file_format == 'parquet' and pa is None:
+        raise ImportError("The parquet format requires pyarrow (pip install pyarrow).")
+
+
+def _write_ndjson(path, fields, rows, chunk_size, mode='w'):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    # The keys are the same on every line, so only the values are encoded per row
+    line = '{' + ','.join(f'{encode(field)}:%s' for field in fields) + '}\n'
+    count = 0
+    with open(path, mode, encoding='utf-8', buffering=FILE_BUFFER) as file:
+        for chunk in _chunks(rows, chunk_size):
+            file.writelines([line % tuple(map(encode, row)) for row in chunk])
+            count += len(chunk)
+    return count
+
+
+def _write_csv(path, fields, rows, chunk_size):
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='', buffering=FILE_BUFFER) as file:
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for chunk in _chunks(rows, chunk_size):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def _write_parquet(path, fields, rows, chunk_size):
+    schema = pa.schema([(field, pa.string()) for field in fields])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(rows, chunk_size):
+            columns = zip(*chunk)
+            writer.write_table(pa.Table.from_arrays([pa.array(column, pa.string()) for column in columns],
+                                                    schema=schema))
+            count += len(chunk)
+    return count
+
+
+def _read_ndjson(path, fields, chunk_size):
+    pick = itemgetter(*fields)
+    with open(path, encoding='utf-8', buffering=FILE_BUFFER) as file:
+        for line in file:
+            if line.strip():
+                yield pick(json.loads(line))
+
+
+def _read_csv(path, fields, chunk_size):
+    with open(path, encoding='utf-8', newline='', buffering=FILE_BUFFER) as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None or not set(fields) <= set(header):
+            raise ValueError(f"{path} must have the columns {', '.join(fields)}.")
+        pick = itemgetter(*(header.index(field) for field in fields))
+        for row in reader:
+            yield pick(row)
+
+
+def _read_parquet(path, fields, chunk_size):
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=list(fields)):
+        yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+WRITERS = {'ndjson': _write_ndjson, 'csv': _write_csv, 'parquet': _write_parquet}
+READERS = {'ndjson': _read_ndjson, 'csv': _read_csv, 'parquet': _read_parquet}
+
+
+def export_dataset(db, directory, file_format='ndjson', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes every habit and completion to habits.<format> and completions.<format> in a directory.
+
+    Args:
+        db: The database connection object.
+        directory: The directory to write to. It is created if needed; existing files are replaced.
+        file_format: (Optional) 'ndjson', 'csv' or 'parquet'.
+        chunk_size: (Optional) The number of rows fetched and written at a time.
+
+    Returns:
+        TransferCounts: The number of habits and completions written.
+
+    Raises:
+        ValueError: If the format is unknown.
+        ImportError: If the format is parquet and pyarrow is not installed.
+    """
+    _require_format(file_format)
+    os.makedirs(directory, exist_ok=True)
+    write = WRITERS[file_format]
+
+    cursor = db.cursor()
+    cursor.execute('SELECT name, description, periodicity, creation_date FROM habits ORDER BY id')
+    habits = write(_path(directory, 'habits', file_format), HABIT_FIELDS, iter_rows(cursor, chunk_size), chunk_size)
+    completions = write(
+        _path(directory, 'completions', file_format),
+        COMPLETION_FIELDS,
+        ((name, tracked_at) for name, _, tracked_at in iter_completion_log(db, chunk_size)),
+        chunk_size,
+    )
+    return TransferCounts(habits, completions, 0)
+
+
+def append_to_dataset(directory, habits=(), completions=(), chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Appends rows to an NDJSON dataset, creating it if needed, e.g. to archive rows before deleting them.
+
+    Rows that end up in the dataset twice are harmless: importing it skips habits and
+    completions that already exist.
+
+    Args:
+        directory: The dataset directory.
+        habits: (Optional) (name, description, periodicity, creation_date) rows.
+        completions: (Optional) (habit name, tracked_at) rows.
+        chunk_size: (Optional) The number of rows written at a time.
+
+    Returns:
+        TransferCounts: The number of habits and completions written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return TransferCounts(
+        _write_ndjson(_path(directory, 'habits', 'ndjson'), HABIT_FIELDS, habits, chunk_size, 'a'),
+        _write_ndjson(_path(directory, 'completions', 'ndjson'), COMPLETION_FIELDS, completions, chunk_size, 'a'),
+        0,
+    )
+
+
+def detect_format(directory):
+    """Returns the format of the dataset in a directory, judged by which habits file it contains."""
+    for file_format in FORMATS:
+        if os.path.exists(_path(directory, 'habits', file_format)):
+            return file_format
+    raise FileNotFoundError(f"No habits file ({', '.join(f'habits.{ext}' for ext in FORMATS)}) in {directory}.")
+
+
+def _import_habits(cursor, rows, chunk_size):
+    """Inserts the habits whose names are not taken yet. Returns the new habits and the number skipped."""
+    first_new_id = cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM habits').fetchone()[0]
+    skipped = 0
+    for chunk in _chunks(rows, chunk_size):
+        cursor.executemany(
+            'INSERT INTO habits (name, description, periodicity, creation_date) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (name) DO NOTHING',
+            chunk,
+        )
+        skipped += len(chunk) - cursor.rowcount
+    cursor.execute('SELECT id, name, description, periodicity, creation_date FROM habits WHERE id >= ?',
+                   (first_new_id,))
+    return [HabitTracker.from_row(row) for row in cursor.fetchall()], skipped
+
+
+def _progress_row(habit_id, tracked_at):
+    """Like storage.progress_row, but for a timestamp that is usually already in the stored text format."""
+    moment = datetime.fromisoformat(tracked_at)
+    if len(tracked_at) != 19 or tracked_at[10] != ' ':  # Not "%Y-%m-%d %H:%M:%S", e.g. ISO with a "T"
+        tracked_at = moment.strftime(TIMESTAMP_FORMAT)
+    day = moment.toordinal()
+    epoch = (day - EPOCH_ORDINAL) * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+    return habit_id, tracked_at, epoch, day
+
+
+def _import_completions(cursor, rows, chunk_size):
+    """Inserts the completions that are not stored yet. Returns the ids of the habits affected and both counts."""
+    habit_ids = dict((name, habit_id) for habit_id, name in cursor.execute('SELECT id, name FROM habits'))
+    if progress_columns(cursor) is INTEGER_COLUMNS:
+        same = 'stored.day_ordinal = staged.day_ordinal AND stored.tracked_epoch = staged.tracked_epoch'
+    else:  # Not fully converted yet: compare the text column, which every row has
+        same = 'stored.tracked_at = staged.tracked_at'
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_progress (
+            habit_id INTEGER, tracked_at TEXT, tracked_epoch INTEGER, day_ordinal INTEGER
+        )
+    ''')
+    affected, imported, skipped = set(), 0, 0
+    for chunk in _chunks(rows, chunk_size):
+        try:
+            staged = [_progress_row(habit_ids[name], tracked_at) for name, tracked_at in chunk]
+        except KeyError as error:
+            raise ValueError(f"Completion of unknown habit {error.args[0]!r}.") from None
+        cursor.executemany('INSERT INTO temp.import_progress VALUES (?, ?, ?, ?)', staged)
+        # DISTINCT drops repeats within the chunk; NOT EXISTS those already stored, including earlier chunks
+        # and ON CONFLICT those in periods already completed, if the database keeps one per period
+        cursor.execute(f'''
+            INSERT INTO progress_log (habit_id, tracked_at, tracked_epoch, day_ordinal, period_key)
+            SELECT DISTINCT staged.habit_id, staged.tracked_at, staged.tracked_epoch, staged.day_ordinal,
+                   {period_sql('staged.day_ordinal')}
+            FROM temp.import_progress AS staged
+            INNER JOIN habits ON habits.id = staged.habit_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM progress_log AS stored WHERE stored.habit_id = staged.habit_id AND {same}
+            )
+            ON CONFLICT DO NOTHING
+            RETURNING habit_id, day_ordinal
+        ''')
+        inserted = cursor.fetchall()
+        cursor.execute('DELETE FROM temp.import_progress')
+        if inserted:
+            record_completion_batch(cursor, [(habit_id, date.fromordinal(day)) for habit_id, day in inserted])
+            record_rollups(cursor, inserted)
+            affected.update(habit_id for habit_id, _ in inserted)
+        imported += len(inserted)
+        skipped += len(chunk) - len(inserted)
+    cursor.execute('DROP TABLE temp.import_progress')
+    return affected, imported, skipped
+
+
+def import_dataset(db, directory, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Adds the habits and completions of a dataset written by export_dataset to the database.
+
+    Habits whose name already exists keep their stored description and periodicity. Completions
+    already stored for the same habit and time, or repeated in the dataset, are skipped, and so
+    are completions in periods already completed if the database keeps one per period (see
+    dedup.py). Either the whole dataset is imported or, if anything fails, nothing is.
+
+    Args:
+        db: The database connection object.
+        directory: The directory containing habits.<format> and completions.<format>.
+        file_format: (Optional) 'ndjson', 'csv' or 'parquet'. Detected from the files by default.
+        chunk_size: (Optional) The number of rows read and inserted at a time.
+
+    Returns:
+        TransferCounts: The number of habits and completions added, and of duplicates skipped.
+
+    Raises:
+        ValueError: If the format is unknown or a completion names a habit that does not exist.
+        FileNotFoundError: If the directory contains no dataset.
+        ImportError: If the format is parquet and pyarrow is not installed.
+    """
+    file_format = file_format or detect_format(directory)
+    _require_format(file_format)
+    read = READERS[file_format]
+
+    cursor = db.cursor()
+    try:
+        new_habits, skipped_habits = _import_habits(
+            cursor, read(_path(directory, 'habits', file_format), HABIT_FIELDS, chunk_size), chunk_size
+        )
+        completions_path = _path(directory, 'completions', file_format)
+        affected, completions, skipped_completions = _import_completions(
+            cursor, read(completions_path, COMPLETION_FIELDS, chunk_size) if os.path.exists(completions_path) else (),
+            chunk_size,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for tracker in new_habits:
+        notify_write_listeners(db, 'saved', {tracker.habit_id}, tracker)
+    if affected:
+        notify_write_listeners(db, 'logged', affected)
+    return TransferCounts(len(new_habits), completions, skipped_habits + skipped_completions)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import DATABASE_PATH, initialize_database
+
+    parser = argparse.ArgumentParser(description="Exports or imports habits and completions.")
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('directory', help='the dataset directory')
+    parser.add_argument('--format', choices=FORMATS, help='file format (export default: ndjson; import: detected)')
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file (default: %(default)s)')
+    args = parser.parse_args()
+
+    db = initialize_database(args.database)
+    if args.action == 'export':
+        counts = export_dataset(db, args.directory, args.format or 'ndjson')
+        print(f"Exported {counts.habits} habits and {counts.completions} completions to {args.directory}.")
+    else:
+        counts = import_dataset(db, args.directory, args.format)
+        print(f"Imported {counts.habits} habits and {counts.completions} completions "
+              f"({counts.duplicates} duplicates skipped).")
+    db.close()
@@ -0,0 +1,252 @@
+"""
+Background ingestion of completion events.
+
+Producers (API hooks, device syncs, ...) hand completions to a BackgroundWriter, which returns as
+soon as the event is queued. A dedicated thread drains the queue and writes whatever has piled up
+in one transaction, so the cost of a commit is shared by every event that arrived meanwhile.
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from counter import log_progress_bulk
+from streaks import fetch_periodicities
+
+_STOP = object()  # Queued by close() behind the last event
+FAILED_RANGES_KEPT = 1000  # Failures remembered for wait_for beyond those someone is waiting on
+
+
+class BackgroundWriter:
+    """Queues completion events and commits them in batches on a dedicated writer thread.
+
+    The queue is bounded: when max_pending events are waiting, submit blocks (or fails after its
+    timeout) until the writer has caught up, so producers cannot outrun the database indefinitely.
+    Every event gets a sequence number; flush and wait_for block until events are committed.
+
+    Attributes:
+        manager (ConnectionManager): Provides the writer connection; its lock is held for each batch.
+        batch_size (int): The maximum number of events committed in one transaction.
+        committed (int): The number of events written so far.
+        batches (int): The number of transactions used for them.
+        failed (int): The number of events lost because they failed to commit.
+        error (Exception): The exception of the last failed write, or None.
+
+    Methods:
+        submit(habit_id, tracked_at, timeout): Queues one completion and returns its sequence number.
+        wait_for(sequence, timeout): Waits until the event with that sequence number is committed.
+        flush(timeout): Waits until every event submitted so far is committed.
+        aflush(): Awaitable version of flush for asyncio code.
+        pending(): Returns the number of queued events.
+        close(): Writes the remaining events and stops the writer thread.
+    """
+
+    def __init__(self, manager, max_pending: int = 10_000, batch_size: int = 1000) -> None:
+        """
+        Starts the writer thread.
+
+        Args:
+            manager: The ConnectionManager of the database to write to.
+            max_pending: (Optional) The number of queued events at which submit starts to block.
+            batch_size: (Optional) The maximum number of events per transaction.
+        """
+        if max_pending < 1 or batch_size < 1:
+            raise ValueError("max_pending and batch_size must be positive integers.")
+        self.manager = manager
+        self.batch_size = batch_size
+        self.committed = 0
+        self.batches = 0
+        self.failed = 0
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._submitted = 0
+        self._submit_lock = threading.Lock()
+        self._durable = 0  # The sequence number up to which every event has been handled
+        self._failed_ranges = []  # (first, last) sequence numbers of failed events, oldest first
+        self._waiting = []  # The sequence numbers wait_for is currently blocked on
+        self._reported_failures = 0  # self.failed as of the last flush
+        self._done = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="habit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, habit_id, tracked_at=None, timeout=None) -> int:
+        """
+        Queues a completion of a habit for writing.
+
+        Args:
+            habit_id: The id of the habit.
+            tracked_at: (Optional) The datetime of the completion. Defaults to now.
+            timeout: (Optional) How long to wait for room in a full queue, in seconds. Waits
+                     indefinitely by default; 0 fails immediately.
+
+        Returns:
+            int: The event's sequence number, for wait_for.
+
+        Raises:
+            queue.Full: If the queue stayed full for the whole timeout.
+            RuntimeError: If the writer has been closed.
+        """
+        tracked_at = tracked_at or datetime.now()
+        if not isinstance(tracked_at, datetime):
+            raise TypeError("tracked_at must be a datetime.")
+        deadline = None if timeout is None else time.monotonic() + timeout  # Covers the lock and the queue
+        # Numbering and queueing happen under one lock, so the queue stays in sequence order
+        if not self._submit_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise queue.Full
+        try:
+            # Checked under the lock close() queues _STOP under, so no event can end up behind it
+            if self._closed:
+                raise RuntimeError("The background writer is closed.")
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self._queue.put((self._submitted + 1, habit_id, tracked_at), timeout=remaining)
+            self._submitted += 1
+            return self._submitted
+        finally:
+            self._submit_lock.release()
+
+    def wait_for(self, sequence, timeout=None) -> bool:
+        """
+        Waits until the event with the given sequence number (and every earlier one) is committed.
+
+        Args:
+            sequence: A sequence number returned by submit.
+            timeout: (Optional) The maximum time to wait, in seconds.
+
+        Returns:
+            bool: True once the event is durable, False if the timeout expired first.
+
+        Raises:
+            RuntimeError: If the event failed to commit.
+        """
+        with self._done:
+            self._waiting.append(sequence)
+            try:
+                if not self._done.wait_for(lambda: self._durable >= sequence, timeout):
+                    return False
+            finally:
+                self._waiting.remove(sequence)
+            if any(first <= sequence <= last for first, last in self._failed_ranges):
+                raise RuntimeError("This completion event failed to commit.") from self.error
+        return True
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until every event submitted before the call is committed.
+
+        Args:
+            timeout: (Optional) The maximum time to wait, in seconds.
+
+        Returns:
+            bool: True once the events are durable, False if the timeout expired first.
+
+        Raises:
+            RuntimeError: If any batch failed to commit since the previous flush.
+        """
+        target = self._submitted
+        with self._done:
+            if not self._done.wait_for(lambda: self._durable >= target, timeout):
+                return False
+            lost, self._reported_failures = self.failed - self._reported_failures, self.failed
+        if lost:
+            raise RuntimeError(f"{lost} completion events failed to commit.") from self.error
+        return True
+
+    async def aflush(self) -> bool:
+        """Awaits flush() without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def pending(self) -> int:
+        """Returns the number of events waiting in the queue."""
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            stop = event is _STOP
+            batch = [] if stop else [event]
+            # Coalesce everything that queued up while the previous batch was being committed
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                else:
+                    batch.append(event)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _commit(self, events) -> None:
+        with self.manager.writer() as db:
+            log_progress_bulk(db, ((habit_id, tracked_at) for _, habit_id, tracked_at in events))
+
+    def _write(self, batch) -> None:
+        failed, error = [], None
+        try:
+            self._commit(batch)
+        except sqlite3.IntegrityError as batch_error:
+            # Most likely an unknown habit id: write the events of the known habits on their own,
+            # so one bad event does not take down everything coalesced with it
+            with self.manager.writer() as db:
+                known = fetch_periodicities(db.cursor(), {habit_id for _, habit_id, _ in batch})
+            failed = [event for event in batch if event[1] not in known]
+            written = [event for event in batch if event[1] in known]
+            error = batch_error
+            if failed and written:
+                try:
+                    self._commit(written)
+                except Exception as retry_error:
+                    failed, error = batch, retry_error
+            else:
+                failed = batch
+        except Exception as batch_error:  # log_progress_bulk has rolled back; report it to the waiters
+            failed, error = batch, batch_error
+        with self._done:
+            if failed:
+                self.error = error
+                self.failed += len(failed)
+                self._record_failures(event[0] for event in failed)
+            if len(failed) < len(batch):
+                self.committed += len(batch) - len(failed)
+                self.batches += 1
+            self._durable = batch[-1][0]
+            self._done.notify_all()
+
+    def _record_failures(self, sequences) -> None:
+        """Adds failed sequence numbers to _failed_ranges and forgets the oldest ones nobody waits on. Holds _done."""
+        ranges = self._failed_ranges
+        for sequence in sequences:
+            if ranges and ranges[-1][1] == sequence - 1:
+                ranges[-1] = (ranges[-1][0], sequence)
+            else:
+                ranges.append((sequence, sequence))
+        excess = len(ranges) - FAILED_RANGES_KEPT
+        if excess > 0:
+            lowest = min(self._waiting, default=ranges[-1][1] + 1)
+            keep = next((i for i, (_, last) in enumerate(ranges) if last >= lowest), len(ranges))
+            del ranges[:min(excess, keep)]
+
+    def close(self, timeout=None) -> None:
+        """
+        Stops accepting events, writes the queued ones and stops the writer thread.
+
+        Args:
+            timeout: (Optional) The maximum time to wait for the thread, in seconds.
+        """
+        if not self._closed:
+            self._closed = True
+            with self._submit_lock:
+                self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()